@@ -8,7 +8,7 @@ from urllib.parse import urlparse
 from cv2 import cvtColor, COLOR_BGR2RGB
 
 # Qt imports
-from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal, QSize, QThread, QMutex
+from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal, QSize, QThread, QMutex, QTimer
 from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.QtWidgets import (
     QMainWindow,
@@ -41,6 +41,15 @@ import threading
 from modules.SettingsDialog import SettingsDialog
 from modules.ConnectionDialog import ConnectionDialog
 from modules.DetectionManager import DetectionManager
+from modules.Detector import loadProfile
+from modules.CalibrationEngine import (
+    CalibrationEngine,
+    cacheKey,
+    expectedPosition,
+    withinView,
+    loadCalibration,
+    saveCalibration,
+)
 from modules.PrinterManager import PrinterManager
 from modules.StatusTipFilter import StatusTipFilter
 
@@ -65,6 +74,8 @@ class App(QMainWindow):
     toggleNozzleAutoDetectionSignal = pyqtSignal(bool)
     # UV coordinates update signal
     getUVCoordinatesSignal = pyqtSignal()
+    # measurement at the current position, position and detection together
+    measureDetectionSignal = pyqtSignal(object)
     # Master detection enable/disable signal
     toggleDetectionSignal = pyqtSignal(bool)
 
@@ -73,14 +84,19 @@ class App(QMainWindow):
     disconnectSignal = pyqtSignal(object)
     moveRelativeSignal = pyqtSignal(object)
     moveAbsoluteSignal = pyqtSignal(object)
+    jogSignal = pyqtSignal(object)
     callToolSignal = pyqtSignal(int)
     unloadToolSignal = pyqtSignal()
     pollCoordinatesSignal = pyqtSignal()
+    verifyCoordinatesSignal = pyqtSignal()
+    measureSignal = pyqtSignal(object)
     pollCurrentToolSignal = pyqtSignal()
     setOffsetsSignal = pyqtSignal(object)
     limitAxesSignal = pyqtSignal()
     flushBufferSignal = pyqtSignal()
     saveToFirmwareSignal = pyqtSignal()
+    beginOffsetsTransactionSignal = pyqtSignal(object)
+    abortOffsetsTransactionSignal = pyqtSignal()
     announceSignal = pyqtSignal(bool)
     # Settings Dialog
     resetImageSignal = pyqtSignal()
@@ -91,6 +107,12 @@ class App(QMainWindow):
     __maxRetries = 3
     # Maximum runtime (in seconds) for calibration cycles
     __maxRuntime = 120
+    # Minimum detection confidence accepted without re-sampling
+    __minDetectionConfidence = 0.5
+    # Maximum number of re-samples for a weak detection before accepting it
+    __maxResamples = 2
+    # Delay (in milliseconds) before re-sampling a detection, roughly one camera frame
+    __resampleDelay = 50
     # Timeout for Qthread termination (DetectionManager and PrinterManager)
     __detectionManagerThreadWaitTime = 20
     __printerManagerThreadWaitTime = 60
@@ -139,13 +161,27 @@ class App(QMainWindow):
             self.state = 0
             # Camera transform matrix
             self.transformMatrix = None
-            self.transform_input = None
+            self.transform_residual = None
             self.mpp = None
+            # calibration engine for the running cycle, and its queued moves
+            self.calibrationEngine = None
+            self.__calibrationCommands = []
+            # camera transform loaded from the calibration cache, not yet validated
+            self.__validateTransform = False
+            # offsets each tool was last aligned with, to predict its first position
+            self.__lastToolOffsets = {}
+            # next tool of the run, already queued in the Printer Manager
+            self.__queuedTool = None
             # Nozzle detection
             self.__stateAutoNozzleAlignment = False
             self.__stateOverrideManualNozzleAlignment = False
             self.singleToolOffsetsCapture = False
             self.__displayCrosshair = False
+            # Latest detection result (UV + quality metrics) and time of last completed move
+            self.__detection = None
+            self.__lastMoveTime = 0
+            # measurement hop durations for the running alignment: hop -> [total, count]
+            self.__measurementHops = {}
 
         ####  setup window properties
         if True:
@@ -400,6 +436,53 @@ class App(QMainWindow):
             self._videoSrc = self.__activeCamera["video_src"]
             if len(str(self._videoSrc)) == 1 or str(self._videoSrc) == "-1":
                 self._videoSrc = int(self._videoSrc)
+            # optional named detector profile for this camera (see TAMV_sweep.py)
+            self._detectorProfile = None
+            try:
+                profileName = self.__activeCamera["detector_profile"]
+            except KeyError:
+                profileName = None
+            if profileName is not None:
+                try:
+                    self._detectorProfile = loadProfile(profileName)
+                    _logger.info("  .. using detector profile: " + str(profileName))
+                except Exception:
+                    _logger.warning(
+                        "Cannot load detector profile "
+                        + str(profileName)
+                        + ", using default detector settings."
+                    )
+            # detection worker processes and preview scale
+            try:
+                self._detectionWorkers = int(self.__activeCamera["detection_workers"])
+            except (KeyError, ValueError):
+                self._detectionWorkers = 1
+            try:
+                self._previewScale = float(self.__activeCamera["preview_scale"])
+            except (KeyError, ValueError):
+                self._previewScale = 0.5
+            try:
+                self._previewLuma = bool(int(self.__activeCamera["preview_luma"]))
+            except (KeyError, ValueError):
+                self._previewLuma = False
+            try:
+                self._previewFPS = float(self.__activeCamera["preview_fps"])
+            except (KeyError, ValueError):
+                self._previewFPS = 12
+            # camera calibration pattern: star, chain or minimal
+            try:
+                self._calibrationPattern = str(
+                    self.__activeCamera["calibration_pattern"]
+                )
+            except KeyError:
+                self._calibrationPattern = None
+            # alignment tolerance in mm, default derived from the detection uncertainty
+            try:
+                self._convergenceTolerance = float(
+                    self.__activeCamera["convergence_tolerance"]
+                )
+            except (KeyError, ValueError):
+                self._convergenceTolerance = None
         # Fetch defined machines
         if True:
             defaultPrinterDefined = False
@@ -896,8 +979,7 @@ class App(QMainWindow):
 
     ########################################################################### Jog Panel functions
     def xleftClicked(self):
-        # disable buttons
-        self.tabPanel.setDisabled(True)
+        # jog panel stays enabled so clicks during a move are merged by the printer manager
         # fetch current increment value
         if self.button_1.isChecked():
             incrementDistance = 1
@@ -909,11 +991,10 @@ class App(QMainWindow):
             "moveSpeed": self.__moveSpeed,
             "position": {"X": str(-1 * incrementDistance)},
         }
-        self.moveRelativeSignal.emit(params)
+        self.jogSignal.emit(params)
 
     def xRightClicked(self):
-        # disable buttons
-        self.tabPanel.setDisabled(True)
+        # jog panel stays enabled so clicks during a move are merged by the printer manager
         # fetch current increment value
         if self.button_1.isChecked():
             incrementDistance = 1
@@ -925,11 +1006,10 @@ class App(QMainWindow):
             "moveSpeed": self.__moveSpeed,
             "position": {"X": str(incrementDistance)},
         }
-        self.moveRelativeSignal.emit(params)
+        self.jogSignal.emit(params)
 
     def yleftClicked(self):
-        # disable buttons
-        self.tabPanel.setDisabled(True)
+        # jog panel stays enabled so clicks during a move are merged by the printer manager
         # fetch current increment value
         if self.button_1.isChecked():
             incrementDistance = 1
@@ -941,11 +1021,10 @@ class App(QMainWindow):
             "moveSpeed": self.__moveSpeed,
             "position": {"Y": str(-1 * incrementDistance)},
         }
-        self.moveRelativeSignal.emit(params)
+        self.jogSignal.emit(params)
 
     def yRightClicked(self):
-        # disable buttons
-        self.tabPanel.setDisabled(True)
+        # jog panel stays enabled so clicks during a move are merged by the printer manager
         # fetch current increment value
         if self.button_1.isChecked():
             incrementDistance = 1
@@ -957,11 +1036,10 @@ class App(QMainWindow):
             "moveSpeed": self.__moveSpeed,
             "position": {"Y": str(incrementDistance)},
         }
-        self.moveRelativeSignal.emit(params)
+        self.jogSignal.emit(params)
 
     def zleftClicked(self):
-        # disable buttons
-        self.tabPanel.setDisabled(True)
+        # jog panel stays enabled so clicks during a move are merged by the printer manager
         # fetch current increment value
         if self.button_1.isChecked():
             incrementDistance = 1
@@ -973,11 +1051,10 @@ class App(QMainWindow):
             "moveSpeed": self.__moveSpeed,
             "position": {"Z": str(-1 * incrementDistance)},
         }
-        self.moveRelativeSignal.emit(params)
+        self.jogSignal.emit(params)
 
     def zRightClicked(self):
-        # disable buttons
-        self.tabPanel.setDisabled(True)
+        # jog panel stays enabled so clicks during a move are merged by the printer manager
         # fetch current increment value
         if self.button_1.isChecked():
             incrementDistance = 1
@@ -989,7 +1066,7 @@ class App(QMainWindow):
             "moveSpeed": self.__moveSpeed,
             "position": {"Z": str(incrementDistance)},
         }
-        self.moveRelativeSignal.emit(params)
+        self.jogSignal.emit(params)
 
     ########################################################################### GUI State functions
     def stateDisconnected(self):
@@ -1522,8 +1599,8 @@ class App(QMainWindow):
         # enable detection
         self.toggleDetectionSignal.emit(True)
         self.__displayCrosshair = True
-        # update machine coordinates
-        self.pollCoordinatesSignal.emit()
+        # update machine coordinates, the machine may have been moved outside TAMV
+        self.verifyCoordinatesSignal.emit()
         # Get original physical coordinates
         self.originalPrinterPosition = self.__currentPosition
         self.__restorePosition = copy.deepcopy(self.__currentPosition)
@@ -1534,8 +1611,8 @@ class App(QMainWindow):
     def manualCPCapture(self):
         self.__stateSetupCPCapture = False
         self.__stateManualCPCapture = True
-        # update machine coordinates
-        self.pollCoordinatesSignal.emit()
+        # update machine coordinates from the controller before capturing the CP
+        self.verifyCoordinatesSignal.emit()
         # stop endstop detection
         self.toggleEndstopDetectionSignal.emit(False)
         # update GUI
@@ -1610,6 +1687,7 @@ class App(QMainWindow):
 
     def resetNozzleAlignment(self):
         # Reset program state, and frame capture control to defaults
+        self.__queuedTool = None
         self.__stateEndstopAutoCalibrate = False
         self.__stateAutoCPCapture = False
         self.__stateSetupCPCapture = False
@@ -1622,28 +1700,15 @@ class App(QMainWindow):
         self.__displayCrosshair = False
         self.resetCalibrationVariables()
         self.tabPanel.setDisabled(True)
+        # offsets not saved by now belong to an incomplete run
+        self.abortOffsetsTransactionSignal.emit()
         self.unloadToolSignal.emit()
         self.getVideoFrameSignal.emit()
 
     # Function to reset calibrateTools variables
     def resetCalibrationVariables(self):
-        # Setup camera calibration move coordinates
-        self.calibrationCoordinates = [
-            [0, -0.5],
-            [0.294, -0.405],
-            [0.476, -0.155],
-            [0.476, 0.155],
-            [0.294, 0.405],
-            [0, 0.5],
-            [-0.294, 0.405],
-            [-0.476, 0.155],
-            [-0.476, -0.155],
-            [-0.294, -0.405],
-        ]
         # reset all variables
-        self.guessPosition = [1, 1]
         self.uv = [None, None]
-        self.olduv = self.uv
         if self.transformMatrix is None or self.mpp is None:
             _logger.debug("Camera calibration matrix reset.")
             self.state = 0
@@ -1653,11 +1718,10 @@ class App(QMainWindow):
             self.state = 0
         else:
             self.state = 200
-        self.detect_count = 0
-        self.space_coordinates = []
-        self.camera_coordinates = []
+        # the next detection starts a new calibration engine cycle
+        self.calibrationEngine = None
+        self.__calibrationCommands = []
         self.retries = 0
-        self.calibrationMoves = 0
         self.repeatCounter = 0
 
     def startAlignTools(self):
@@ -1709,6 +1773,13 @@ class App(QMainWindow):
         # this creates the workingToolset, from which we pop each tool on each cycle
         if toolset is not None:
             self.workingToolset = toolset
+            # optionally hold back the offsets until every tool is aligned
+            try:
+                deferred = bool(int(self.__activePrinter["defer_offsets"]))
+            except (KeyError, ValueError):
+                deferred = False
+            self.beginOffsetsTransactionSignal.emit({"deferred": deferred})
+            self.__measurementHops = {}
         # check if we still have tools to calibrate in the workingToolset list
         if len(self.workingToolset) > 0:
             # grab the first item in the list (FIFO)
@@ -1731,7 +1802,12 @@ class App(QMainWindow):
             # Capture start time of tool calibration run
             self.toolTime = time.time()
             # Call tool and start calibration
-            self.callTool(toolIndex)
+            if self.__queuedTool == toolIndex:
+                # tool change already queued in the Printer Manager
+                self.__queuedTool = None
+                self.callTool(toolIndex, queued=True)
+            else:
+                self.callTool(toolIndex)
         else:
             # entire list has been processed, output results
             calibration_time = np.around(time.time() - self.startTime, 1)
@@ -1742,6 +1818,7 @@ class App(QMainWindow):
                 + str(self.mpp)
                 + "/pixel"
             )
+            self.logMeasurementSummary()
             # save to firmware
             self.saveOffsets()
             # reset GUI
@@ -1752,363 +1829,311 @@ class App(QMainWindow):
 
     def autoCalibrate(self):
         self.tabPanel.setDisabled(True)
-        # create variable for tracking the calibration run time, if not already defined
-        try:
-            if runtime:
-                pass
-        except:
-            runtime = time.time()
         if self.uv is not None:
             if self.uv[0] is not None and self.uv[1] is not None:
-                # First calibration step
-                if self.state == 0:
-                    _logger.debug(
-                        "*** State: "
-                        + str(self.state)
-                        + " Coords:"
-                        + str(self.__currentPosition)
-                        + " UV: "
-                        + str(self.uv)
-                        + " old UV: "
-                        + str(self.olduv)
-                    )
-                    self.updateStatusbarMessage("Calibrating camera step 0..")
-                    if self.olduv is not None:
-                        if self.olduv[0] == self.uv[0] and self.olduv[1] == self.uv[1]:
-                            self.repeatCounter += 1
-                            if self.repeatCounter > 5:
-                                self.nozzleDetectionFailed()
-                                return
-                            # loop through again
-                            self.retries += 1
-                            self.pollCoordinatesSignal.emit()
-                            return
-                        else:
-                            self.repeatCounter = 0
-                    self.olduv = self.uv
-                    self.space_coordinates = []
-                    self.camera_coordinates = []
-
-                    self.space_coordinates.append(
-                        (self.__currentPosition["X"], self.__currentPosition["Y"])
-                    )
-                    self.camera_coordinates.append((self.uv[0], self.uv[1]))
-
-                    # move carriage for calibration
-                    self.offsetX = self.calibrationCoordinates[0][0]
-                    self.offsetY = self.calibrationCoordinates[0][1]
-                    params = {"position": {"X": self.offsetX, "Y": self.offsetY}}
-                    self.lastState = 0
-                    self.state = 1
-                    self.moveRelativeSignal.emit(params)
+                # offsets are being set, or the alignment was halted
+                if self.state != 0 and self.state != 200:
                     return
-                elif self.state >= 1 and self.state < len(self.calibrationCoordinates):
-                    # capture the UV data when a calibration move has been executed, before returning to original position
-                    if self.state != self.lastState and self.state < len(
-                        self.calibrationCoordinates
-                    ):
-                        _logger.debug(
-                            "*** State: "
-                            + str(self.state)
-                            + " Coords:"
-                            + str(self.__currentPosition)
-                            + " UV: "
-                            + str(self.uv)
-                            + " old UV: "
-                            + str(self.olduv)
-                        )
-                        if self.olduv is not None:
-                            if (
-                                self.olduv[0] == self.uv[0]
-                                and self.olduv[1] == self.uv[1]
-                            ):
-                                self.repeatCounter += 1
-                                if self.repeatCounter > 10:
-                                    self.nozzleDetectionFailed()
-                                    return
-                                # loop through again
-                                self.retries += 1
-                                self.pollCoordinatesSignal.emit()
-                                return
-                            else:
-                                self.repeatCounter = 0
-                        # Calculate mpp at first move
-                        if self.state == 1:
-                            self.mpp = np.around(
-                                0.5
-                                / self.getDistance(
-                                    self.olduv[0], self.olduv[1], self.uv[0], self.uv[1]
-                                ),
-                                3,
-                            )
-                        # save position as previous position
-                        self.olduv = self.uv
-                        # save machine coordinates for detected nozzle
-                        self.space_coordinates.append(
-                            (self.__currentPosition["X"], self.__currentPosition["Y"])
-                        )
-                        # save camera coordinates
-                        self.camera_coordinates.append((self.uv[0], self.uv[1]))
-
-                        # return carriage to relative center of movement
-                        self.offsetX = -1 * self.offsetX
-                        self.offsetY = -1 * self.offsetY
-                        self.lastState = self.state
-                        params = {"position": {"X": self.offsetX, "Y": self.offsetY}}
-                        self.moveRelativeSignal.emit(params)
-                        return
-                    # otherwise, move the carriage from the original position to the next step and increment state
+                # start a calibration engine cycle; camera calibration runs when no transform is known
+                if self.calibrationEngine is None or not self.calibrationEngine.active:
+                    if self.state == 200:
+                        transformMatrix = self.transformMatrix
                     else:
-                        self.updateStatusbarMessage(
-                            "Calibrating camera step " + str(self.state) + ".."
-                        )
-                        _logger.debug(
-                            "Step " + str(self.state) + " detection UV: " + str(self.uv)
-                        )
-                        # move carriage to next calibration point
-                        self.offsetX = self.calibrationCoordinates[self.state][0]
-                        self.offsetY = self.calibrationCoordinates[self.state][1]
-                        self.lastState = int(self.state)
-                        self.state += 1
-                        params = {"position": {"X": self.offsetX, "Y": self.offsetY}}
-                        self.moveRelativeSignal.emit(params)
-                        return
-                elif self.state == len(self.calibrationCoordinates):
-                    # Camera calibration moves completed.
-                    if self.olduv is not None:
-                        if self.olduv[0] == self.uv[0] and self.olduv[1] == self.uv[1]:
-                            self.repeatCounter += 1
-                            if self.repeatCounter > 10:
-                                self.nozzleDetectionFailed()
-                                return
-                            # loop through again
-                            self.retries += 1
-                            self.pollCoordinatesSignal.emit()
-                            return
-                        else:
-                            self.repeatCounter = 0
-                    # Update GUI thread with current status and percentage complete
-                    updateMessage = "Millimeters per pixel is " + str(self.mpp)
-                    self.updateStatusbarMessage(updateMessage)
-                    _logger.info(updateMessage)
-
-                    # save position as previous position
-                    self.olduv = self.uv
-                    # save machine coordinates for detected nozzle
-                    self.space_coordinates.append(
-                        (self.__currentPosition["X"], self.__currentPosition["Y"])
+                        transformMatrix = None
+                    self.calibrationEngine = CalibrationEngine(
+                        width=self._cameraWidth,
+                        height=self._cameraHeight,
+                        transformMatrix=transformMatrix,
+                        mpp=self.mpp,
+                        pattern=self._calibrationPattern,
+                        validate=self.__validateTransform,
+                        tolerance=self._convergenceTolerance,
                     )
-                    # save camera coordinates
-                    self.camera_coordinates.append((self.uv[0], self.uv[1]))
-
-                    # calculate camera transformation matrix
-                    cameraCalibrationTime = np.around(time.time() - self.startTime, 1)
-                    _logger.info(
-                        "Camera calibrated ("
-                        + str(cameraCalibrationTime)
-                        + "s); aligning.."
+                    self.calibrationEngine.start(
+                        endstop=self.__stateEndstopAutoCalibrate, timestamp=time.time()
                     )
-
-                    # Calculate transformation matrix
-                    self.transform_input = [
-                        (self.space_coordinates[i], self.normalize_coords(camera))
-                        for i, camera in enumerate(self.camera_coordinates)
-                    ]
-                    (
-                        self.transformMatrix,
-                        self.transform_residual,
-                    ) = self.least_square_mapping(self.transform_input)
-
-                    # define camera center in machine coordinate space
-                    self.newCenter = self.transformMatrix.T @ np.array(
-                        [0, 0, 0, 0, 0, 1]
+                    if self.calibrationEngine.state == CalibrationEngine.CALIBRATING:
+                        self.state = 0
+                # Update GUI with current status
+                if self.calibrationEngine.state == CalibrationEngine.CALIBRATING:
+                    updateMessage = (
+                        "Calibrating camera step "
+                        + str(self.calibrationEngine.step)
+                        + ".."
                     )
-                    self.guessPosition[0] = np.around(self.newCenter[0], 3)
-                    self.guessPosition[1] = np.around(self.newCenter[1], 3)
-                    _logger.info(
-                        "Calibration positional guess: " + str(self.guessPosition)
+                    repeatLimit = 5 if self.calibrationEngine.step == 0 else 10
+                elif self.__stateEndstopAutoCalibrate:
+                    updateMessage = (
+                        "Endstop calibration step "
+                        + str(self.calibrationEngine.calibrationMoves)
+                        + ".. (MPP="
+                        + str(self.mpp)
+                        + ")"
                     )
-
-                    # Set next calibration variables state
-                    self.state = 200
-                    self.retries = 0
-                    self.calibrationMoves = 0
-
-                    params = {
-                        "position": {
-                            "X": self.guessPosition[0],
-                            "Y": self.guessPosition[1],
-                        }
-                    }
-                    self.moveAbsoluteSignal.emit(params)
-                    return
-                elif self.state == 200:
-                    # Update GUI with current status
-                    if self.__stateEndstopAutoCalibrate:
-                        updateMessage = (
-                            "Endstop calibration step "
-                            + str(self.calibrationMoves)
-                            + ".. (MPP="
-                            + str(self.mpp)
-                            + ")"
-                        )
-                    else:
-                        updateMessage = (
-                            "Tool "
-                            + str(self.__activePrinter["currentTool"])
-                            + " calibration step "
-                            + str(self.calibrationMoves)
-                            + ".. (MPP="
-                            + str(self.mpp)
-                            + ")"
-                        )
-                    self.updateStatusbarMessage(updateMessage)
-                    # if(self.olduv is not None):
-                    #     if(self.olduv[0] == self.uv[0] and self.olduv[1] == self.uv[1]):
-                    #         # print('Repeating detection: ' + str(self.repeatCounter))
-                    #         self.repeatCounter += 1
-                    #         if(self.repeatCounter > 10):
-                    #             print('Failed to detect.')
-                    #             self.nozzleDetectionFailed()
-                    #             return
-                    #         # loop through again
-                    #         print('Retrying', self.retries)
-                    #         self.retries += 1
-                    #         self.pollCoordinatesSignal.emit()
-                    #         return
-                    #     else:
-                    #         # print('Took ' + str(self.repeatCounter) + ' attempts.')
-                    #         self.repeatCounter = 0
-                    # increment moves counter
-                    self.calibrationMoves += 1
-                    # nozzle detected, frame rotation is set, start
-                    self.cx, self.cy = self.normalize_coords(self.uv)
-                    self.v = [
-                        self.cx**2,
-                        self.cy**2,
-                        self.cx * self.cy,
-                        self.cx,
-                        self.cy,
-                        0,
-                    ]
-                    self.offsets = -1 * (0.55 * self.transformMatrix.T @ self.v)
-                    self.offsets[0] = np.around(self.offsets[0], 3)
-                    self.offsets[1] = np.around(self.offsets[1], 3)
-                    _logger.debug(
-                        "*** State: "
-                        + str(self.state)
-                        + " retries: "
-                        + str(self.retries)
-                        + " X"
-                        + str(self.__currentPosition["X"])
-                        + " Y"
-                        + str(self.__currentPosition["Y"])
-                        + " UV: "
-                        + str(self.uv)
-                        + " old UV: "
-                        + str(self.olduv)
-                        + " Offsets: "
-                        + str(self.offsets)
+                    repeatLimit = 10
+                else:
+                    updateMessage = (
+                        "Tool "
+                        + str(self.__activePrinter["currentTool"])
+                        + " calibration step "
+                        + str(self.calibrationEngine.calibrationMoves)
+                        + ".. (MPP="
+                        + str(self.mpp)
+                        + ")"
                     )
-                    # Add rounding handling for endstop alignment
-                    if self.__stateEndstopAutoCalibrate:
-                        if abs(self.offsets[0]) + abs(self.offsets[1]) <= 0.02:
-                            self.offsets[0] = 0.0
-                            self.offsets[1] = 0.0
-
-                    # Start timer if we're calibrating the CP using the automated endstop detection
-                    try:
-                        if self.toolTime:
-                            pass
-                    except:
-                        self.toolTime = time.time()
-
-                    # calculate current calibration cycle runtime
-                    runtime = np.around(time.time() - self.toolTime, 1)
-                    # check if too much time has passed
-                    if runtime > 120 or self.calibrationMoves > 30:
-                        print("Runtime:", runtime, " moves: ", self.calibrationMoves)
-                        self.retries = 10
-                    # Otherwise, check if we're not aligned to the center
-                    elif self.offsets[0] != 0.0 or self.offsets[1] != 0.0:
-                        self.olduv = self.uv
-                        params = {
-                            "position": {"X": self.offsets[0], "Y": self.offsets[1]},
-                            "moveSpeed": 1000,
-                        }
-                        self.moveRelativeSignal.emit(params)
-                        _logger.debug(
-                            "Calibration move X{0:-1.3f} Y{1:-1.3f} F1000 ".format(
-                                self.offsets[0], self.offsets[1]
-                            )
-                        )
-                        return
-                    # finally, we're aligned to the center, and we should update the tool offsets
-                    elif self.offsets[0] == 0.0 and self.offsets[1] == 0.0:
-                        # endstop calibration wrapping up
-                        if self.__stateEndstopAutoCalibrate:
-                            updateMessage = (
-                                "Endstop auto-calibrated in "
-                                + str(self.calibrationMoves)
-                                + " steps. (MPP="
-                                + str(self.mpp)
-                                + ")"
-                            )
-                            # update state flags for endstop alignment
-                            self.__stateAutoCPCapture = False
-                            self.__stateEndstopAutoCalibrate = False
-                            self.__stateManualCPCapture = False
-                            # update detection manager state
-                            self.toggleEndstopAutoDetectionSignal.emit(False)
-                            # disable detection manager frame analysis
-                            self.toggleDetectionSignal.emit(False)
-                            self.__displayCrosshair = False
-                            # Set CP location
-                            self.__cpCoordinates["X"] = np.around(
-                                self.__currentPosition["X"], 2
-                            )
-                            self.__cpCoordinates["Y"] = np.around(
-                                self.__currentPosition["Y"], 2
-                            )
-                            self.__cpCoordinates["Z"] = np.around(
-                                self.__currentPosition["Z"], 2
-                            )
-                            # Update GUI statusbar with CP coordinates and green status
-                            self.cpLabel.setText(
-                                "<b>CP:</b> <i>("
-                                + str(self.__cpCoordinates["X"])
-                                + ", "
-                                + str(self.__cpCoordinates["Y"])
-                                + ")</i>"
-                            )
-                            self.cpLabel.setStyleSheet(self.styleGreen)
-                            # Reset entire GUI for next state
-                            self.stateCalibrateReady()
-                            self.repaint()
-                        # tool calibration wrapping up
-                        elif self.__stateAutoNozzleAlignment:
-                            updateMessage = (
-                                "Tool "
-                                + str(self.__activePrinter["currentTool"])
-                                + " has been calibrated."
-                            )
-                            self.state = 100
-                            self.retries = 0
-                        self.updateStatusbarMessage(updateMessage)
-                        self.pollCoordinatesSignal.emit()
-                        return
-            elif self.retries < 100 and runtime <= self.__maxRuntime:
+                    repeatLimit = 10
+                self.updateStatusbarMessage(updateMessage)
+                if not self.detectionAccepted(repeatLimit=repeatLimit):
+                    return
+                commands = self.calibrationEngine.update(
+                    self.uv, self.__currentPosition, time.time()
+                )
+                self.runCalibrationCommands(commands)
+                return
+            elif self.retries < 100:
                 self.retries += 1
-                self.pollCoordinatesSignal.emit()
+                self.measure(samePosition=True)
                 return
         if self.retries < self.__maxRetries:
             self.retries += 1
-            # enable detection
+            self.measure(samePosition=True)
+            return
+        # If we've reached this part of the code, we've run over our limit of retries
+
+    # Execute calibration engine commands: events are handled at once, moves are queued and
+    # sent one at a time, each after the previous move has completed.
+    def runCalibrationCommands(self, commands):
+        moves = []
+        for command in commands:
+            if command["type"] == "event":
+                self.calibrationEvent(command)
+            else:
+                moves.append(command)
+        if len(moves) > 0:
+            self.__calibrationCommands = moves
+            self.nextCalibrationMove()
+        elif self.calibrationEngine.active:
+            # measure again without moving
+            self.measure(samePosition=True)
+
+    def nextCalibrationMove(self):
+        command = self.__calibrationCommands.pop(0)
+        params = {"position": command["position"], "moveSpeed": command["moveSpeed"]}
+        if len(self.__calibrationCommands) == 0 and self.automatedMeasurement():
+            # the Printer Manager measures as soon as the last move is done
             self.toggleDetectionSignal.emit(True)
             self.__displayCrosshair = True
+            params["measure"] = self.measurementRequest()
+        _logger.debug(
+            "Calibration move "
+            + command["type"]
+            + " X{0:-1.3f} Y{1:-1.3f} F{2:d}".format(
+                command["position"]["X"], command["position"]["Y"], command["moveSpeed"]
+            )
+        )
+        if command["type"] == "moveAbsolute":
+            self.moveAbsoluteSignal.emit(params)
+        else:
+            self.moveRelativeSignal.emit(params)
+
+    def calibrationEvent(self, event):
+        if event["event"] == "cameraCalibrated":
+            self.transformMatrix = event["transformMatrix"]
+            self.transform_residual = event["residual"]
+            self.mpp = event["mpp"]
+            self.__validateTransform = False
+            self.state = 200
+            self.retries = 0
+            self.saveCachedCalibration(transform=True)
+            updateMessage = "Millimeters per pixel is " + str(self.mpp)
+            self.updateStatusbarMessage(updateMessage)
+            _logger.info(updateMessage)
+            cameraCalibrationTime = np.around(time.time() - self.startTime, 1)
+            _logger.info(
+                "Camera calibrated ("
+                + str(cameraCalibrationTime)
+                + "s, "
+                + event["pattern"]
+                + " pattern, "
+                + str(event["moves"])
+                + " moves, residual "
+                + str(np.around(event["residualPixels"], 2))
+                + "px); aligning.."
+            )
+            if event["movesSaved"] > 0:
+                _logger.info(
+                    "  .. saved "
+                    + str(event["movesSaved"])
+                    + " moves (~"
+                    + str(np.around(event["timeSaved"], 1))
+                    + "s) against the star pattern."
+                )
+            if not event["residualAccepted"]:
+                _logger.warning(
+                    "Camera calibration residual is high, check the camera focus and lighting."
+                )
+            _logger.info(
+                "Calibration positional guess: " + str(event["guessPosition"])
+            )
+        elif event["event"] == "transformValidated":
+            self.__validateTransform = False
+            _logger.info(
+                "Cached camera calibration confirmed in "
+                + str(event["moves"])
+                + " moves, skipping camera calibration."
+            )
+        elif event["event"] == "transformRejected":
+            self.__validateTransform = False
+            self.transformMatrix = None
+            self.mpp = None
+            self.state = 0
+            self.updateStatusbarMessage(
+                "Camera has moved since the last calibration, calibrating camera.."
+            )
+        elif event["event"] == "pointsRecaptured":
+            self.updateStatusbarMessage(
+                "Measuring " + str(len(event["points"])) + " calibration points again.."
+            )
+        elif event["event"] == "calibrationRejected":
+            self.updateStatusbarMessage(
+                "Camera calibration residual too high, repeating with the star pattern.."
+            )
+        elif event["event"] == "aligned":
+            # endstop calibration wrapping up
+            if self.__stateEndstopAutoCalibrate:
+                updateMessage = (
+                    "Endstop auto-calibrated in "
+                    + str(event["moves"])
+                    + " steps. (MPP="
+                    + str(self.mpp)
+                    + ")"
+                )
+                # update state flags for endstop alignment
+                self.__stateAutoCPCapture = False
+                self.__stateEndstopAutoCalibrate = False
+                self.__stateManualCPCapture = False
+                # update detection manager state
+                self.toggleEndstopAutoDetectionSignal.emit(False)
+                # disable detection manager frame analysis
+                self.toggleDetectionSignal.emit(False)
+                self.__displayCrosshair = False
+                # Set CP location
+                self.__cpCoordinates["X"] = np.around(self.__currentPosition["X"], 2)
+                self.__cpCoordinates["Y"] = np.around(self.__currentPosition["Y"], 2)
+                self.__cpCoordinates["Z"] = np.around(self.__currentPosition["Z"], 2)
+                self.saveCachedCalibration(cp=True)
+                # Update GUI statusbar with CP coordinates and green status
+                self.cpLabel.setText(
+                    "<b>CP:</b> <i>("
+                    + str(self.__cpCoordinates["X"])
+                    + ", "
+                    + str(self.__cpCoordinates["Y"])
+                    + ")</i>"
+                )
+                self.cpLabel.setStyleSheet(self.styleGreen)
+                # Reset entire GUI for next state
+                self.stateCalibrateReady()
+                self.repaint()
+            # tool calibration wrapping up
+            elif self.__stateAutoNozzleAlignment:
+                updateMessage = (
+                    "Tool "
+                    + str(self.__activePrinter["currentTool"])
+                    + " has been calibrated."
+                )
+                self.state = 100
+                self.retries = 0
+            self.updateStatusbarMessage(updateMessage)
             self.pollCoordinatesSignal.emit()
+        elif event["event"] == "failed":
+            self.updateStatusbarMessage(event["message"])
+            if self.__stateEndstopAutoCalibrate:
+                self.__stateAutoCPCapture = False
+                self.__stateEndstopAutoCalibrate = False
+                self.toggleEndstopAutoDetectionSignal.emit(False)
+                self.haltCPAutoCapture()
+            else:
+                self.nozzleDetectionFailed()
+
+    # Camera calibrations are cached per printer and camera in ./config/calibration.json.
+    # A cached transform is checked with a couple of moves before it is used.
+    def loadCachedCalibration(self):
+        key = cacheKey(self.__activePrinter["nickname"], self._videoSrc)
+        entry = loadCalibration(key, width=self._cameraWidth, height=self._cameraHeight)
+        if entry is None:
             return
-        # If we've reached this part of the code, we've run over our limit of retries
+        self.__lastToolOffsets = entry["tools"]
+        if entry["transformMatrix"] is None:
+            return
+        self.transformMatrix = entry["transformMatrix"]
+        self.mpp = entry["mpp"]
+        self.transform_residual = entry["residual"]
+        self.__validateTransform = True
+        _logger.info(
+            "  .. loaded cached camera calibration (MPP=" + str(self.mpp) + ")"
+        )
+
+    def saveCachedCalibration(self, transform=False, cp=False, toolOffsets=None):
+        key = cacheKey(self.__activePrinter["nickname"], self._videoSrc)
+        try:
+            if toolOffsets is not None:
+                saveCalibration(key, toolOffsets=toolOffsets)
+            if transform:
+                saveCalibration(
+                    key,
+                    transformMatrix=self.transformMatrix,
+                    mpp=self.mpp,
+                    residual=self.transform_residual,
+                    width=self._cameraWidth,
+                    height=self._cameraHeight,
+                )
+            if cp:
+                saveCalibration(key, cpCoordinates=self.__cpCoordinates)
+        except Exception as e:
+            _logger.warning("Cannot save camera calibration cache: " + str(e))
+
+    # Check the latest detection before the calibration state machine uses it.
+    # Strong detections from a frame captured after the last move are accepted at once,
+    # stale frames and weak detections are re-sampled without moving the machine.
+    def detectionAccepted(self, repeatLimit=10):
+        detection = self.__detection
+        if detection is None:
+            return True
+        stale = detection["frameTime"] < self.__lastMoveTime
+        weak = detection["confidence"] < self.__minDetectionConfidence
+        if not stale and not weak:
+            self.repeatCounter = 0
+            return True
+        self.repeatCounter += 1
+        if stale and self.repeatCounter > repeatLimit:
+            self.nozzleDetectionFailed()
+            return False
+        elif not stale and self.repeatCounter > self.__maxResamples:
+            _logger.debug(
+                "Accepting weak detection (confidence "
+                + str(detection["confidence"])
+                + ") after "
+                + str(self.repeatCounter - 1)
+                + " re-samples."
+            )
+            self.repeatCounter = 0
+            return True
+        _logger.debug(
+            "Re-sampling detection: "
+            + ("stale frame" if stale else "weak detection")
+            + " (confidence "
+            + str(detection["confidence"])
+            + ", candidates "
+            + str(detection["candidates"])
+            + ", frame age "
+            + str(detection["frameAge"])
+            + "s)"
+        )
+        self.retries += 1
+        QTimer.singleShot(
+            self.__resampleDelay, lambda: self.measure(samePosition=True)
+        )
+        return False
 
     def nozzleDetectionFailed(self):
         self.state = -99
@@ -2142,7 +2167,8 @@ class App(QMainWindow):
         self.retries = 0
         self.repeatCounter = 0
         self.uv = [None, None]
-        self.olduv = [None, None]
+        self.calibrationEngine = None
+        self.__calibrationCommands = []
         self.__stateAutoNozzleAlignment = True
         self.toolTime = time.time()
         self.resumeAutoToolAlignmentButton.setVisible(False)
@@ -2167,6 +2193,11 @@ class App(QMainWindow):
             videoSrc=self._videoSrc,
             width=self._cameraWidth,
             height=self._cameraHeight,
+            detectorProfile=self._detectorProfile,
+            workers=self._detectionWorkers,
+            previewScale=self._previewScale,
+            previewLuma=self._previewLuma,
+            previewFPS=self._previewFPS,
             parent=None,
         )
         self.detectionManager.moveToThread(self.detectionThread)
@@ -2181,7 +2212,7 @@ class App(QMainWindow):
         # Video frame signals and slots
         self.detectionManager.detectionManagerNewFrameSignal.connect(self.refreshImage)
         self.detectionManager.detectionManagerReadySignal.connect(self.startVideo)
-        self.getVideoFrameSignal.connect(self.detectionManager.processFrame)
+        self.getVideoFrameSignal.connect(self.detectionManager.resumeVideo)
         # Camera image properties signals and slots
         self.setImagePropertiesSignal.connect(
             self.detectionManager.relayImageProperties
@@ -2206,6 +2237,10 @@ class App(QMainWindow):
         self.detectionManager.detectionManagerUVCoordinatesSignal.connect(
             self.saveUVCoordinates
         )
+        self.measureDetectionSignal.connect(self.detectionManager.measure)
+        self.detectionManager.detectionManagerMeasurementSignal.connect(
+            self.measurementReceived
+        )
         # Master detection swtich enable/disable
         self.toggleDetectionSignal.connect(self.detectionManager.enableDetection)
 
@@ -2222,10 +2257,17 @@ class App(QMainWindow):
     @pyqtSlot(object)
     def refreshImage(self, data):
         self.__mutex.lock()
-        frame = data[0]
+        # newer frames may have arrived since the notification, always show the latest one
+        latest = self.detectionManager.latestPreview()
+        if latest is not None:
+            data = latest
+        # upload the frame (QImage) to a pixmap on the GUI thread
+        frame = QPixmap.fromImage(data[0])
+        # scale downsampled worker previews back to the display size
+        if frame.width() != self._cameraWidth:
+            frame = frame.scaled(self._cameraWidth, self._cameraHeight)
         self.image.setPixmap(frame)
         self.__mutex.unlock()
-        self.getVideoFrameSignal.emit()
 
     @pyqtSlot(object)
     def updateStatusbarMessage(self, message):
@@ -2308,9 +2350,17 @@ class App(QMainWindow):
 
             self.moveRelativeSignal.connect(self.printerManager.moveRelative)
             self.moveAbsoluteSignal.connect(self.printerManager.moveAbsolute)
+            self.jogSignal.connect(self.printerManager.jog)
             self.printerManager.moveCompleteSignal.connect(self.printerMoveComplete)
 
             self.pollCoordinatesSignal.connect(self.printerManager.getCoordinates)
+            self.verifyCoordinatesSignal.connect(
+                self.printerManager.verifyCoordinates
+            )
+            self.measureSignal.connect(self.printerManager.measure)
+            self.printerManager.measureRequestSignal.connect(
+                self.detectionManager.measure
+            )
             self.printerManager.coordinatesSignal.connect(self.saveCurrentPosition)
 
             self.callToolSignal.connect(self.printerManager.callTool)
@@ -2322,6 +2372,12 @@ class App(QMainWindow):
             self.printerManager.offsetsSetSignal.connect(self.calibrateOffsetsApplied)
             self.setOffsetsSignal.connect(self.printerManager.calibrationSetOffset)
             self.saveToFirmwareSignal.connect(self.printerManager.saveOffsets)
+            self.beginOffsetsTransactionSignal.connect(
+                self.printerManager.beginOffsetsTransaction
+            )
+            self.abortOffsetsTransactionSignal.connect(
+                self.printerManager.abortOffsetsTransaction
+            )
 
             self.printerThread.start()  # priority=QThread.TimeCriticalPriority)
         except Exception as e:
@@ -2454,6 +2510,7 @@ class App(QMainWindow):
         # poll for position
         self.__firstConnection = True
         self.__mutex.unlock()
+        self.loadCachedCalibration()
         self.pollCoordinatesSignal.emit()
         # Gui state
         self.stateConnected()
@@ -2505,7 +2562,7 @@ class App(QMainWindow):
         self.printerDisconnected(message=message)
         self.statusBar.setStyleSheet(self.styleRed)
 
-    def callTool(self, toolNumber=-1):
+    def callTool(self, toolNumber=-1, queued=False):
         # disable detection
         self.toggleDetectionSignal.emit(False)
         self.__displayCrosshair = False
@@ -2516,14 +2573,15 @@ class App(QMainWindow):
             return
         try:
             self.startAlignToolsButton.setText("Loading T" + str(toolNumber) + "..")
-            self.callToolSignal.emit(toolNumber)
+            if not queued:
+                self.callToolSignal.emit(toolNumber)
         except:
             errorMsg = "Unable to call tool from printer: " + str(toolNumber)
             _logger.error(errorMsg)
             self.printerError(errorMsg)
 
-    @pyqtSlot()
-    def toolLoaded(self):
+    @pyqtSlot(object)
+    def toolLoaded(self, toolParams=None):
         self.pollCurrentToolSignal.emit()
         if (
             self.__cpCoordinates["X"] is not None
@@ -2532,11 +2590,7 @@ class App(QMainWindow):
             params = {
                 "protected": True,
                 "moveSpeed": 5000,
-                "position": {
-                    "X": self.__cpCoordinates["X"],
-                    "Y": self.__cpCoordinates["Y"],
-                    "Z": self.__cpCoordinates["Z"],
-                },
+                "position": self.predictToolPosition(toolParams),
             }
         else:
             params = {
@@ -2550,6 +2604,41 @@ class App(QMainWindow):
             }
         self.moveAbsoluteSignal.emit(params)
 
+    # Start position for a tool: the CP, shifted by the difference between its firmware offsets
+    # and the offsets it was last aligned with, so the first detection lands near the center.
+    def predictToolPosition(self, toolParams=None):
+        position = {
+            "X": self.__cpCoordinates["X"],
+            "Y": self.__cpCoordinates["Y"],
+            "Z": self.__cpCoordinates["Z"],
+        }
+        try:
+            toolIndex = int(toolParams["tool"])
+            currentOffsets = toolParams["offsets"]
+            lastOffsets = self.__lastToolOffsets[toolIndex]
+        except (KeyError, TypeError):
+            return position
+        if currentOffsets is None:
+            return position
+        predicted = expectedPosition(position, currentOffsets, lastOffsets)
+        shiftX = predicted["X"] - position["X"]
+        shiftY = predicted["Y"] - position["Y"]
+        if shiftX == 0 and shiftY == 0:
+            return position
+        if not withinView(
+            shiftX, shiftY, self.mpp, self._cameraWidth, self._cameraHeight
+        ):
+            _logger.info(
+                "T"
+                + str(toolIndex)
+                + " firmware offsets differ from the last alignment by more than the camera view, starting at the CP."
+            )
+            return position
+        _logger.debug(
+            "T" + str(toolIndex) + " predicted position: " + str(predicted)
+        )
+        return predicted
+
     @pyqtSlot(int)
     def registerActiveTool(self, toolIndex):
         self.__mutex.lock()
@@ -2591,6 +2680,11 @@ class App(QMainWindow):
 
     @pyqtSlot()
     def printerMoveComplete(self):
+        self.__lastMoveTime = time.time()
+        # send the next queued calibration move before measuring again
+        if len(self.__calibrationCommands) > 0:
+            self.nextCalibrationMove()
+            return
         self.tabPanel.setDisabled(False)
         if self.__stateAutoCPCapture and self.__stateEndstopAutoCalibrate:
             # enable detection
@@ -2630,10 +2724,96 @@ class App(QMainWindow):
             statusMsg = "Ready."
             self.updateStatusbarMessage(statusMsg)
             _logger.debug(statusMsg)
+        if self.automatedMeasurement() and self.state != 100:
+            self.measure()
+            return
         self.pollCoordinatesSignal.emit()
 
+    # Measurements for automated calibration: the machine position and a detection from a frame
+    # captured after the last move arrive together in measurementReceived.
+    def automatedMeasurement(self):
+        return (
+            self.__stateEndstopAutoCalibrate is True
+            or self.__stateAutoNozzleAlignment is True
+        )
+
+    def measurementRequest(self):
+        return {"times": {"requested": time.time()}}
+
+    def measure(self, samePosition=False):
+        self.toggleDetectionSignal.emit(True)
+        self.__displayCrosshair = True
+        request = self.measurementRequest()
+        if samePosition and self.__currentPosition["X"] is not None:
+            # the machine has not moved, ask for a new detection only
+            request["position"] = copy.deepcopy(self.__currentPosition)
+            request["notBefore"] = request["times"]["requested"]
+            self.measureDetectionSignal.emit(request)
+        else:
+            self.measureSignal.emit(request)
+
     @pyqtSlot(object)
-    def saveUVCoordinates(self, uvCoordinates):
+    def measurementReceived(self, measurement):
+        times = measurement["times"]
+        times["received"] = time.time()
+        self.logMeasurement(times)
+        try:
+            self.__lastMoveTime = times["moved"]
+        except KeyError:
+            pass
+        if not self.automatedMeasurement():
+            # alignment halted while measuring
+            return
+        if self.state == 100:
+            self.saveCurrentPosition(measurement["position"])
+            return
+        self.__mutex.lock()
+        self.__currentPosition = measurement["position"]
+        self.__mutex.unlock()
+        self.saveUVCoordinates(measurement["detection"])
+
+    # time spent in each hop of a measurement, from the request in the main thread through the
+    # Printer Manager (move, position) and the Detection Manager (fresh detection) and back
+    def logMeasurement(self, times):
+        stages = [
+            "requested",
+            "printer",
+            "moved",
+            "position",
+            "detection",
+            "detected",
+            "received",
+        ]
+        hops = []
+        previous = None
+        for stage in stages:
+            if stage not in times:
+                continue
+            if previous is not None:
+                duration = times[stage] - times[previous]
+                hops.append(stage + " {0:.0f}ms".format(1000 * duration))
+                total = self.__measurementHops.setdefault(stage, [0, 0])
+                total[0] += duration
+                total[1] += 1
+            previous = stage
+        _logger.debug("Measurement hops: " + ", ".join(hops))
+
+    def logMeasurementSummary(self):
+        if len(self.__measurementHops) == 0:
+            return
+        hops = []
+        for stage in self.__measurementHops:
+            (duration, count) = self.__measurementHops[stage]
+            hops.append(stage + " {0:.0f}ms".format(1000 * duration / count))
+        _logger.info("Mean measurement hop times: " + ", ".join(hops))
+
+    @pyqtSlot(object)
+    def saveUVCoordinates(self, detection):
+        self.__detection = detection
+        if detection is not None:
+            uvCoordinates = detection["uv"]
+        else:
+            uvCoordinates = None
         self.uv = uvCoordinates
         if (
             self.__stateEndstopAutoCalibrate is True
@@ -2662,7 +2842,7 @@ class App(QMainWindow):
                         _logger.warning(updateMessage)
                         self.nozzleDetectionFailed()
                         return
-                self.pollCoordinatesSignal.emit()
+                self.measure(samePosition=True)
                 return
         self.autoCalibrate()
 
@@ -2678,6 +2858,7 @@ class App(QMainWindow):
             _logger.debug("saveCurrentPosition: manual CP capture")
             self.__cpCoordinates = coordinates
             self.__stateManualCPCapture = False
+            self.saveCachedCalibration(cp=True)
             self.cpLabel.setText(
                 "<b>CP:</b> <i>("
                 + str(self.__cpCoordinates["X"])
@@ -2715,6 +2896,7 @@ class App(QMainWindow):
                     "cpCoordinates": self.__cpCoordinates,
                     "continue": True,
                 }
+                self.queueNextTool(params)
                 self.setOffsetsSignal.emit(params)
                 return
             self.getUVCoordinatesSignal.emit()
@@ -2733,6 +2915,7 @@ class App(QMainWindow):
                 "cpCoordinates": self.__cpCoordinates,
                 "continue": True,
             }
+            self.queueNextTool(params)
             self.setOffsetsSignal.emit(params)
             return
         elif self.__firstConnection:
@@ -2740,6 +2923,14 @@ class App(QMainWindow):
             self.__restorePosition = copy.deepcopy(self.__currentPosition)
             self.__firstConnection = False
 
+    # The Printer Manager changes to the next tool of the run right after writing the offsets,
+    # while the main thread updates the GUI and the calibration cache.
+    def queueNextTool(self, params):
+        if self.workingToolset is None or len(self.workingToolset) == 0:
+            return
+        params["nextTool"] = self.workingToolset[0]
+        self.__queuedTool = self.workingToolset[0]
+
     @pyqtSlot(object)
     def calibrateOffsetsApplied(self, params=None):
         try:
@@ -2750,6 +2941,9 @@ class App(QMainWindow):
             __continue = params["continue"]
         except:
             __continue = True
+        if offsets is None:
+            # the Printer Manager does not change tools after a failed offsets write
+            self.__queuedTool = None
         self.resumeAutoToolAlignmentButton.setDisabled(True)
         self.resumeAutoToolAlignmentButton.setVisible(False)
         self.resumeAutoToolAlignmentButton.setStyleSheet(self.styleDisabled)
@@ -2769,6 +2963,10 @@ class App(QMainWindow):
                 toolTip += "Z: " + "{:>9.3f}".format(offsets["Z"])
                 toolTip += "</pre>"
                 button.setToolTip(toolTip)
+        if offsets is not None:
+            toolIndex = int(self.__activePrinter["currentTool"])
+            self.__lastToolOffsets[toolIndex] = offsets
+            self.saveCachedCalibration(toolOffsets={toolIndex: offsets})
         if __continue is True:
             toolCalibrationTime = np.around(time.time() - self.toolTime, 1)
             successMsg = (
@@ -2957,36 +3155,6 @@ class App(QMainWindow):
             self.statusBar.setStyleSheet(self.styleRed)
         _logger.debug("*** exiting App.saveUserSettings")
 
-    def getDistance(self, x1, y1, x0, y0):
-        _logger.debug("*** calling CalibrateNozzles.getDistance")
-        x1_float = float(x1)
-        x0_float = float(x0)
-        y1_float = float(y1)
-        y0_float = float(y0)
-        x_dist = (x1_float - x0_float) ** 2
-        y_dist = (y1_float - y0_float) ** 2
-        retVal = np.sqrt((x_dist + y_dist))
-        returnVal = np.around(retVal, 3)
-        _logger.debug("*** exiting CalibrateNozzles.getDistance")
-        return returnVal
-
-    def normalize_coords(self, coords):
-        xdim, ydim = self._cameraWidth, self._cameraHeight
-        returnValue = (coords[0] / xdim - 0.5, coords[1] / ydim - 0.5)
-        return returnValue
-
-    def least_square_mapping(self, calibration_points):
-        # Compute a 2x2 map from displacement vectors in screen space to real space.
-        n = len(calibration_points)
-        real_coords, pixel_coords = np.empty((n, 2)), np.empty((n, 2))
-        for i, (r, p) in enumerate(calibration_points):
-            real_coords[i] = r
-            pixel_coords[i] = p
-        x, y = pixel_coords[:, 0], pixel_coords[:, 1]
-        A = np.vstack([x**2, y**2, x * y, x, y, np.ones(n)]).T
-        transform = np.linalg.lstsq(A, real_coords, rcond=None)
-        return transform[0], transform[1].mean()
-
     def toggleCrosshair(self):
         if (
             self.__stateAutoCPCapture is False
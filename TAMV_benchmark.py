@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# Detection benchmark over the synthetic golden dataset.
+# Measures per-call latency and detection accuracy, plus calibration engine convergence against a
+# simulated printer and camera, compares them with a stored baseline and exits with an error code
+# when a regression exceeds the configured thresholds. Runs headless.
+import argparse, logging, os, sys, time
+import json, platform
+import copy
+
+# headless Qt (preview path benchmark)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import cv2
+import numpy as np
+
+from modules.Detector import Detector, loadProfile
+from modules.Simulation import goldenDataset, SimulatedPrinter, SimulatedCamera, runSimulatedCycle
+from modules.CalibrationEngine import CalibrationEngine
+
+_logger = logging.getLogger('TAMV.Benchmark')
+
+# default baseline file
+baselineFile = './config/benchmark_baseline.json'
+# Qt application object, needed to create QPixmaps
+_application = None
+
+# run a function repeatedly and return latency statistics in milliseconds
+def measure(function, repeat=50, warmup=3):
+    for i in range(warmup):
+        function()
+    times = []
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - startTime)*1000)
+    times = np.array(times)
+    return({
+        'median': round(float(np.median(times)), 4),
+        'p95': round(float(np.percentile(times, 95)), 4),
+        'mean': round(float(np.mean(times)), 4)
+    })
+
+# latency benchmarks: name -> function
+def latencyBenchmarks(detector, dataset):
+    benchmarks = {}
+    nozzleCases = {}
+    for case in dataset:
+        nozzleCases.setdefault(case['name'].rsplit('-', 1)[0], case)
+    nozzleFrame = nozzleCases['nozzle-standard']['frame']
+    endstopFrame = nozzleCases['endstop']['frame']
+    overlayDetector = copy.copy(detector)
+    overlayDetector.drawOverlay = True
+
+    benchmarks['adjust_gamma'] = lambda: detector.adjust_gamma(nozzleFrame)
+    benchmarks['preprocessor_0'] = lambda: detector.preprocessImage(nozzleFrame, algorithm=0)
+    benchmarks['preprocessor_1'] = lambda: detector.preprocessImage(nozzleFrame, algorithm=1)
+
+    # blob paths: the cascade is reset before every call, so each frame walks the detectors in order until its own path
+    def blobPath(frame):
+        detector.resetAlgorithm()
+        detector.nozzleDetection(frame, autoDetection=True)
+    for name in ['nozzle-standard', 'nozzle-triangle', 'nozzle-relaxed', 'nozzle-large']:
+        frame = nozzleCases[name]['frame']
+        benchmarks['blob_' + name.split('-')[1]] = (lambda frame=frame: blobPath(frame))
+    # blob path with a remembered algorithm (live video case)
+    detector.resetAlgorithm()
+    detector.nozzleDetection(nozzleFrame, autoDetection=True)
+    rememberedAlgorithm = detector.algorithm
+    def blobRemembered():
+        detector.algorithm = rememberedAlgorithm
+        detector.nozzleDetection(nozzleFrame, autoDetection=True)
+    benchmarks['blob_remembered'] = blobRemembered
+    benchmarks['endstop_contour'] = lambda: detector.endstopContourDetection(endstopFrame, autoDetection=True)
+
+    # overlay drawing
+    def nozzleOverlay():
+        overlayDetector.algorithm = rememberedAlgorithm
+        overlayDetector.nozzleDetection(nozzleFrame, autoDetection=True)
+    benchmarks['overlay_nozzle'] = nozzleOverlay
+    benchmarks['overlay_crosshair'] = lambda: overlayDetector.drawNozzleCrosshair(nozzleFrame.copy())
+    benchmarks['overlay_endstop'] = lambda: overlayDetector.endstopContourDetection(endstopFrame.copy(), autoDetection=False)
+
+    # receivedFrame preview path (requires PyQt5)
+    global _application
+    try:
+        from PyQt5.QtGui import QGuiApplication, QImage, QPixmap
+        from modules.DetectionManager import frameToImage
+        if(QGuiApplication.instance() is None):
+            _application = QGuiApplication([])
+        (previewImage, previewFrame) = frameToImage(nozzleFrame)
+        lumaFrame = cv2.cvtColor(nozzleFrame, cv2.COLOR_BGR2GRAY)
+        (lumaImage, lumaFrame) = frameToImage(lumaFrame)
+        # Detection Manager thread: wrap the frame buffer
+        benchmarks['preview_wrap'] = lambda: frameToImage(nozzleFrame)
+        # GUI thread: pixmap upload
+        benchmarks['preview_upload'] = lambda: QPixmap.fromImage(previewImage)
+        benchmarks['preview_upload_luma'] = lambda: QPixmap.fromImage(lumaImage)
+        # full preview path (wrap + upload)
+        benchmarks['preview_conversion'] = lambda: QPixmap.fromImage(frameToImage(nozzleFrame)[0])
+        # previous preview path: RGB conversion, QImage and QPixmap creation
+        def previewRGB():
+            rgbFrame = cv2.cvtColor(nozzleFrame, cv2.COLOR_BGR2RGB)
+            image = QImage(rgbFrame.data, rgbFrame.shape[1], rgbFrame.shape[0], rgbFrame.strides[0], QImage.Format_RGB888)
+            return(QPixmap.fromImage(image))
+        benchmarks['preview_rgb_copy'] = previewRGB
+    except ImportError:
+        _logger.warning('PyQt5 not available, skipping preview conversion benchmark.')
+    return(benchmarks)
+
+# detection accuracy over the golden dataset
+def accuracy(detector, dataset):
+    results = {}
+    for case in dataset:
+        detector.resetAlgorithm()
+        if(case['type'] == 'endstop'):
+            (center, frame, metrics) = detector.endstopContourDetection(case['frame'], autoDetection=True)
+        else:
+            (center, frame, metrics) = detector.nozzleDetection(case['frame'], autoDetection=True)
+        try:
+            entry = results[case['type']]
+        except KeyError:
+            entry = {'frames': 0, 'detected': 0, 'errors': [], 'pathMatches': 0}
+            results[case['type']] = entry
+        entry['frames'] += 1
+        if(metrics['algorithm'] == case['algorithm']):
+            entry['pathMatches'] += 1
+        if(center[0] is None or center[1] is None):
+            _logger.debug(case['name'] + ': not detected')
+            continue
+        error = float(np.linalg.norm(np.array(center, dtype=float) - np.array(case['uv'], dtype=float)))
+        _logger.debug(case['name'] + ': error ' + str(round(error, 3)) + 'px, algorithm ' + str(metrics['algorithm']))
+        entry['detected'] += 1
+        entry['errors'].append(error)
+    for entry in results.values():
+        entry['detectionRate'] = round(entry['detected']/entry['frames'], 4)
+        if(len(entry['errors']) > 0):
+            entry['meanError'] = round(float(np.mean(entry['errors'])), 4)
+            entry['maxError'] = round(float(np.max(entry['errors'])), 4)
+        else:
+            entry['meanError'] = None
+            entry['maxError'] = None
+        del entry['errors']
+    return(results)
+
+# simulated machine for calibration scenario `index`: camera rotation, scale, lens distortion,
+# detection noise, starting position and nozzle offset all vary, deterministically
+def calibrationScenario(index):
+    generator = np.random.default_rng(index)
+    start = {'X': 150.0 + generator.uniform(-0.5, 0.5), 'Y': 100.0 + generator.uniform(-0.5, 0.5), 'Z': 0.0}
+    nozzle = (generator.uniform(-0.3, 0.3), generator.uniform(-0.3, 0.3))
+    # second tool, aligned with the calibrated camera
+    toolNozzle = (generator.uniform(-0.8, 0.8), generator.uniform(-0.8, 0.8))
+    printer = SimulatedPrinter(position=start, nozzleOffsets={0: nozzle, 1: toolNozzle})
+    printer.loadTool(0)
+    camera = SimulatedCamera(printer, mpp=generator.uniform(0.008, 0.015), rotation=generator.uniform(-10, 10),
+        distortion=0.02, noise=0.3, outliers=0.03, seed=index)
+    return(printer, camera)
+
+# calibration engine convergence: full camera calibration and alignment cycles on the simulated machine
+def calibrationSimulation(cycles=200, pattern='star'):
+    converged = 0
+    moves = []
+    measurements = []
+    simulatedTimes = []
+    calibrationMoves = []
+    calibrationTimes = []
+    residuals = []
+    rejected = 0
+    errors = []
+    toolMoves = []
+    toolErrors = []
+    startTime = time.perf_counter()
+    for index in range(cycles):
+        (printer, camera) = calibrationScenario(index)
+        result = runSimulatedCycle(CalibrationEngine(width=camera.width, height=camera.height, pattern=pattern), printer, camera)
+        rejected += result['calibrationRejected']
+        if(result['event'] != 'aligned'):
+            _logger.debug('Calibration scenario ' + str(index) + ': ' + result['message'])
+            continue
+        converged += 1
+        moves.append(result['printerMoves'])
+        measurements.append(result['measurements'])
+        simulatedTimes.append(result['simulatedTime'])
+        calibrationMoves.append(result['calibration']['moves'])
+        calibrationTimes.append(result['calibration']['time'])
+        residuals.append(result['calibration']['residualPixels'])
+        errors.append(result['error'])
+        # align the second tool from the same position with the calibrated camera
+        printer.loadTool(1)
+        engine = CalibrationEngine(width=camera.width, height=camera.height, transformMatrix=result['calibration']['transformMatrix'], mpp=result['calibration']['mpp'])
+        result = runSimulatedCycle(engine, printer, camera)
+        if(result['event'] == 'aligned'):
+            toolMoves.append(result['printerMoves'])
+            toolErrors.append(result['error'])
+    elapsed = time.perf_counter() - startTime
+    results = {
+        'cycles': cycles,
+        'convergenceRate': round(converged/cycles, 4),
+        'rejected': rejected,
+        'cyclesPerSecond': round(cycles/elapsed, 1)
+    }
+    if(converged > 0):
+        results['meanMoves'] = round(float(np.mean(moves)), 3)
+        results['meanMeasurements'] = round(float(np.mean(measurements)), 3)
+        results['meanSimulatedTime'] = round(float(np.mean(simulatedTimes)), 3)
+        results['meanCalibrationMoves'] = round(float(np.mean(calibrationMoves)), 3)
+        results['meanCalibrationTime'] = round(float(np.mean(calibrationTimes)), 3)
+        results['meanResidual'] = round(float(np.mean(residuals)), 4)
+        results['meanError'] = round(float(np.mean(errors)), 5)
+        results['maxError'] = round(float(np.max(errors)), 5)
+    if(len(toolMoves) > 0):
+        results['toolConvergenceRate'] = round(len(toolMoves)/max(converged, 1), 4)
+        results['meanToolMoves'] = round(float(np.mean(toolMoves)), 3)
+        results['maxToolMoves'] = int(np.max(toolMoves))
+        results['meanToolError'] = round(float(np.mean(toolErrors)), 5)
+    return(results)
+
+def runBenchmark(repeat=50, profile=None):
+    detector = Detector(drawOverlay=False, profile=profile)
+    dataset = goldenDataset()
+    results = {
+        'system': {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__
+        },
+        'latency': {},
+        'accuracy': accuracy(detector, dataset),
+        'calibration': {pattern: calibrationSimulation(pattern=pattern) for pattern in CalibrationEngine.calibrationPatterns}
+    }
+    for (name, function) in latencyBenchmarks(detector, dataset).items():
+        results['latency'][name] = measure(function, repeat=repeat)
+    # one simulated camera calibration and alignment cycle
+    def calibrationCycle():
+        (printer, camera) = calibrationScenario(0)
+        runSimulatedCycle(CalibrationEngine(width=camera.width, height=camera.height), printer, camera)
+    results['latency']['calibration_cycle'] = measure(calibrationCycle, repeat=repeat)
+    return(results)
+
+# compare results with a baseline, returns a list of regression messages
+def compare(results, baseline, latencyThreshold=0.2, latencyFloor=0.25, rateThreshold=0.0, errorThreshold=0.5, movesThreshold=0.5, alignmentThreshold=0.002):
+    regressions = []
+    for (name, latency) in results['latency'].items():
+        try:
+            baselineLatency = baseline['latency'][name]['median']
+        except KeyError:
+            continue
+        # increases below latencyFloor (ms) are timer noise on sub-millisecond calls
+        if(latency['median'] > baselineLatency*(1 + latencyThreshold) and latency['median'] - baselineLatency > latencyFloor):
+            regressions.append(name + ': median latency ' + str(latency['median']) + 'ms, baseline ' + str(baselineLatency) + 'ms')
+    for (detectionType, entry) in results['accuracy'].items():
+        try:
+            baselineEntry = baseline['accuracy'][detectionType]
+        except KeyError:
+            continue
+        if(entry['detectionRate'] < baselineEntry['detectionRate'] - rateThreshold):
+            regressions.append(detectionType + ': detection rate ' + str(entry['detectionRate']) + ', baseline ' + str(baselineEntry['detectionRate']))
+        if(baselineEntry['meanError'] is not None and entry['meanError'] is not None):
+            if(entry['meanError'] > baselineEntry['meanError'] + errorThreshold):
+                regressions.append(detectionType + ': mean error ' + str(entry['meanError']) + 'px, baseline ' + str(baselineEntry['meanError']) + 'px')
+        # frames detected on a different blob path/preprocessor than the dataset expects
+        try:
+            pathRate = entry['pathMatches']/entry['frames']
+            baselinePathRate = baselineEntry['pathMatches']/baselineEntry['frames']
+        except (KeyError, ZeroDivisionError):
+            continue
+        if(pathRate < baselinePathRate - rateThreshold):
+            regressions.append(detectionType + ': path matches ' + str(entry['pathMatches']) + '/' + str(entry['frames']) + ', baseline ' + str(baselineEntry['pathMatches']) + '/' + str(baselineEntry['frames']))
+    for (pattern, calibration) in results['calibration'].items():
+        try:
+            baselineCalibration = baseline['calibration'][pattern]
+        except KeyError:
+            continue
+        if(calibration['convergenceRate'] < baselineCalibration['convergenceRate'] - rateThreshold):
+            regressions.append('calibration ' + pattern + ': convergence rate ' + str(calibration['convergenceRate']) + ', baseline ' + str(baselineCalibration['convergenceRate']))
+        try:
+            if(calibration['meanMoves'] > baselineCalibration['meanMoves'] + movesThreshold):
+                regressions.append('calibration ' + pattern + ': mean moves ' + str(calibration['meanMoves']) + ', baseline ' + str(baselineCalibration['meanMoves']))
+            if(calibration['meanError'] > baselineCalibration['meanError'] + alignmentThreshold):
+                regressions.append('calibration ' + pattern + ': mean error ' + str(calibration['meanError']) + 'mm, baseline ' + str(baselineCalibration['meanError']) + 'mm')
+            if(calibration['meanToolMoves'] > baselineCalibration['meanToolMoves'] + movesThreshold):
+                regressions.append('calibration ' + pattern + ': mean tool moves ' + str(calibration['meanToolMoves']) + ', baseline ' + str(baselineCalibration['meanToolMoves']))
+            if(calibration['meanToolError'] > baselineCalibration['meanToolError'] + alignmentThreshold):
+                regressions.append('calibration ' + pattern + ': mean tool error ' + str(calibration['meanToolError']) + 'mm, baseline ' + str(baselineCalibration['meanToolError']) + 'mm')
+        except KeyError:
+            pass
+    return(regressions)
+
+def report(results, baseline=None):
+    print()
+    print('%-20s %10s %10s %12s' % ('latency', 'median ms', 'p95 ms', 'baseline ms'))
+    for (name, latency) in results['latency'].items():
+        try:
+            baselineLatency = str(baseline['latency'][name]['median'])
+        except (KeyError, TypeError):
+            baselineLatency = '-'
+        print('%-20s %10.3f %10.3f %12s' % (name, latency['median'], latency['p95'], baselineLatency))
+    print()
+    print('%-20s %8s %10s %10s %10s %12s' % ('accuracy', 'frames', 'detected', 'mean px', 'max px', 'path match'))
+    for (detectionType, entry) in results['accuracy'].items():
+        print('%-20s %8d %10d %10s %10s %12d' % (detectionType, entry['frames'], entry['detected'], str(entry['meanError']), str(entry['maxError']), entry['pathMatches']))
+    print()
+    print('%-20s %8s %10s %10s %10s %10s %10s %10s %10s %12s' % ('calibration', 'cycles', 'converged', 'moves', 'cal moves', 'cal s', 'mean mm', 'tool moves', 'tool mm', 'cycles/s'))
+    for (pattern, calibration) in results['calibration'].items():
+        print('%-20s %8d %10s %10s %10s %10s %10s %10s %10s %12s' % (pattern, calibration['cycles'], str(calibration['convergenceRate']), str(calibration.get('meanMoves')),
+            str(calibration.get('meanCalibrationMoves')), str(calibration.get('meanCalibrationTime')), str(calibration.get('meanError')),
+            str(calibration.get('meanToolMoves')), str(calibration.get('meanToolError')), str(calibration['cyclesPerSecond'])))
+    print()
+
+if __name__ == "__main__":
+    ### Setup argmument parser
+    parser = argparse.ArgumentParser(
+        description="Benchmark TAMV detection latency and accuracy on the synthetic golden dataset.",
+        allow_abbrev=False,
+    )
+    parser.add_argument("--baseline", default=baselineFile, help="Baseline file (default: " + baselineFile + ")")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--repeat", type=int, default=50, help="Calls per latency benchmark (default: 50)")
+    parser.add_argument("--latency-threshold", type=float, default=0.2, help="Allowed median latency increase, as a fraction (default: 0.2)")
+    parser.add_argument("--latency-floor", type=float, default=0.25, help="Ignore median latency increases smaller than this, in ms (default: 0.25)")
+    parser.add_argument("--rate-threshold", type=float, default=0.0, help="Allowed detection rate drop (default: 0)")
+    parser.add_argument("--error-threshold", type=float, default=0.5, help="Allowed mean centre error increase in pixels (default: 0.5)")
+    parser.add_argument("--moves-threshold", type=float, default=0.5, help="Allowed increase in mean calibration and alignment moves (default: 0.5)")
+    parser.add_argument("--alignment-threshold", type=float, default=0.002, help="Allowed mean alignment error increase in mm (default: 0.002)")
+    parser.add_argument("--profile", default=None, help="Named detector profile from ./config/detectors.json")
+    parser.add_argument("-o", "--output", default=None, help="Write results to this JSON file")
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="Enable debug output to terminal"
+    )
+    # Execute argument parser
+    args = vars(parser.parse_args())
+
+    ### Setup logging
+    _logger = logging.getLogger("TAMV")
+    consoleFormatter = logging.Formatter(fmt="%(levelname)-9s: %(message)s")
+    ch = logging.StreamHandler(sys.stderr)
+    if args["debug"]:
+        _logger.setLevel(logging.DEBUG)
+    else:
+        _logger.setLevel(logging.INFO)
+    ch.setFormatter(consoleFormatter)
+    _logger.addHandler(ch)
+
+    profile = None
+    if(args['profile'] is not None):
+        try:
+            profile = loadProfile(args['profile'])
+        except (KeyError, FileNotFoundError) as e:
+            raise SystemExit('Cannot load detector profile: ' + str(e))
+    results = runBenchmark(repeat=args['repeat'], profile=profile)
+    try:
+        with open(args['baseline'], 'r') as inputfile:
+            baseline = json.load(inputfile)
+    except FileNotFoundError:
+        baseline = None
+    report(results, baseline)
+    if(args['output'] is not None):
+        with open(args['output'], 'w') as outputfile:
+            json.dump(results, outputfile, indent=4)
+    if(args['save_baseline']):
+        directory = os.path.dirname(args['baseline'])
+        if(directory != ''):
+            os.makedirs(directory, exist_ok=True)
+        with open(args['baseline'], 'w') as outputfile:
+            json.dump(results, outputfile, indent=4)
+        _logger.info('Baseline saved to ' + args['baseline'])
+    elif(baseline is None):
+        _logger.warning('No baseline found at ' + args['baseline'] + ', run with --save-baseline to create one.')
+    else:
+        regressions = compare(results, baseline, latencyThreshold=args['latency_threshold'], latencyFloor=args['latency_floor'], rateThreshold=args['rate_threshold'], errorThreshold=args['error_threshold'], movesThreshold=args['moves_threshold'], alignmentThreshold=args['alignment_threshold'])
+        if(len(regressions) > 0):
+            for regression in regressions:
+                _logger.error('Regression: ' + regression)
+            sys.exit(1)
+        _logger.info('No regressions against baseline.')
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# Offline batch detection over recorded images or video files.
+# Runs the TAMV nozzle/endstop detectors on a multiprocessing pool, without the GUI or a camera.
+import argparse, logging, os, sys, time
+import csv, json
+import multiprocessing
+
+import cv2
+
+from modules.Detector import Detector, loadProfile
+
+_logger = logging.getLogger('TAMV.Detect')
+
+# supported image file extensions
+imageExtensions = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+# output columns
+resultFields = ['frame', 'u', 'v', 'radius', 'algorithm', 'candidates', 'confidence', 'time']
+
+# per-worker detector object, created by the pool initializer
+_detector = None
+_detectorType = 'nozzle'
+
+def _initWorker(detectorType, profile=None):
+    global _detector, _detectorType
+    _detector = Detector(drawOverlay=False, profile=profile)
+    _detectorType = detectorType
+
+def _detectFrame(job):
+    (frameName, frame) = job
+    if(isinstance(frame, str)):
+        frame = cv2.imread(frame)
+    result = {'frame': frameName}
+    if(frame is None):
+        result['error'] = 'Cannot read frame.'
+        return(result)
+    # every frame is analyzed on its own, so the detector cascade starts from scratch
+    _detector.resetAlgorithm()
+    startTime = time.perf_counter()
+    if(_detectorType == 'endstop'):
+        (center, frame, metrics) = _detector.endstopContourDetection(frame, autoDetection=True)
+    else:
+        (center, frame, metrics) = _detector.nozzleDetection(frame, autoDetection=True)
+    elapsed = time.perf_counter() - startTime
+    detection = _detector.detectionResult(uv=center, metrics=metrics)
+    if(detection['uv'] is not None):
+        result['u'] = detection['uv'][0]
+        result['v'] = detection['uv'][1]
+    else:
+        result['u'] = None
+        result['v'] = None
+    result['radius'] = detection['radius']
+    result['algorithm'] = detection['algorithm']
+    result['candidates'] = detection['candidates']
+    result['confidence'] = detection['confidence']
+    # detection time in milliseconds
+    result['time'] = round(elapsed*1000, 3)
+    return(result)
+
+# generate (name, path) jobs for an image folder
+def imageJobs(folder):
+    files = sorted([name for name in os.listdir(folder) if name.lower().endswith(imageExtensions)])
+    for name in files:
+        yield((name, os.path.join(folder, name)))
+
+# generate (index, frame) jobs for a video file
+def videoJobs(videoFile, maxFrames=0):
+    cap = cv2.VideoCapture(videoFile)
+    if(not cap.isOpened()):
+        raise SystemExit('Cannot open video file: ' + str(videoFile))
+    index = 0
+    try:
+        while(maxFrames <= 0 or index < maxFrames):
+            ret, frame = cap.read()
+            if(not ret):
+                break
+            yield((index, frame))
+            index += 1
+    finally:
+        cap.release()
+
+def runDetection(source, detectorType='nozzle', workers=None, maxFrames=0, chunkSize=4, profile=None):
+    if(os.path.isdir(source)):
+        jobs = imageJobs(source)
+        if(maxFrames > 0):
+            jobs = (job for (i, job) in zip(range(maxFrames), jobs))
+    elif(os.path.isfile(source)):
+        jobs = videoJobs(source, maxFrames=maxFrames)
+    else:
+        raise SystemExit('Input not found: ' + str(source))
+    if(workers is None or workers < 1):
+        workers = multiprocessing.cpu_count()
+    results = []
+    startTime = time.perf_counter()
+    with multiprocessing.Pool(processes=workers, initializer=_initWorker, initargs=(detectorType, profile)) as pool:
+        for result in pool.imap(_detectFrame, jobs, chunksize=chunkSize):
+            results.append(result)
+    elapsed = time.perf_counter() - startTime
+    return(results, elapsed)
+
+def writeResults(results, outputFile=None, outputFormat='csv'):
+    if(outputFile is None):
+        output = sys.stdout
+    else:
+        output = open(outputFile, 'w', newline='')
+    try:
+        if(outputFormat == 'json'):
+            json.dump(results, output, indent=4)
+            output.write('\n')
+        else:
+            writer = csv.DictWriter(output, fieldnames=resultFields + ['error'], extrasaction='ignore')
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
+    finally:
+        if(outputFile is not None):
+            output.close()
+
+def summary(results, elapsed, workers):
+    frames = len(results)
+    detected = len([result for result in results if result.get('u') is not None])
+    detectionTimes = [result['time'] for result in results if 'time' in result]
+    _logger.info('Frames analyzed: ' + str(frames) + ' (' + str(detected) + ' detected) using ' + str(workers) + ' workers.')
+    if(frames > 0 and elapsed > 0):
+        _logger.info('Throughput: ' + str(round(frames/elapsed, 1)) + ' frames/s')
+    if(len(detectionTimes) > 0):
+        _logger.info('Mean detection time: ' + str(round(sum(detectionTimes)/len(detectionTimes), 3)) + 'ms')
+
+if __name__ == "__main__":
+    ### Setup argmument parser
+    parser = argparse.ArgumentParser(
+        description="Run TAMV detection over an image folder or a video file.",
+        allow_abbrev=False,
+    )
+    parser.add_argument("input", help="Image folder or video file")
+    parser.add_argument("--detector", choices=['nozzle', 'endstop'], default='nozzle', help="Detector to run (default: nozzle)")
+    parser.add_argument("--workers", type=int, default=0, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--format", choices=['csv', 'json'], default='csv', help="Output format (default: csv)")
+    parser.add_argument("-o", "--output", default=None, help="Output file (default: stdout)")
+    parser.add_argument("--profile", default=None, help="Named detector profile from ./config/detectors.json")
+    parser.add_argument("--max-frames", type=int, default=0, help="Stop after this many frames")
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="Enable debug output to terminal"
+    )
+    # Execute argument parser
+    args = vars(parser.parse_args())
+
+    ### Setup logging (stderr, so results can be piped from stdout)
+    _logger = logging.getLogger("TAMV")
+    consoleFormatter = logging.Formatter(fmt="%(levelname)-9s: %(message)s")
+    ch = logging.StreamHandler(sys.stderr)
+    if args["debug"]:
+        _logger.setLevel(logging.DEBUG)
+    else:
+        _logger.setLevel(logging.INFO)
+    ch.setFormatter(consoleFormatter)
+    _logger.addHandler(ch)
+
+    workers = args['workers']
+    if(workers < 1):
+        workers = multiprocessing.cpu_count()
+    profile = None
+    if(args['profile'] is not None):
+        try:
+            profile = loadProfile(args['profile'])
+        except (KeyError, FileNotFoundError) as e:
+            raise SystemExit('Cannot load detector profile: ' + str(e))
+    (results, elapsed) = runDetection(args['input'], detectorType=args['detector'], workers=workers, maxFrames=args['max_frames'], profile=profile)
+    writeResults(results, outputFile=args['output'], outputFormat=args['format'])
+    summary(results, elapsed, workers)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Unattended tool alignment without the GUI.
+# Aligns the requested tools against the printer and camera profiles in ./config/settings.json
+# and writes the resulting offsets and timings as JSON. No preview is rendered.
+import argparse, logging, sys, time
+import json
+
+from modules.AlignmentEngine import AlignmentEngine, AlignmentError, CameraSource, loadPrinterDriver
+from modules.Detector import loadProfile
+from modules.CalibrationEngine import cacheKey
+
+_logger = logging.getLogger('TAMV.Headless')
+
+settingsFile = './config/settings.json'
+
+# pick a profile by nickname, otherwise the default entry, otherwise the first one
+def selectProfile(entries, nickname=None):
+    if(nickname is not None):
+        for entry in entries:
+            try:
+                if(entry['nickname'] == nickname):
+                    return(entry)
+            except KeyError: continue
+        raise SystemExit('Printer profile not found: ' + str(nickname))
+    for entry in entries:
+        try:
+            if(entry['default'] == 1):
+                return(entry)
+        except KeyError: continue
+    return(entries[0])
+
+def parseTools(toolList, printerJSON=None):
+    if(toolList is None or toolList == 'all'):
+        try:
+            return([int(tool['number']) for tool in printerJSON['tools']])
+        except (KeyError, TypeError):
+            raise SystemExit('No tools defined for this printer, use --tools.')
+    return([int(tool) for tool in toolList.split(',') if tool.strip() != ''])
+
+if __name__ == "__main__":
+    ### Setup argmument parser
+    parser = argparse.ArgumentParser(
+        description="Align TAMV tools without the GUI and output offsets as JSON.",
+        allow_abbrev=False,
+    )
+    parser.add_argument("--printer", default=None, help="Printer nickname from settings.json (default: default printer)")
+    parser.add_argument("--address", default=None, help="Override the printer address")
+    parser.add_argument("--controller", default=None, help="Override the printer controller (RRF, Moonraker)")
+    parser.add_argument("--password", default=None, help="Override the printer password")
+    parser.add_argument("--tools", default=None, help="Comma-separated tool numbers (default: all tools in the printer profile)")
+    parser.add_argument("--cp-mode", choices=['endstop', 'current', 'coordinates', 'cached'], default='endstop', help="How to set the CP: automatic endstop detection, current position, --cp coordinates, or the CP from the last run (default: endstop)")
+    parser.add_argument("--cp", nargs='+', type=float, default=None, metavar='X Y [Z]', help="CP coordinates for --cp-mode coordinates")
+    parser.add_argument("--camera", default=None, help="Override the camera video source")
+    parser.add_argument("--width", type=int, default=None, help="Override the camera width")
+    parser.add_argument("--height", type=int, default=None, help="Override the camera height")
+    parser.add_argument("--profile", default=None, help="Named detector profile from ./config/detectors.json")
+    parser.add_argument("--pattern", choices=['star', 'chain', 'minimal'], default=None, help="Camera calibration pattern (default: camera setting, or star)")
+    parser.add_argument("--tolerance", type=float, default=None, help="Alignment tolerance in mm (default: camera setting, or half a pixel)")
+    parser.add_argument("--no-save", action="store_true", help="Do not save offsets to firmware (M500)")
+    parser.add_argument("--defer-offsets", action="store_true", help="Write all offsets in one batch once every tool is aligned (default: printer setting)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and do not update the cached camera calibration")
+    parser.add_argument("-o", "--output", default=None, help="Output file (default: stdout)")
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="Enable debug output to terminal"
+    )
+    # Execute argument parser
+    args = vars(parser.parse_args())
+
+    ### Setup logging (stderr, so results can be piped from stdout)
+    _logger = logging.getLogger("TAMV")
+    consoleFormatter = logging.Formatter(fmt="%(levelname)-9s: %(message)s")
+    ch = logging.StreamHandler(sys.stderr)
+    if args["debug"]:
+        _logger.setLevel(logging.DEBUG)
+    else:
+        _logger.setLevel(logging.INFO)
+    ch.setFormatter(consoleFormatter)
+    _logger.addHandler(ch)
+
+    try:
+        with open(settingsFile, 'r') as inputfile:
+            userSettings = json.load(inputfile)
+    except FileNotFoundError:
+        userSettings = {'printer': [{}], 'camera': [{'video_src': 0, 'display_width': '640', 'display_height': '480'}]}
+    printerJSON = dict(selectProfile(userSettings['printer'], args['printer']))
+    for key in ['address', 'controller', 'password']:
+        if(args[key] is not None):
+            printerJSON[key] = args[key]
+    cameraJSON = selectProfile(userSettings['camera'])
+    videoSrc = cameraJSON['video_src']
+    if(args['camera'] is not None):
+        videoSrc = args['camera']
+    if(len(str(videoSrc)) == 1 or str(videoSrc) == "-1"):
+        videoSrc = int(videoSrc)
+    width = int(cameraJSON['display_width']) if args['width'] is None else args['width']
+    height = int(cameraJSON['display_height']) if args['height'] is None else args['height']
+    profileName = args['profile']
+    if(profileName is None):
+        try:
+            profileName = cameraJSON['detector_profile']
+        except KeyError: profileName = None
+    profile = None
+    if(profileName is not None):
+        try:
+            profile = loadProfile(profileName)
+        except (KeyError, FileNotFoundError) as e:
+            raise SystemExit('Cannot load detector profile: ' + str(e))
+    pattern = args['pattern']
+    if(pattern is None):
+        try:
+            pattern = cameraJSON['calibration_pattern']
+        except KeyError: pattern = None
+    tolerance = args['tolerance']
+    if(tolerance is None):
+        try:
+            tolerance = float(cameraJSON['convergence_tolerance'])
+        except (KeyError, ValueError): tolerance = None
+    cpCoordinates = None
+    if(args['cp_mode'] == 'coordinates'):
+        if(args['cp'] is None or len(args['cp']) < 2):
+            raise SystemExit('--cp-mode coordinates requires --cp X Y [Z]')
+        cpCoordinates = {'X': args['cp'][0], 'Y': args['cp'][1]}
+        if(len(args['cp']) > 2):
+            cpCoordinates['Z'] = args['cp'][2]
+    tools = parseTools(args['tools'], printerJSON)
+    try:
+        rotated = int(printerJSON['rotated'])
+    except KeyError: rotated = 0
+    deferOffsets = args['defer_offsets']
+    if(not deferOffsets):
+        try:
+            deferOffsets = bool(int(printerJSON['defer_offsets']))
+        except (KeyError, ValueError): deferOffsets = False
+    calibrationKey = None
+    if(not args['no_cache']):
+        try:
+            calibrationKey = cacheKey(printerJSON['nickname'], videoSrc)
+        except KeyError: calibrationKey = None
+
+    startTime = time.time()
+    camera = None
+    try:
+        _logger.info('Connecting to printer at ' + str(printerJSON['address']) + '..')
+        printer = loadPrinterDriver(printerJSON)
+        connectTime = round(time.time() - startTime, 3)
+        camera = CameraSource(videoSrc=videoSrc, width=width, height=height)
+        engine = AlignmentEngine(printer, camera, detectorProfile=profile, rotated=rotated, pattern=pattern, calibrationKey=calibrationKey, tolerance=tolerance)
+        report = engine.run(tools, cpMode=args['cp_mode'], cpCoordinates=cpCoordinates, saveOffsets=not args['no_save'], deferOffsets=deferOffsets)
+        report['connectTime'] = connectTime
+    except (AlignmentError, KeyError) as e:
+        _logger.error(str(e))
+        report = {'error': str(e)}
+    except Exception as e:
+        _logger.exception(e)
+        report = {'error': str(e)}
+    finally:
+        if(camera is not None):
+            camera.release()
+    report['totalTime'] = round(time.time() - startTime, 3)
+
+    if(args['output'] is None):
+        json.dump(report, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    else:
+        with open(args['output'], 'w') as outputfile:
+            json.dump(report, outputfile, indent=4)
+    if('error' in report):
+        sys.exit(1)
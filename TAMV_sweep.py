@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# Nozzle detector parameter sweep over a labelled frame set.
+# Evaluates SimpleBlobDetector/preprocessing combinations in parallel worker processes,
+# ranks them by detection rate, centre error and latency, and exports the winner as a named detector profile.
+import argparse, logging, os, sys, time
+import csv, json, random, itertools
+import multiprocessing
+
+import cv2
+import numpy as np
+
+from modules.Detector import Detector, defaultProfile, mergeProfile, saveProfile, profileFile
+from TAMV_detect import imageExtensions
+
+_logger = logging.getLogger('TAMV.Sweep')
+
+# per-worker labelled frames, loaded once by the pool initializer
+_frames = []
+_tolerance = 2.0
+
+def _initWorker(frameSet, tolerance):
+    global _frames, _tolerance
+    _frames = []
+    for (name, path, label) in frameSet:
+        _frames.append((name, cv2.imread(path), label))
+    _tolerance = tolerance
+
+# evaluate one parameter combination over all labelled frames
+def _evaluate(job):
+    (index, settings) = job
+    result = {'index': index, 'settings': settings}
+    try:
+        detector = Detector(drawOverlay=False, profile=settingsProfile(settings))
+    except Exception as e:
+        result['error'] = str(e)
+        return(result)
+    detected = 0
+    errors = []
+    times = []
+    for (name, frame, label) in _frames:
+        if(frame is None):
+            continue
+        # every frame is analyzed on its own, so the detector cascade starts from scratch
+        detector.resetAlgorithm()
+        startTime = time.perf_counter()
+        try:
+            (center, frame, metrics) = detector.nozzleDetection(frame, autoDetection=True)
+        except cv2.error as e:
+            result['error'] = str(e)
+            return(result)
+        times.append(time.perf_counter() - startTime)
+        if(center[0] is None or center[1] is None):
+            continue
+        error = float(np.linalg.norm(np.array(center, dtype=float) - np.array(label, dtype=float)))
+        errors.append(error)
+        # detections outside the tolerance count as misses
+        if(error <= _tolerance):
+            detected += 1
+    frameCount = len(times)
+    if(frameCount == 0):
+        result['error'] = 'No frames evaluated.'
+        return(result)
+    result['detectionRate'] = round(detected/frameCount, 4)
+    if(len(errors) > 0):
+        result['meanError'] = round(float(np.mean(errors)), 3)
+    else:
+        result['meanError'] = None
+    # mean latency per frame, in milliseconds
+    result['latency'] = round(float(np.mean(times))*1000, 3)
+    return(result)
+
+# convert flat "section.parameter" settings into a detector profile
+def settingsProfile(settings):
+    profile = {'standard': {}, 'relaxed': {}, 'preprocessing': {}}
+    for (key, value) in settings.items():
+        (section, parameter) = key.split('.', 1)
+        if(section not in profile):
+            raise KeyError('Unknown profile section: ' + str(section))
+        profile[section][parameter] = value
+    return(mergeProfile(profile))
+
+# load frame labels (frame,u,v) from a CSV or JSON file, e.g. the output of TAMV_detect.py
+def loadLabels(labelFile):
+    if(labelFile.lower().endswith('.json')):
+        with open(labelFile, 'r') as inputfile:
+            rows = json.load(inputfile)
+    else:
+        with open(labelFile, 'r', newline='') as inputfile:
+            rows = list(csv.DictReader(inputfile))
+    labels = {}
+    for row in rows:
+        try:
+            labels[str(row['frame'])] = (float(row['u']), float(row['v']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return(labels)
+
+def loadFrameSet(folder, labelFile):
+    labels = loadLabels(labelFile)
+    frameSet = []
+    for name in sorted(os.listdir(folder)):
+        if(not name.lower().endswith(imageExtensions)):
+            continue
+        try:
+            frameSet.append((name, os.path.join(folder, name), labels[name]))
+        except KeyError:
+            _logger.debug('No label for frame ' + name + ', skipping.')
+    return(frameSet)
+
+# search space file: {"standard.minArea": [300, 400, 500], "preprocessing.gamma": {"min": 1.0, "max": 1.5}}
+def loadSearchSpace(spaceFile):
+    with open(spaceFile, 'r') as inputfile:
+        space = json.load(inputfile)
+    for key in space:
+        try:
+            (section, parameter) = key.split('.', 1)
+            defaultProfile[section][parameter]
+        except (ValueError, KeyError, TypeError):
+            raise SystemExit('Unknown search parameter: ' + str(key) + ' (expected section.parameter)')
+    return(space)
+
+def gridCombinations(space):
+    keys = list(space.keys())
+    values = []
+    for key in keys:
+        if(isinstance(space[key], dict)):
+            raise SystemExit('Ranges are only supported with --random: ' + str(key))
+        values.append(space[key])
+    for combination in itertools.product(*values):
+        yield(dict(zip(keys, combination)))
+
+def randomCombinations(space, count, seed=None):
+    generator = random.Random(seed)
+    for i in range(count):
+        settings = {}
+        for (key, value) in space.items():
+            if(isinstance(value, dict)):
+                if(isinstance(value['min'], int) and isinstance(value['max'], int)):
+                    settings[key] = generator.randint(value['min'], value['max'])
+                else:
+                    settings[key] = round(generator.uniform(value['min'], value['max']), 4)
+            else:
+                settings[key] = generator.choice(value)
+        yield(settings)
+
+# rank by detection rate, then centre error, then latency
+def rankKey(result):
+    meanError = result['meanError']
+    if(meanError is None):
+        meanError = float('inf')
+    return((-result['detectionRate'], meanError, result['latency']))
+
+def runSweep(frameSet, combinations, workers=None, tolerance=2.0):
+    if(workers is None or workers < 1):
+        workers = multiprocessing.cpu_count()
+    results = []
+    failed = []
+    jobs = enumerate(combinations)
+    with multiprocessing.Pool(processes=workers, initializer=_initWorker, initargs=(frameSet, tolerance)) as pool:
+        for result in pool.imap_unordered(_evaluate, jobs):
+            if('error' in result):
+                failed.append(result)
+            else:
+                results.append(result)
+    results.sort(key=rankKey)
+    return(results, failed)
+
+if __name__ == "__main__":
+    ### Setup argmument parser
+    parser = argparse.ArgumentParser(
+        description="Sweep TAMV nozzle detector parameters over a labelled frame set.",
+        allow_abbrev=False,
+    )
+    parser.add_argument("input", help="Labelled image folder")
+    parser.add_argument("space", help="Search space JSON file")
+    parser.add_argument("--labels", default=None, help="Label file with frame,u,v columns, CSV or JSON (default: <input>/labels.csv)")
+    parser.add_argument("--random", type=int, default=0, help="Evaluate this many random combinations instead of the full grid")
+    parser.add_argument("--seed", type=int, default=None, help="Random search seed")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="Maximum centre error (pixels) for a correct detection (default: 2)")
+    parser.add_argument("--workers", type=int, default=0, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--top", type=int, default=10, help="Number of ranked results to show")
+    parser.add_argument("-o", "--output", default=None, help="Write all ranked results to this JSON file")
+    parser.add_argument("--export", default=None, help="Save the winning combination as a detector profile with this name")
+    parser.add_argument("--profiles", default=profileFile, help="Detector profiles file (default: " + profileFile + ")")
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="Enable debug output to terminal"
+    )
+    # Execute argument parser
+    args = vars(parser.parse_args())
+
+    ### Setup logging
+    _logger = logging.getLogger("TAMV")
+    consoleFormatter = logging.Formatter(fmt="%(levelname)-9s: %(message)s")
+    ch = logging.StreamHandler(sys.stderr)
+    if args["debug"]:
+        _logger.setLevel(logging.DEBUG)
+    else:
+        _logger.setLevel(logging.INFO)
+    ch.setFormatter(consoleFormatter)
+    _logger.addHandler(ch)
+
+    labelFile = args['labels']
+    if(labelFile is None):
+        labelFile = os.path.join(args['input'], 'labels.csv')
+    frameSet = loadFrameSet(args['input'], labelFile)
+    if(len(frameSet) == 0):
+        raise SystemExit('No labelled frames found.')
+    space = loadSearchSpace(args['space'])
+    if(args['random'] > 0):
+        combinations = list(randomCombinations(space, args['random'], seed=args['seed']))
+    else:
+        combinations = list(gridCombinations(space))
+    _logger.info('Evaluating ' + str(len(combinations)) + ' combinations over ' + str(len(frameSet)) + ' frames..')
+    startTime = time.perf_counter()
+    (results, failed) = runSweep(frameSet, combinations, workers=args['workers'], tolerance=args['tolerance'])
+    _logger.info('Sweep finished in ' + str(round(time.perf_counter() - startTime, 1)) + 's')
+    if(len(failed) > 0):
+        _logger.warning(str(len(failed)) + ' combinations failed to run.')
+        for result in failed:
+            _logger.debug(str(result['settings']) + ': ' + result['error'])
+    if(len(results) == 0):
+        raise SystemExit('No valid combinations.')
+
+    # ranked results table
+    print('rank,detectionRate,meanError,latency,settings')
+    for (rank, result) in enumerate(results[:args['top']]):
+        print(str(rank+1) + ',' + str(result['detectionRate']) + ',' + str(result['meanError']) + ',' + str(result['latency']) + ',"' + json.dumps(result['settings']).replace('"', "'") + '"')
+    if(args['output'] is not None):
+        with open(args['output'], 'w') as outputfile:
+            json.dump({'ranked': results, 'failed': failed}, outputfile, indent=4)
+    if(args['export'] is not None):
+        saveProfile(args['export'], settingsProfile(results[0]['settings']), filename=args['profiles'])
+        _logger.info('Saved detector profile "' + args['export'] + '" to ' + args['profiles'])
@@ -280,6 +280,32 @@ class printerAPI:
             _logger.critical( "setToolOffsets unhandled exception: " + str(e) )
             raise SystemExit( "setToolOffsets unhandled exception: " + str(e) )
 
+    #################################################################################################################################
+    # OPTIONAL: set tool offsets for several tools, and optionally save them, in a single request.
+    # Without this function TAMV calls setToolOffsets for each tool and then saveOffsetsToFirmware.
+    # Parameters:
+    #   - toolOffsets (dict): { toolIndex: { 'X': 0.000, 'Y': 0.000, 'Z': 0.000 } }, axes may be omitted
+    #   - save (boolean): save offsets to firmware in the same request
+    #
+    # Returns: NONE
+    #
+    # Raises: 
+    #   - SetOffsetException: when failed to set offsets in controller
+    def setToolOffsetsBatch( self, toolOffsets=None, save=False ):
+        _logger.debug('Called setToolOffsetsBatch')
+        try:
+            if( toolOffsets is None or len(toolOffsets) == 0 ):
+                raise SetOffsetException( "No offsets provided." )
+            ##############*** YOUR CUSTOM CODE #################
+            ##############*** YOUR CUSTOM CODE #################
+            _logger.debug( "Tool offsets applied.")
+        except SetOffsetException as se:
+            _logger.error(se)
+            return
+        except Exception as e:
+            _logger.critical( "setToolOffsetsBatch unhandled exception: " + str(e) )
+            raise SystemExit( "setToolOffsetsBatch unhandled exception: " + str(e) )
+
     #################################################################################################################################
     # Helper function to check if machine is idle or not
     # Parameters: NONE
@@ -474,6 +500,37 @@ class printerAPI:
             raise SystemExit(errorString + "\n" + str(e))
         return
 
+    #################################################################################################################################
+    # OPTIONAL: execute a sequence of single-axis moves in a single request, and wait once for the machine to finish.
+    # Without this function TAMV calls moveAbsolute/moveRelative for each axis.
+    #
+    # Parameters:
+    #   - moves (list): ordered (axis, position) pairs, e.g. [('Y', 100.0), ('X', 50.0), ('Z', 10.0)]
+    #   - moveSpeed (float): speed at which to execute the moves in feedrate/min (typically in mm/min)
+    #   - relative (boolean): positions are relative to the current position
+    #   - rapidMove (boolean): enable rapid moves
+    #
+    # Returns: NONE
+    #
+    # Raises: NONE
+    def moveSequence( self, moves=None, moveSpeed=1000, relative=False, rapidMove=False ):
+        _logger.debug('Called moveSequence')
+        try:
+            # check if machine has been homed fully
+            if( self.isHomed() is False ):
+                raise HomingException("Machine axes have not been homed properly.")
+            
+            ##############*** YOUR CUSTOM CODE #################
+            ##############*** YOUR CUSTOM CODE #################
+
+        except HomingException as he:
+            _logger.error( he )
+        except Exception as e:
+            errorString = "Move sequence failed: " + str(moves) + " at speed: " + str(moveSpeed)
+            _logger.critical(errorString + str(e) )
+            raise SystemExit(errorString + "\n" + str(e))
+        return
+
     #################################################################################################################################
     # Limit machine movement to within predefined boundaries as per machine-specific configuration.
     #
@@ -1,7 +1,8 @@
 # Python Script containing a class to send commands to, and query specific information from,
 #   Duet based printers running either Duet RepRap V2 or V3 firmware.
 #
-# Does NOT hold open the connection.  Use for low-volume requests.
+# Holds the controller session open between requests and only reconnects when it has expired
+# or the controller rejects it.
 # Does NOT, at this time, support Duet passwords.
 #
 # Not intended to be a gerneral purpose interface; instead, it contains methods
@@ -28,7 +29,9 @@ from urllib.parse import urlparse
 import socket
 # import dependencies
 import json
+import math
 import time
+import threading
 
 # invoke parent (TAMV) _logger
 _logger = logging.getLogger('TAMV.DuetWebAPI')
@@ -113,6 +116,26 @@ class printerAPI:
     _responseTimeout = 5
     # flag to indicate if machine has been homed or not
     _homed = None
+    # Session handling: the controller drops a session after 8 seconds without requests,
+    # reconnect before that (in seconds)
+    _sessionTimeout = 6
+    # time of the last request in the open session, None when there is no session
+    _sessionTime = None
+    # connect handshakes sent, and handshakes saved by reusing the open session
+    _sessionConnects = 0
+    _sessionReused = 0
+    # Object model queries (rr_model), None until the first query tells if the firmware supports them
+    _modelQueries = None
+    # axis letters in object model order, live model queries do not include them
+    _axisLetters = None
+    # Adaptive move polling
+    # acceleration used to estimate move durations when the controller does not report it (in mm/s^2)
+    _acceleration = 1000
+    # correction factor for move duration estimates, learned from observed completion times
+    _moveTimeFactor = 1.0
+    # interval between status polls once the estimated move time has passed, doubling up to the maximum (in seconds)
+    _pollInterval = 0.02
+    _pollIntervalMax = 0.3
     # Tools
     _tools = []
 
@@ -143,6 +166,9 @@ class printerAPI:
         self._password = password
         self._nickname = nickname
         self._tools = []
+        # axis accelerations reported by the controller, and last known position for move time estimates
+        self._accelerations = {}
+        self._movePosition = {}
         # Name as defined in RRF config.g file
         self._name = 'My Duet'
         # set up session parameters
@@ -150,6 +176,8 @@ class printerAPI:
         self.retry = Retry(connect=3, backoff_factor=0.4)
         self.adapter = HTTPAdapter(max_retries=self.retry)
         self.session.mount('http://', self.adapter)
+        # commands and queries may run on different threads
+        self._sessionLock = threading.Lock()
         try:
             # check if its a Duet 2 board
             # Set up session using password
@@ -168,6 +196,9 @@ class printerAPI:
             # Send reply to clear buffer
             replyURL = (f'{self._base_url}'+'/rr_reply')
             r = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
+            if(self._password != "reprap"):
+                self._sessionConnects += 1
+                self._sessionTime = time.time()
             
             # Get machine name
             self._name = j['name']
@@ -208,9 +239,11 @@ class printerAPI:
                 r_obj = json.loads(r.text)
                 self._sessionKey = r_obj['sessionKey']
                 self.session.headers = {'X-Session-Key': self._sessionKey }
+                self._sessionConnects += 1
                 
                 URL=(f'{self._base_url}'+'/machine/status')
                 r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                self._sessionTime = time.time()
                 _logger.debug('Got reply, parsing again..')
                 j = json.loads(r.text)
                 _=j
@@ -248,6 +281,119 @@ class printerAPI:
             _logger.critical('DuetWebAPI2 Init: ' + str(e))
             raise Exception('DuetWebAPI Init: ' + str(e))
 
+    #################################################################################################################################
+    # Open a session with the controller, or keep using the open one
+    # RRF2 boards only need a session when a password is set; Duet 3 (SBC) boards always need a session key.
+    # Parameters:
+    #   - force (boolean): reconnect even if the open session has not expired
+    #
+    # Returns: NONE
+    #
+    # Raises: NONE
+    def connect(self, force=False):
+        with self._sessionLock:
+            if(self.pt == 2 and self._password == "reprap"):
+                return
+            if(not force and self._sessionTime is not None and (time.time() - self._sessionTime) < self._sessionTimeout):
+                self._sessionReused += 1
+                return
+            if(self.pt == 2):
+                _logger.debug('Starting DuetWebAPI session..')
+                URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
+                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+            else:
+                # Set up session using password
+                URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
+                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                # Get session key
+                r_obj = json.loads(r.text)
+                self._sessionKey = r_obj['sessionKey']
+                self.session.headers = {'X-Session-Key': self._sessionKey }
+            self._sessionConnects += 1
+            if(r.ok):
+                self._sessionTime = time.time()
+            else:
+                _logger.warning('Could not start DuetWebAPI session: ' + str(r.status_code) + ' - ' + str(r.reason))
+                self._sessionTime = None
+
+    #################################################################################################################################
+    # Send a request in the open session, reconnecting once if the controller rejected the session
+    # Parameters:
+    #   - URL (string): full request URL
+    #   - data (string): request body, sends a POST without response timeout (Duet 3 codes reply when they finish)
+    #
+    # Returns: requests.Response
+    #
+    # Raises: NONE
+    def _request(self, URL, data=None):
+        for attempt in range(2):
+            if(data is None):
+                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+            else:
+                r = self.session.post(URL, data=data)
+            if(r.status_code not in (401, 403) or attempt > 0 or (self.pt == 2 and self._password == "reprap")):
+                break
+            _logger.debug('DuetWebAPI session rejected, reconnecting..')
+            self.connect(force=True)
+        if(self._sessionTime is not None and r.ok):
+            # every request keeps the session alive
+            self._sessionTime = time.time()
+        return(r)
+
+    #################################################################################################################################
+    # Get session statistics
+    # Parameters:
+    #   - NONE
+    #
+    # Returns: dictionary
+    #   - connects: connect handshakes sent to the controller
+    #   - requestsSaved: handshakes saved by reusing the open session
+    #
+    # Raises: NONE
+    def getSessionStats(self):
+        return({'connects': self._sessionConnects, 'requestsSaved': self._sessionReused})
+
+    #################################################################################################################################
+    # Query a single key of the object model instead of downloading the full machine status
+    # Only Duet 2 / Duet 3 boards running RRF v3 in standalone mode answer rr_model requests.
+    # Parameters:
+    #   - key (string): object model key, e.g. 'state.status', 'move.axes', 'tools'
+    #   - flags (string): rr_model flags, defaults to full depth with verbose output and null entries
+    #
+    # Returns:
+    #   - the value of the key
+    #   - None if the query failed or the firmware does not support object model queries, the caller falls back to the full status
+    #
+    # Raises: NONE
+    #
+    # Callers must call connect() first, so the session reuse count is per driver call.
+    def queryModel(self, key, flags='d99vn'):
+        if(self.pt != 2 or self._rrf2 or self._modelQueries is False):
+            return(None)
+        # callers open the session
+        URL=(f'{self._base_url}'+'/rr_model?key=' + key + '&flags=' + flags)
+        r = self._request(URL)
+        unsupported = (r.status_code == 404)
+        try:
+            if(not r.ok):
+                raise ValueError(str(r.status_code) + ' - ' + str(r.reason))
+            j = json.loads(r.text)
+            if('result' not in j):
+                unsupported = True
+                raise ValueError('no result in reply')
+            result = j['result']
+        except ValueError as e:
+            # only a firmware that never answered a query is treated as not supporting them,
+            # other failures (busy, bad reply) fall back to the full status for this call only
+            if(unsupported and self._modelQueries is None):
+                _logger.debug('Object model queries not supported, using full status: ' + str(e))
+                self._modelQueries = False
+            else:
+                _logger.debug('Object model query failed, using full status: ' + str(e))
+            return(None)
+        self._modelQueries = True
+        return(result)
+
     #################################################################################################################################
     # Get firmware version
     # Parameters: 
@@ -322,39 +468,35 @@ class printerAPI:
         _logger.debug('Called getCurrentTool')
         try:
             if (self.pt == 2):
-                # Start a connection
-                if(self._password != "reprap"):
-                    _logger.debug('Starting DuetWebAPI session..')
-                    URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-                    r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                # Start a connection, or reuse the open session
+                self.connect()
 
                 # Wait for machine to be in idle state
                 while self.getStatus() not in "idle":
                     _logger.debug('Machine not idle, sleeping 0.5 seconds.')
                     time.sleep(0.5)
+                ret = self.queryModel('state.currentTool')
+                if(ret is not None):
+                    _logger.debug('Found current tool: ' + str(ret))
+                    return(ret)
                 # Fetch machine data
                 URL=(f'{self._base_url}'+'/rr_status?type=2')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 j = json.loads(r.text)
                 ret=j['currentTool']
 
                 # Send reply to clear buffer
                 replyURL = (f'{self._base_url}'+'/rr_reply')
-                r = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(replyURL)
 
                 _logger.debug('Found current tool: ' + str(ret))
                 return(ret)
             elif (self.pt == 3):
-                # Set up session using password
-                URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                # Get session key
-                r_obj = json.loads(r.text)
-                self._sessionKey = r_obj['sessionKey']
-                self.session.headers = {'X-Session-Key': self._sessionKey }
+                # Set up session using password, or reuse the open session
+                self.connect()
 
                 URL=(f'{self._base_url}'+'/machine/status')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 j = json.loads(r.text)
                 if 'result' in j: j = j['result']
                 ret=j['state']['currentTool']
@@ -392,16 +534,11 @@ class printerAPI:
         _logger.debug('Called getToolOffset: ' + str(toolIndex))
         try:
             if (self.pt == 3):
-                # Set up session using password
-                URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                # Get session key
-                r_obj = json.loads(r.text)
-                self._sessionKey = r_obj['sessionKey']
-                self.session.headers = {'X-Session-Key': self._sessionKey }
+                # Set up session using password, or reuse the open session
+                self.connect()
 
                 URL=(f'{self._base_url}'+'/machine/status')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 j = json.loads(r.text)
                 if 'result' in j: j = j['result']
                 ja=j['move']['axes']
@@ -413,14 +550,20 @@ class printerAPI:
                 _logger.debug('Tool offset for T' + str(toolIndex) +': ' + str(ret))
                 return(ret)
             elif (self.pt == 2):
-                # Start a connection
-                if(self._password != "reprap"):
-                    _logger.debug('Starting DuetWebAPI session..')
-                    URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-                    r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-
+                # Start a connection, or reuse the open session
+                self.connect()
+
+                jt = self.queryModel('tools')
+                if(jt is not None):
+                    ret=json.loads('{}')
+                    for currentTool in jt:
+                        if(currentTool is not None and currentTool['number'] == int(toolIndex)):
+                            for (axis, offset) in zip(['X', 'Y', 'Z', 'U'], currentTool['offsets']):
+                                ret[axis] = offset
+                    _logger.debug('Tool offset for T' + str(toolIndex) +': ' + str(ret))
+                    return(ret)
                 URL=(f'{self._base_url}'+'/rr_status?type=2')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 j = json.loads(r.text)
                 ja=j['axisNames']
                 jt=j['tools']
@@ -440,7 +583,7 @@ class printerAPI:
                 
                 # Send reply to clear buffer
                 replyURL = (f'{self._base_url}'+'/rr_reply')
-                r = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(replyURL)
 
                 return(ret)
             else:
@@ -476,27 +619,23 @@ class printerAPI:
         _logger.debug('Called getStatus')
         try:
             if (self.pt == 2):
-                # Start a connection
-                if(self._password != "reprap"):
-                    _logger.debug('Starting DuetWebAPI session..')
-                    URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-                    r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-
-                URL=(f'{self._base_url}'+'/rr_status')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                j = json.loads(r.text)
-                _status=j['status']
+                # Start a connection, or reuse the open session
+                self.connect()
+
+                _status = self.queryModel('state.status', flags='d99f')
+                if(_status is not None):
+                    _status = str(_status).lower()
+                else:
+                    URL=(f'{self._base_url}'+'/rr_status')
+                    r = self._request(URL)
+                    j = json.loads(r.text)
+                    _status=j['status']
             elif (self.pt == 3):
-                # Set up session using password
-                URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                # Get session key
-                r_obj = json.loads(r.text)
-                self._sessionKey = r_obj['sessionKey']
-                self.session.headers = {'X-Session-Key': self._sessionKey }
+                # Set up session using password, or reuse the open session
+                self.connect()
 
                 URL=(f'{self._base_url}'+'/machine/status')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 j = json.loads(r.text)
                 if 'result' in j: 
                     j = j['result']
@@ -510,17 +649,7 @@ class printerAPI:
             # replyURL = (f'{self._base_url}'+'/rr_reply')
             # r = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
 
-            # OUTPUT MAPPING LOGIC
-            # Handle return mapping of status variable "_status"
-            if (_status == "idle" or _status == "I"):
-                _logger.debug("Machine is idle.")
-                return ("idle")
-            elif (_status == "paused" or _status == "S" or _status == "pausing" or _status == "D"):
-                _logger.debug("Machine is paused.")
-                return ("paused")
-            else:
-                _logger.debug("Machine is busy processing something.")
-                return ("processing")
+            return(self._mapStatus(_status))
         except ConnectTimeoutError:
             errorMsg = 'getStatus: Connection timed out.'
             _logger.error(errorMsg)
@@ -536,74 +665,116 @@ class printerAPI:
             raise Exception(e1)
 
     #################################################################################################################################
-    # Get current tool coordinates from machine in XYZ space
+    # Map any controller status output into 1 of 3 possible states
+    # Parameters:
+    #   - _status (string): status reported by the controller (RRF2 status letter or RRF3 status name)
+    #
+    # Returns: string of following values ONLY
+    #   - idle
+    #   - processing
+    #   - paused
+    #
+    # Raises: NONE
+    def _mapStatus(self, _status):
+        # OUTPUT MAPPING LOGIC
+        # Handle return mapping of status variable "_status"
+        if (_status == "idle" or _status == "I"):
+            _logger.debug("Machine is idle.")
+            return ("idle")
+        elif (_status == "paused" or _status == "S" or _status == "pausing" or _status == "D"):
+            _logger.debug("Machine is paused.")
+            return ("paused")
+        else:
+            _logger.debug("Machine is busy processing something.")
+            return ("processing")
+
+    #################################################################################################################################
+    # Get machine status and current tool coordinates from a single controller response
     # Parameters:
     #   - NONE
     #
-    # Returns: 
-    #   - tuple of floats: { 'X': 0.000 , 'Y': 0.000 , 'Z': 0.000 }
+    # Returns:
+    #   - tuple: (status, coordinates)
+    #       - status (string): idle, processing or paused (see getStatus)
+    #       - coordinates (dictionary of floats): { 'X': 0.000 , 'Y': 0.000 , 'Z': 0.000 }
     #
-    # Raises: 
+    # Raises:
+    #   - ConnectionError: when the controller rejects the request
     #   - CoordinatesException: when cannot determine machine status
-    def getCoordinates(self):
-        _logger.debug('*** Called getCoordinates')
-        try:
-            if (self.pt == 2):
-                # Start a connection
-                if(self._password != "reprap"):
-                    _logger.debug('Starting DuetWebAPI session..')
-                    URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-                    r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-
-                # poll machine for coordinates
-                while self.getStatus() not in "idle":
-                    _logger.debug('moveAbsolute: sleeping 0.3 seconds..')
-                    time.sleep(0.3)
-                
+    def getStatusAndCoordinates(self):
+        ret=json.loads('{}')
+        if (self.pt == 2):
+            # Start a connection, or reuse the open session
+            self.connect()
+
+            # live values of the object model: status and axis positions, but no axis letters
+            if(self._axisLetters is None and self._modelQueries is not False):
+                axes = self.queryModel('move.axes')
+                if(axes is not None):
+                    self._axisLetters = [axis['letter'] for axis in axes]
+                    self._readAccelerations(axes)
+            live = None
+            if(self._axisLetters is not None):
+                live = self.queryModel('', flags='d99fn')
+            if(live is not None):
+                _status = str(live['state']['status']).lower()
+                for (letter, axis) in zip(self._axisLetters, live['move']['axes']):
+                    ret[ letter ] = axis['userPosition']
+            else:
                 URL=(f'{self._base_url}'+'/rr_status?type=2')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 if not r.ok:
                     raise ConnectionError('Error in getCoordinates session 2: ' + str(r))
                 j = json.loads(r.text)
+                _status=j['status']
                 jc=j['coords']['xyz']
                 an=j['axisNames']
-                ret=json.loads('{}')
                 for i in range(0,len(jc)):
                     ret[ an[i] ] = jc[i]
-                
-                # Send reply to clear buffer
-                #replyURL = (f'{self._base_url}'+'/rr_reply')
-                #r = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
-                _logger.debug('*** exiting getCoordinates')
-                return(ret)
-            elif (self.pt == 3):
-                while self.getStatus() not in "idle":
-                    _logger.debug('XX - printer not idle _SLEEPING_')
-                    time.sleep(0.5)
-                # Set up session using password
-                URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                # Get session key
-                r_obj = json.loads(r.text)
-                self._sessionKey = r_obj['sessionKey']
-                self.session.headers = {'X-Session-Key': self._sessionKey }
+        elif (self.pt == 3):
+            # Set up session using password, or reuse the open session
+            self.connect()
+
+            URL=(f'{self._base_url}'+'/machine/status')
+            r = self._request(URL)
+            if not r.ok:
+                raise ConnectionError('Error in getCoordinates session 3: ' + str(r))
+            j = json.loads(r.text)
+            if 'result' in j: j = j['result']
+            _status = str(j['state']['status']).lower()
+            ja=j['move']['axes']
+            self._readAccelerations(ja)
+            for i in range(0,len(ja)):
+                ret[ ja[i]['letter'] ] = ja[i]['userPosition']
+        else:
+            #unknown error, raise exception
+            raise CoordinatesException("Unknown duet controller.")
+        return(self._mapStatus(_status), ret)
 
-                URL=(f'{self._base_url}'+'/machine/status')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                if not r.ok:
-                    raise ConnectionError('Error in getCoordinates session 3: ' + str(r))
-                j = json.loads(r.text)
-                if 'result' in j: j = j['result']
-                ja=j['move']['axes']
-                ret=json.loads('{}')
-                for i in range(0,len(ja)):
-                    ret[ ja[i]['letter'] ] = ja[i]['userPosition']
-                _logger.debug('Returning coordinates: ' + str(ret))
-                _logger.debug('*** exiting getCoordinates')
-                return(ret)
-            else:
-                #unknown error, raise exception
-                raise CoordinatesException("Unknown duet controller.")
+    #################################################################################################################################
+    # Get current tool coordinates from machine in XYZ space, once the machine is idle
+    # Status and coordinates are read from the same response, so every poll is a single request.
+    # Parameters:
+    #   - NONE
+    #
+    # Returns: 
+    #   - tuple of floats: { 'X': 0.000 , 'Y': 0.000 , 'Z': 0.000 }
+    #
+    # Raises: 
+    #   - CoordinatesException: when cannot determine machine status
+    def getCoordinates(self):
+        _logger.debug('*** Called getCoordinates')
+        try:
+            # poll machine for coordinates
+            (status, ret) = self.getStatusAndCoordinates()
+            while status not in "idle":
+                _logger.debug('getCoordinates: machine not idle, sleeping 0.3 seconds..')
+                time.sleep(0.3)
+                (status, ret) = self.getStatusAndCoordinates()
+            self._movePosition.update(ret)
+            _logger.debug('Returning coordinates: ' + str(ret))
+            _logger.debug('*** exiting getCoordinates')
+            return(ret)
         except ConnectTimeoutError:
             errorMsg = 'getCoordinates: Connection timed out.'
             _logger.error(errorMsg)
@@ -661,6 +832,47 @@ class printerAPI:
             _logger.critical("setToolOffsets unhandled exception: " + str(e))
             raise Exception("setToolOffsets unhandled exception: " + str(e))
 
+    #################################################################################################################################
+    # Set tool offsets for several tools, and optionally save them, in a single G-code request
+    # Parameters:
+    #   - toolOffsets (dict): { toolIndex: { 'X': 0.000, 'Y': 0.000, 'Z': 0.000 } }, axes may be omitted
+    #   - save (boolean): save offsets to firmware (M500 P10) in the same request
+    #
+    # Returns: NONE
+    #
+    # Raises: 
+    #   - SetOffsetException: when failed to set offsets in controller
+    def setToolOffsetsBatch(self, toolOffsets=None, save=False):
+        _logger.debug('Called setToolOffsetsBatch: ' + str(toolOffsets))
+        try:
+            commands = []
+            for (tool, offsets) in toolOffsets.items():
+                offsetCommand = "G10 P" + str(int(tool))
+                for axis in ['X', 'Y', 'Z']:
+                    try:
+                        if(offsets[axis] is not None):
+                            offsetCommand += " " + axis + str(offsets[axis])
+                    except KeyError: pass
+                commands.append(offsetCommand)
+            if(save):
+                commands.append("M500 P10")
+            if(len(commands) == 0):
+                raise SetOffsetException("No offsets provided.")
+            # RRF runs the lines of a single request in order
+            _logger.debug(commands)
+            self.gCode("\n".join(commands))
+            _logger.debug("Tool offsets applied.")
+        except ConnectTimeoutError:
+            errorMsg = 'setToolOffsetsBatch: Connection timed out.'
+            _logger.error(errorMsg)
+            raise Exception(errorMsg)
+        except SetOffsetException as se:
+            _logger.error('DuetWebAPI setToolOffsetsBatch: ' + str(se))
+            return
+        except Exception as e:
+            _logger.critical("setToolOffsetsBatch unhandled exception: " + str(e))
+            raise Exception("setToolOffsetsBatch unhandled exception: " + str(e))
+
     #################################################################################################################################
     # Helper function to check if machine is idle or not
     # Parameters: NONE
@@ -688,36 +900,34 @@ class printerAPI:
             if (self.pt == 2):
                 # Duet RRF v2
 
-                # Start a connection
-                if(self._password != "reprap"):
-                    _logger.debug('Starting DuetWebAPI session..')
-                    URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-                    r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-
-                URL=(f'{self._base_url}'+'/rr_status?type=2')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                j = json.loads(r.text)
-                axesList=j['coords']['axesHomed']
-                for axis in axesList:
-                    if(axis == 0):
-                        machineHomed = False
-                    else:
-                        pass
-                # Send reply to clear buffer
-                replyURL = (f'{self._base_url}'+'/rr_reply')
-                r = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
+                # Start a connection, or reuse the open session
+                self.connect()
+
+                axes = self.queryModel('move.axes')
+                if(axes is not None):
+                    for axis in axes:
+                        if(axis['homed'] is False):
+                            machineHomed = False
+                else:
+                    URL=(f'{self._base_url}'+'/rr_status?type=2')
+                    r = self._request(URL)
+                    j = json.loads(r.text)
+                    axesList=j['coords']['axesHomed']
+                    for axis in axesList:
+                        if(axis == 0):
+                            machineHomed = False
+                        else:
+                            pass
+                    # Send reply to clear buffer
+                    replyURL = (f'{self._base_url}'+'/rr_reply')
+                    r = self._request(replyURL)
             elif (self.pt == 3):
                 # Duet RRF v3
-                # Set up session using password
-                URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                # Get session key
-                r_obj = json.loads(r.text)
-                self._sessionKey = r_obj['sessionKey']
-                self.session.headers = {'X-Session-Key': self._sessionKey }
+                # Set up session using password, or reuse the open session
+                self.connect()
 
                 URL=(f'{self._base_url}'+'/machine/status')
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 j = json.loads(r.text)
                 axesList=j['move']['axes']
                 for axis in axesList[0:3]:
@@ -760,6 +970,8 @@ class printerAPI:
             # Send command to controller to load tool specified by parameter
             _requestedTool = int(toolIndex)
             self.gCode("T" + str(_requestedTool))
+            # tool change macros move the machine
+            self._movePosition = {}
             # Wait until machine is done loading tool and is idle
             while not self.isIdle() and toolchangeTimer <= self._toolTimeout:
                 self._toolTimeout += 2
@@ -804,6 +1016,8 @@ class printerAPI:
         try:
             # Send command to controller to unload all tools
             self.gCode("T-1")
+            # tool change macros move the machine
+            self._movePosition = {}
             # Wait until machine is done loading tool and is idle
             while not self.isIdle() and toolchangeTimer <= self._toolTimeout:
                 self._toolTimeout += 2
@@ -866,10 +1080,9 @@ class printerAPI:
             moveCommand += " G90"
             _logger.debug(moveCommand)
             # Send command to machine
+            estimate = self.estimateMoveTime([{'X': X, 'Y': Y, 'Z': Z}], moveSpeed, relative=True)
             self.gCode(moveCommand)
-            while self.getStatus() not in "idle":
-                _logger.debug('moveRelative: sleeping 0.3 seconds..')
-                time.sleep(0.3)
+            self.waitForMove(estimate)
         except ConnectTimeoutError:
             errorMsg = 'moveRelative: Connection timed out.'
             _logger.error(errorMsg)
@@ -932,10 +1145,9 @@ class printerAPI:
             moveCommand += " G90"
             _logger.debug(moveCommand)
             # Send command to machine
+            estimate = self.estimateMoveTime([{'X': X, 'Y': Y, 'Z': Z}], moveSpeed)
             self.gCode(moveCommand)
-            while self.getStatus() not in "idle":
-                _logger.debug('moveAbsolute: sleeping 0.3 seconds..')
-                time.sleep(0.3)
+            self.waitForMove(estimate)
         except ConnectTimeoutError:
             errorMsg = 'moveAbsolute: Connection timed out.'
             _logger.error(errorMsg)
@@ -959,6 +1171,156 @@ class printerAPI:
             raise Exception(errorString + "\n" + str(e))
         return
 
+    #################################################################################################################################
+    # Execute a sequence of single-axis moves in a single G-code request, and wait once for the machine to finish.
+    # The moves run in the order given, so a tool can clear obstacles on one axis before moving on the next.
+    #
+    # Parameters:
+    #   - moves (list): ordered (axis, position) pairs, e.g. [('Y', 100.0), ('X', 50.0), ('Z', 10.0)]
+    #   - moveSpeed (float): speed at which to execute the moves in feedrate/min (typically in mm/min)
+    #   - relative (boolean): positions are relative to the current position (G91)
+    #   - rapidMove (boolean): enable G0 commands instead of G1
+    #
+    # Returns: NONE
+    #
+    # Raises: 
+    #   - Exception: when the moves failed
+    def moveSequence(self, moves=None, moveSpeed=1000, relative=False, rapidMove=False):
+        _logger.debug('Called moveSequence: ' + str(moves))
+        if(moves is None or len(moves) == 0):
+            return
+        try:
+            # check if machine has been homed fully
+            if(self.isHomed() is False):
+                raise HomingException("Machine axes have not been homed properly.")
+            if(relative is True):
+                commands = ["G91"]
+            else:
+                commands = ["G90"]
+            if(rapidMove is True):
+                moveCommand = "G0 "
+            else:
+                moveCommand = "G1 "
+            for (axis, position) in moves:
+                commands.append(moveCommand + str(axis) + str(position) + " F" + str(moveSpeed))
+            # return to absolute positioning
+            commands.append("G90")
+            _logger.debug(commands)
+            estimate = self.estimateMoveTime([{axis: position} for (axis, position) in moves], moveSpeed, relative=relative)
+            # RRF runs the lines of a single request in order
+            self.gCode("\n".join(commands))
+            self.waitForMove(estimate)
+        except ConnectTimeoutError:
+            errorMsg = 'moveSequence: Connection timed out.'
+            _logger.error(errorMsg)
+            raise Exception(errorMsg)
+        except HomingException as he:
+            _logger.error(he)
+        except Exception as e:
+            errorString = "Move sequence failed: " + str(moves) + " at speed: " + str(moveSpeed)
+            _logger.critical('DuetWebAPI moveSequence: ' + errorString + str(e))
+            raise Exception(errorString + "\n" + str(e))
+        return
+
+    #################################################################################################################################
+    # Estimate how long a sequence of moves takes from distance, feedrate and axis acceleration (trapezoidal profile),
+    # and update the last known position with the move targets
+    #
+    # Parameters:
+    #   - moves (list): axis positions of each move in the sequence, e.g. [{'X': 10.0, 'Y': None}], None skips an axis
+    #   - moveSpeed (float): feedrate in mm/min
+    #   - relative (boolean): positions are relative to the current position
+    #
+    # Returns: float
+    #   - estimated duration in seconds, before correction
+    #   - None when an absolute move starts from an unknown position
+    #
+    # Raises: NONE
+    def estimateMoveTime(self, moves, moveSpeed, relative=False):
+        speed = float(moveSpeed)/60
+        moveTime = 0
+        known = True
+        for move in moves:
+            axisTimes = [0]
+            for (axis, position) in move.items():
+                if(position is None):
+                    continue
+                position = float(position)
+                try:
+                    current = self._movePosition[axis]
+                except KeyError:
+                    current = None
+                if(relative is True):
+                    distance = abs(position)
+                    if(current is not None):
+                        self._movePosition[axis] = current + position
+                else:
+                    self._movePosition[axis] = position
+                    if(current is None):
+                        known = False
+                        continue
+                    distance = abs(position - current)
+                try:
+                    acceleration = self._accelerations[axis]
+                except KeyError:
+                    acceleration = self._acceleration
+                if(speed <= 0):
+                    continue
+                if(distance < speed**2/acceleration):
+                    # the move never reaches full speed
+                    axisTimes.append(2*math.sqrt(distance/acceleration))
+                else:
+                    axisTimes.append(distance/speed + speed/acceleration)
+            moveTime += max(axisTimes)
+        if(known is False):
+            return(None)
+        return(moveTime)
+
+    #################################################################################################################################
+    # Wait for the machine to finish a move.
+    # The first status poll is scheduled at the (corrected) estimated end of the move, later polls back off from
+    # _pollInterval up to _pollIntervalMax. Moves that outlast their estimate correct it for the next moves.
+    #
+    # Parameters:
+    #   - estimate (float): move duration in seconds from estimateMoveTime, None if unknown
+    #
+    # Returns: NONE
+    #
+    # Raises: NONE
+    def waitForMove(self, estimate=None):
+        startTime = time.time()
+        if(estimate is not None):
+            time.sleep(estimate*self._moveTimeFactor)
+        interval = self._pollInterval
+        lastPoll = None
+        while True:
+            pollTime = time.time()
+            if(self.getStatus() in "idle"):
+                break
+            lastPoll = pollTime
+            _logger.debug('waitForMove: sleeping ' + str(interval) + ' seconds..')
+            time.sleep(interval)
+            interval = min(interval*2, self._pollIntervalMax)
+        # very short moves are dominated by request latency, do not learn from them
+        if(estimate is None or estimate < 0.1):
+            return
+        if(lastPoll is None):
+            # finished before the first poll, the estimate may be too long
+            self._moveTimeFactor = max(0.5, self._moveTimeFactor*0.95)
+        else:
+            # finished between the last two polls
+            observed = (lastPoll + pollTime)/2 - startTime
+            self._moveTimeFactor = min(4.0, max(0.5, 0.7*self._moveTimeFactor + 0.3*observed/estimate))
+        _logger.debug('waitForMove: move time correction ' + str(round(self._moveTimeFactor, 3)))
+
+    # store the axis accelerations from object model axes
+    def _readAccelerations(self, axes):
+        for axis in axes:
+            try:
+                self._accelerations[axis['letter']] = float(axis['acceleration'])
+            except (KeyError, TypeError, ValueError):
+                continue
+
     #################################################################################################################################
     # Limit machine movement to within predefined boundaries as per machine-specific configuration.
     #
@@ -1060,29 +1422,21 @@ class printerAPI:
         _logger.debug('gCode called: ' + command)
         try:
             if (self.pt == 2):
-                # Start a connection
-                if(self._password != "reprap"):
-                    _logger.debug('Starting DuetWebAPI session..')
-                    URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-                    r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                # Start a connection, or reuse the open session
+                self.connect()
 
                 URL=(f'{self._base_url}'+'/rr_gcode?gcode='+command)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 
                 # Send reply to clear buffer
                 replyURL = (f'{self._base_url}'+'/rr_reply')
-                r2 = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
+                r2 = self._request(replyURL)
             elif (self.pt == 3):
-                # Set up session using password
-                URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-                # Get session key
-                r_obj = json.loads(r.text)
-                self._sessionKey = r_obj['sessionKey']
-                self.session.headers = {'X-Session-Key': self._sessionKey }
+                # Set up session using password, or reuse the open session
+                self.connect()
 
                 URL=(f'{self._base_url}'+'/machine/code/')
-                r = self.session.post(URL, data=command)
+                r = self._request(URL, data=command)
             if (r.ok):
                 return 0
             else:
@@ -1100,38 +1454,22 @@ class printerAPI:
             return -1
     
     def gCodeBatch(self,commands):
-        if(self.pt == 2): 
-            # Start a connection
-            _logger.debug('Starting DuetWebAPI session..')
-            URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-            r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-        else:
-            # Set up session using password
-            URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-            r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-            # Get session key
-            r_obj = json.loads(r.text)
-            self._sessionKey = r_obj['sessionKey']
-            self.session.headers = {'X-Session-Key': self._sessionKey }
-        
+        # Start a connection, or reuse the open session
+        self.connect()
+
         for command in commands:
             if (self.pt == 2):
                 URL=(f'{self._base_url}'+'/rr_gcode?gcode='+command)
-                r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(URL)
                 # Send reply to clear buffer
                 replyURL = (f'{self._base_url}'+'/rr_reply')
-                r = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
+                r = self._request(replyURL)
             if (self.pt == 3):
                 URL=(f'{self._base_url}'+'/machine/code/')
-                r = self.requests.post(URL, data=command)
+                r = self._request(URL, data=command)
             if not (r.ok):
                 _logger.Error("Error in gCodeBatch command: " + str(r.status_code) + str(r.reason))
 
-        if(self.pt == 2):
-            #RRF 3 on a Duet Ethernet/Wifi board, apply buffer checking
-            endsessionURL = (f'{self._base_url}'+'/rr_disconnect')
-            r = self.session.get(endsessionURL, timeout=(self._requestTimeout,self._responseTimeout))
-
     #################################################################################################################################
     #################################################################################################################################
     # ZTATP Core atomimc class functions
@@ -1141,25 +1479,18 @@ class printerAPI:
 
     def getFilenamed(self,filename):
         if (self.pt == 2):
-            # Start a connection
-            _logger.debug('Starting DuetWebAPI session..')
-            URL=(f'{self._base_url}'+'/rr_connect?password=' + self._password)
-            r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+            # Start a connection, or reuse the open session
+            self.connect()
         
             URL=(f'{self._base_url}'+'/rr_download?name='+filename)
 
         if (self.pt == 3):
-            # Set up session using password
-            URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-            r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-            # Get session key
-            r_obj = json.loads(r.text)
-            self._sessionKey = r_obj['sessionKey']
-            self.session.headers = {'X-Session-Key': self._sessionKey }
+            # Set up session using password, or reuse the open session
+            self.connect()
 
             URL=(f'{self._base_url}'+'/machine/file/'+filename)
         
-        r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+        r = self._request(URL)
         return(r.text.splitlines()) # replace('\n',str(chr(0x0a))).replace('\t','    '))
 
     #################################################################################################################################
@@ -1218,12 +1549,8 @@ class printerAPI:
         if (self.pt == 2):
             if not self._rrf2:
                 #RRF 3 on a Duet Ethernet/Wifi board, apply buffer checking
-                _logger.debug('Starting DuetWebAPI session..')
-                sessionURL = (f'{self._base_url}'+'/rr_connect?password=' + self._password)
-                r = self.session.get(sessionURL, timeout=(self._requestTimeout,self._responseTimeout))
-                rawdata = r.json()
-                rawdata = json.dumps(rawdata)
-                _logger.debug('Response from connect: ' + rawdata)
+                # Start a connection, or reuse the open session
+                self.connect()
                 buffer_size = 0
                 # while buffer_size < 150:
                 #     bufferURL = (f'{self._base_url}'+'/rr_gcode')
@@ -1237,29 +1564,20 @@ class printerAPI:
                 #         _logger.debug('Buffer low - adding 0.6s delay before next call: ' + str(buffer_size))
                 #         time.sleep(0.6)
             URL=(f'{self._base_url}'+'/rr_gcode?gcode=G31')
-            r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
+            r = self._request(URL)
             replyURL = (f'{self._base_url}'+'/rr_reply')
-            reply = self.session.get(replyURL, timeout=(self._requestTimeout,self._responseTimeout))
+            reply = self._request(replyURL)
             # Reply is of the format:
             # "Z probe 0: current reading 0, threshold 500, trigger height 0.000, offsets X0.0 Y0.0 U0.0"
             start = reply.find('trigger height')
             triggerHeight = reply[start+15:]
             triggerHeight = float(triggerHeight[:triggerHeight.find(',')])
-            if not self._rrf2:
-                #RRF 3 on a Duet Ethernet/Wifi board, apply buffer checking
-                endsessionURL = (f'{self._base_url}'+'/rr_disconnect')
-                r2 = self.session.get(endsessionURL, timeout=(self._requestTimeout,self._responseTimeout))
         if (self.pt == 3):
-            # Set up session using password
-            URL=(f'{self._base_url}'+'/machine/connect?password=' + self._password)
-            r = self.session.get(URL, timeout=(self._requestTimeout,self._responseTimeout))
-            # Get session key
-            r_obj = json.loads(r.text)
-            self._sessionKey = r_obj['sessionKey']
-            self.session.headers = {'X-Session-Key': self._sessionKey }
+            # Set up session using password, or reuse the open session
+            self.connect()
 
             URL=(f'{self._base_url}'+'/machine/code/')
-            r = self.requests.post(URL, data='G31')
+            r = self._request(URL, data='G31')
             # Reply is of the format:
             # "Z probe 0: current reading 0, threshold 500, trigger height 0.000, offsets X0.0 Y0.0"
             reply = r.text
@@ -20,6 +20,7 @@ from urllib3.util.retry import Retry
 
 # shared import dependencies
 import json
+import math
 import time
 import re
 
@@ -42,6 +43,14 @@ class printerAPI:
     # Max time to wait for HTTP requests to complete
     _requestTimeout = 2
     _responseTimeout = 10
+    # Adaptive move polling
+    # acceleration used to estimate move durations, replaced by the toolhead max_accel (in mm/s^2)
+    _acceleration = 1000
+    # correction factor for move duration estimates, learned from observed completion times
+    _moveTimeFactor = 1.0
+    # interval between status polls once the estimated move time has passed, doubling up to the maximum (in seconds)
+    _pollInterval = 0.02
+    _pollIntervalMax = 0.25
 
     #################################################################################################################################
     # G-Code Commands
@@ -88,6 +97,8 @@ class printerAPI:
         self._firmwareVersion = ""
         # tools is an array of the Tool class located at the end of this file - read that first.
         self.tools = []
+        # last known position for move time estimates
+        self._movePosition = {}
 
         try:
             state = self.getKlippyState()
@@ -95,6 +106,13 @@ class printerAPI:
                 # The board has failed to connect, return an error state
                 raise UnknownController("Unknown controller detected.")
 
+            # Configured acceleration for move time estimates
+            try:
+                j = self.query("/printer/objects/query?toolhead=max_accel")
+                self._acceleration = float(j["result"]["status"]["toolhead"]["max_accel"])
+            except (KeyError, TypeError, ValueError):
+                _logger.debug("Toolhead acceleration not available, using defaults.")
+
             # Setup tool definitions
             toolCount = self.getNumTools()
             for i in range(toolCount):
@@ -334,11 +352,13 @@ class printerAPI:
                 # Using the real toolhead position without any offsets applied.
                 coords = j["result"]["status"]["gcode_move"]["position"]
 
-            return {
+            ret = {
                 "X": round(coords[0], 3),
                 "Y": round(coords[1], 3),
                 "Z": round(coords[2], 3),
             }
+            self._movePosition.update(ret)
+            return ret
         except CoordinatesException as ce1:
             _logger.critical(str(ce1))
             raise SystemExit(ce1)
@@ -479,6 +499,8 @@ class printerAPI:
 
         try:
             self.gCode(self.G_CODE_TOOL_LOAD % (toolIndex))
+            # tool change macros move the machine
+            self._movePosition = {}
 
             # Wait until machine is done loading tool and is idle
             while not self.isIdle() and toolchangeTimer <= self._toolTimeout:
@@ -521,6 +543,8 @@ class printerAPI:
         toolchangeTimer = 0
         try:
             self.gCode(self.G_CODE_TOOL_UNLOAD)
+            # tool change macros move the machine
+            self._movePosition = {}
 
             # Wait until machine is done loading tool and is idle
             while not self.isIdle() and toolchangeTimer <= self._toolTimeout:
@@ -583,17 +607,12 @@ class printerAPI:
             # Add a return to absolute positioning to finish the command string creation
             commands.append("G90")
 
-            moveTimer = 0
+            estimate = self.estimateMoveTime([{"X": X, "Y": Y, "Z": Z}], moveSpeed, relative=True)
 
             # Send command to machine
             self.gCodeBatch(commands)
 
-            while not self.isIdle() and moveTimer <= self._moveTimeout:
-                moveTimer += 0.25
-                time.sleep(0.25)
-            if moveTimer > self._moveTimeout:
-                # Request for move timeout, raise exception
-                raise MoveTimeoutException("Request to move timed out!")
+            self.waitForMove(estimate, timeout=self._moveTimeout)
 
         except HomingException as he:
             _logger.error(he)
@@ -653,17 +672,12 @@ class printerAPI:
             commands.append("G90")
             _logger.debug(moveCommand)
 
-            moveTimer = 0
+            estimate = self.estimateMoveTime([{"X": X, "Y": Y, "Z": Z}], moveSpeed)
 
             # Send command to machine
             self.gCodeBatch(commands)
 
-            while not self.isIdle() and moveTimer <= self._moveTimeout:
-                moveTimer += 0.25
-                time.sleep(0.25)
-            if moveTimer > self._moveTimeout:
-                # Request for move timeout, raise exception
-                raise MoveTimeoutException("Request to move timed out!")
+            self.waitForMove(estimate, timeout=self._moveTimeout)
 
         except HomingException as he:
             _logger.error(he)
@@ -680,6 +694,155 @@ class printerAPI:
             raise SystemExit(errorString + "\n" + str(e))
         return
 
+    #################################################################################################################################
+    # Execute a sequence of single-axis moves in a single G-code script, and wait once for the machine to finish.
+    # The moves run in the order given, so a tool can clear obstacles on one axis before moving on the next.
+    #
+    # Parameters:
+    #   - moves (list): ordered (axis, position) pairs, e.g. [('Y', 100.0), ('X', 50.0), ('Z', 10.0)]
+    #   - moveSpeed (float): speed at which to execute the moves in feedrate/min (typically in mm/min)
+    #   - relative (boolean): positions are relative to the current position (G91)
+    #   - rapidMove (boolean): enable G0 commands instead of G1
+    #
+    # Returns: NONE
+    #
+    # Raises: NONE
+    def moveSequence(self, moves=None, moveSpeed=1000, relative=False, rapidMove=False):
+        _logger.debug("Called moveSequence")
+        if moves is None or len(moves) == 0:
+            return
+        try:
+            # check if machine has been homed fully
+            if self.isHomed() is False:
+                raise HomingException("Machine axes have not been homed properly.")
+
+            commands = []
+            if relative is True:
+                commands.append("G91")
+            else:
+                commands.append("G90")
+            if rapidMove is True:
+                moveCommand = "G0 "
+            else:
+                moveCommand = "G1 "
+            for (axis, position) in moves:
+                commands.append(
+                    moveCommand + str(axis) + str(round(float(position), 3)) + " F" + str(moveSpeed)
+                )
+            # Return to absolute positioning
+            commands.append("G90")
+            _logger.debug(commands)
+
+            estimate = self.estimateMoveTime(
+                [{axis: position} for (axis, position) in moves], moveSpeed, relative=relative
+            )
+
+            # Send the whole sequence as one script, Klipper runs its lines in order
+            self.gCode("\n".join(commands))
+
+            self.waitForMove(estimate, timeout=self._moveTimeout * len(moves))
+
+        except HomingException as he:
+            _logger.error(he)
+        except Exception as e:
+            errorString = "Move sequence failed: " + str(moves) + " at speed: " + str(moveSpeed)
+            _logger.critical(errorString + str(e))
+            raise SystemExit(errorString + "\n" + str(e))
+        return
+
+    #################################################################################################################################
+    # Estimate how long a sequence of moves takes from distance, feedrate and acceleration (trapezoidal profile),
+    # and update the last known position with the move targets
+    #
+    # Parameters:
+    #   - moves (list): axis positions of each move in the sequence, e.g. [{'X': 10.0, 'Y': None}], None skips an axis
+    #   - moveSpeed (float): feedrate in mm/min
+    #   - relative (boolean): positions are relative to the current position
+    #
+    # Returns: float
+    #   - estimated duration in seconds, before correction
+    #   - None when an absolute move starts from an unknown position
+    #
+    # Raises: NONE
+    def estimateMoveTime(self, moves, moveSpeed, relative=False):
+        speed = float(moveSpeed) / 60
+        acceleration = self._acceleration
+        moveTime = 0
+        known = True
+        for move in moves:
+            axisTimes = [0]
+            for (axis, position) in move.items():
+                if position is None:
+                    continue
+                position = float(position)
+                current = self._movePosition.get(axis)
+                if relative is True:
+                    distance = abs(position)
+                    if current is not None:
+                        self._movePosition[axis] = current + position
+                else:
+                    self._movePosition[axis] = position
+                    if current is None:
+                        known = False
+                        continue
+                    distance = abs(position - current)
+                if speed <= 0:
+                    continue
+                if distance < speed**2 / acceleration:
+                    # the move never reaches full speed
+                    axisTimes.append(2 * math.sqrt(distance / acceleration))
+                else:
+                    axisTimes.append(distance / speed + speed / acceleration)
+            moveTime += max(axisTimes)
+        if known is False:
+            return None
+        return moveTime
+
+    #################################################################################################################################
+    # Wait for the machine to finish a move.
+    # The first status poll is scheduled at the (corrected) estimated end of the move, later polls back off from
+    # _pollInterval up to _pollIntervalMax. Moves that outlast their estimate correct it for the next moves.
+    #
+    # Parameters:
+    #   - estimate (float): move duration in seconds from estimateMoveTime, None if unknown
+    #   - timeout (float): time allowed after the estimated end of the move, in seconds
+    #
+    # Returns: NONE
+    #
+    # Raises:
+    #   - MoveTimeoutException: machine took too long to finish the move
+    def waitForMove(self, estimate=None, timeout=None):
+        startTime = time.time()
+        expected = 0
+        if estimate is not None:
+            expected = estimate * self._moveTimeFactor
+            time.sleep(expected)
+        interval = self._pollInterval
+        lastPoll = None
+        while True:
+            pollTime = time.time()
+            if self.isIdle():
+                break
+            if timeout is not None and pollTime - startTime > expected + timeout:
+                # Request for move timeout, raise exception
+                raise MoveTimeoutException("Request to move timed out!")
+            lastPoll = pollTime
+            time.sleep(interval)
+            interval = min(interval * 2, self._pollIntervalMax)
+        # very short moves are dominated by request latency, do not learn from them
+        if estimate is None or estimate < 0.1:
+            return
+        if lastPoll is None:
+            # finished before the first poll, the estimate may be too long
+            self._moveTimeFactor = max(0.5, self._moveTimeFactor * 0.95)
+        else:
+            # finished between the last two polls
+            observed = (lastPoll + pollTime) / 2 - startTime
+            self._moveTimeFactor = min(
+                4.0, max(0.5, 0.7 * self._moveTimeFactor + 0.3 * observed / estimate)
+            )
+        _logger.debug("waitForMove: move time correction " + str(round(self._moveTimeFactor, 3)))
+
     #################################################################################################################################
     # Limit machine movement to within predefined boundaries as per machine-specific configuration.
     #
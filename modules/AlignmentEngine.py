@@ -0,0 +1,354 @@
+import logging
+# invoke parent (TAMV) _logger
+_logger = logging.getLogger('TAMV.AlignmentEngine')
+
+import cv2
+import numpy as np
+import sys, time, json
+import importlib, importlib.util
+from modules.Detector import Detector
+from modules.PrinterDriver import applyToolOffsets, sessionRequestsSaved
+from modules.CalibrationEngine import CalibrationEngine, toolOffsets, expectedPosition, withinView, loadCalibration, saveCalibration
+
+# Qt-free tool alignment: the same camera calibration and nozzle convergence as the GUI, driven
+# synchronously against a printer driver and a camera, with no preview rendering.
+
+class AlignmentError(Exception):
+    pass
+
+# load the printer driver for a printer profile from settings.json, using the drivers.json firmware list
+def loadPrinterDriver(printerJSON, driversFile='drivers.json'):
+    with open(driversFile, 'r') as inputfile:
+        driverEntries = json.load(inputfile)
+    driverSelect = None
+    for driverEntry in driverEntries:
+        if(driverEntry['firmware'] == printerJSON['controller']):
+            driverSelect = driverEntry['filename']
+            break
+    if(driverSelect is None):
+        raise AlignmentError('Cannot load driver for this printer')
+    spec = importlib.util.spec_from_file_location("printerAPI","./drivers/"+driverSelect)
+    driverModule = importlib.util.module_from_spec(spec)
+    sys.modules[driverSelect[:-3]] = driverModule
+    spec.loader.exec_module(driverModule)
+    try:
+        password = printerJSON['password']
+    except KeyError: password = 'reprap'
+    return(driverModule.printerAPI(baseURL=printerJSON['address'], password=password))
+
+# Camera source for unattended runs: frames are read on demand, never displayed
+class CameraSource:
+    # frames to discard after a move, so the analyzed frame was captured after the machine stopped
+    flushFrames = 2
+
+    def __init__(self, videoSrc=0, width=640, height=480, backend=None):
+        if(backend is None):
+            if(sys.platform.startswith('linux')):
+                backend = cv2.CAP_V4L
+            elif(sys.platform.startswith('darwin')):
+                backend = cv2.CAP_AVFOUNDATION
+            else:
+                backend = cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(videoSrc, backend)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if(not self.cap.isOpened()):
+            raise AlignmentError('Cannot open camera: ' + str(videoSrc))
+        self.width = width
+        self.height = height
+
+    def read(self, flush=False):
+        if(flush):
+            for i in range(self.flushFrames):
+                self.cap.grab()
+        ret, frame = self.cap.read()
+        if(not ret):
+            raise AlignmentError('Camera failure.')
+        return(frame)
+
+    def release(self):
+        self.cap.release()
+
+class AlignmentEngine:
+    # class attributes
+    __defaultSpeed = 3000
+    __toolChangeSpeed = 5000
+
+    def __init__(self, printer, camera, detectorProfile=None, rotated=0, clock=time.time, pattern=None, calibrationKey=None, tolerance=None):
+        self.printer = printer
+        self.camera = camera
+        self.rotated = rotated
+        # time source, replaced by the simulation clock in simulated runs
+        self.clock = clock
+        self.__detector = Detector(drawOverlay=False, profile=detectorProfile)
+        self.calibration = CalibrationEngine(width=camera.width, height=camera.height, pattern=pattern, tolerance=tolerance)
+        # camera calibration summary for the report
+        self.cameraCalibration = None
+        # calibration cache entry for this printer and camera (see CalibrationEngine.cacheKey)
+        self.calibrationKey = calibrationKey
+        self.cachedCP = None
+        self.transformSource = None
+        # offsets each tool was last aligned with, for the first move of the next alignment
+        self.lastOffsets = {}
+        # offsets waiting to be written at the end of a deferred run
+        self.pendingOffsets = None
+        if(calibrationKey is not None):
+            entry = loadCalibration(calibrationKey, width=camera.width, height=camera.height)
+            if(entry is not None):
+                try:
+                    self.cachedCP = entry['cp']
+                except KeyError: pass
+                self.lastOffsets = entry['tools']
+                if(entry['transformMatrix'] is not None):
+                    self.calibration.transformMatrix = entry['transformMatrix']
+                    self.calibration.mpp = entry['mpp']
+                    self.calibration.transformResidual = entry['residual']
+                    self.calibration.validate = True
+                    self.transformSource = 'cache'
+                    _logger.info('Loaded cached camera calibration (MPP=' + str(entry['mpp']) + ')')
+        self.cpCoordinates = None
+        self.moves = 0
+        self.detections = 0
+        # a move has been made since the last frame was read
+        self.__moved = True
+
+    # Printer
+    def checkPrinter(self):
+        if(not self.printer.isHomed()):
+            raise AlignmentError('Printer axis not homed. Rectify and reconnect.')
+        if(not self.printer.isIdle()):
+            raise AlignmentError('Device either did not respond or is not a supported controller type.')
+
+    def moveRelative(self, position, moveSpeed=None):
+        if(moveSpeed is None):
+            moveSpeed = self.__defaultSpeed
+        self.printer.moveRelative(rapidMove=False, moveSpeed=moveSpeed, X=position['X'], Y=position['Y'])
+        self.moves += 1
+        self.__moved = True
+
+    # protected moves run one axis at a time, like PrinterManager.complexMoveAbsolute
+    def moveAbsolute(self, position, moveSpeed=None, protected=False):
+        if(moveSpeed is None):
+            moveSpeed = self.__defaultSpeed
+        if(protected):
+            if(self.rotated == 1):
+                axes = ['Y', 'X', 'Z']
+            else:
+                axes = ['X', 'Y', 'Z']
+            moves = []
+            for axis in axes:
+                try:
+                    value = position[axis]
+                except KeyError: value = None
+                if(value is not None):
+                    moves.append((axis, value))
+            if(hasattr(self.printer, 'moveSequence')):
+                self.printer.moveSequence(moves=moves, moveSpeed=moveSpeed)
+            else:
+                for (axis, value) in moves:
+                    self.printer.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, **{axis: value})
+        else:
+            self.printer.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, X=position['X'], Y=position['Y'])
+        self.moves += 1
+        self.__moved = True
+
+    def getCoordinates(self):
+        return(self.printer.getCoordinates())
+
+    # Detection
+    # returns a detection result, with uv set to None when nothing was found
+    def detect(self, endstop=False):
+        # the first frame after a move is analyzed: discard anything buffered while moving
+        flush = self.__moved
+        self.__moved = False
+        if(endstop):
+            frame = self.camera.read(flush=flush)
+            (uv, frame, metrics) = self.__detector.endstopContourDetection(frame, autoDetection=True)
+            samples = [uv]
+            if(uv[0] is None or uv[1] is None):
+                uv = None
+        else:
+            (uv, metrics, samples) = self.burstNozzleDetection(flush=flush)
+        self.detections += 1
+        return(self.__detector.detectionResult(uv=uv, metrics=metrics, samples=samples))
+
+    # average 3 nozzle detections, like DetectionManager.burstNozzleDetection
+    def burstNozzleDetection(self, flush=False):
+        samples = []
+        metrics = None
+        retries = 0
+        while(len(samples) < 3):
+            frame = self.camera.read(flush=flush)
+            flush = False
+            (center, frame, metrics) = self.__detector.nozzleDetection(frame, autoDetection=True)
+            if(center[0] is not None and center[1] is not None):
+                samples.append(center)
+            else:
+                retries += 1
+            if(retries > 5):
+                return(None, metrics, samples)
+        uv = np.around(np.mean(np.array(samples, dtype=float), axis=0), 0)
+        return(uv, metrics, samples)
+
+    # Calibration
+    # run one calibration engine cycle (camera calibration if needed, then convergence to the camera center)
+    # and return the 'aligned' event
+    def runCycle(self, endstop=False):
+        commands = self.calibration.start(endstop=endstop, timestamp=self.clock())
+        result = None
+        while(True):
+            for command in commands:
+                if(command['type'] == 'moveRelative'):
+                    self.moveRelative(command['position'], moveSpeed=command['moveSpeed'])
+                elif(command['type'] == 'moveAbsolute'):
+                    self.moveAbsolute(command['position'], moveSpeed=command['moveSpeed'])
+                elif(command['event'] == 'cameraCalibrated'):
+                    _logger.info('Millimeters per pixel is ' + str(command['mpp']))
+                    _logger.info('Camera calibrated with the ' + command['pattern'] + ' pattern: ' + str(command['moves']) + ' moves, residual ' + str(np.around(command['residualPixels'], 2)) + 'px.')
+                    self.cameraCalibration = {key: float(command[key]) for key in ['mpp', 'residual', 'residualPixels', 'time', 'timeSaved']}
+                    self.cameraCalibration.update({key: command[key] for key in ['pattern', 'moves', 'measurements', 'movesSaved', 'residualAccepted', 'pointResiduals', 'recaptured', 'dropped']})
+                    self.transformSource = 'calibration'
+                    if(self.calibrationKey is not None):
+                        saveCalibration(self.calibrationKey, transformMatrix=command['transformMatrix'], mpp=command['mpp'], residual=command['residual'],
+                            width=self.camera.width, height=self.camera.height)
+                elif(command['event'] == 'transformValidated'):
+                    _logger.info('Cached camera calibration confirmed in ' + str(command['moves']) + ' moves, skipping camera calibration.')
+                elif(command['event'] == 'transformRejected'):
+                    _logger.info('Camera has moved since the last calibration (' + str(np.around(command['error'], 2)) + 'px), calibrating camera..')
+                elif(command['event'] == 'calibrationRejected'):
+                    _logger.warning('Camera calibration residual too high with the ' + command['pattern'] + ' pattern, repeating with the star pattern.')
+                elif(command['event'] == 'aligned'):
+                    result = command
+                elif(command['event'] == 'failed'):
+                    raise AlignmentError(command['message'])
+            if(not self.calibration.active):
+                break
+            position = self.getCoordinates()
+            detection = self.detect(endstop=endstop)
+            commands = self.calibration.update(detection['uv'], position, self.clock())
+        return(result)
+
+    # CP
+    # cpMode 'endstop': detect the endstop with no tool loaded; 'current': the current position is the CP;
+    # 'coordinates': use cpCoordinates; 'cached': the CP saved in the calibration cache
+    def setupCP(self, cpMode='endstop', cpCoordinates=None):
+        startTime = self.clock()
+        if(cpMode == 'cached'):
+            if(self.cachedCP is None):
+                raise AlignmentError('No cached CP for this printer and camera.')
+            cpCoordinates = self.cachedCP
+            cpMode = 'coordinates'
+        if(cpMode == 'coordinates'):
+            if(cpCoordinates is None):
+                raise AlignmentError('Invalid CP coordinates.')
+            self.cpCoordinates = {'X': cpCoordinates['X'], 'Y': cpCoordinates['Y']}
+            try:
+                self.cpCoordinates['Z'] = cpCoordinates['Z']
+            except KeyError:
+                self.cpCoordinates['Z'] = None
+        elif(cpMode == 'current'):
+            self.cpCoordinates = self.getCoordinates()
+        elif(cpMode == 'endstop'):
+            self.printer.unloadTools()
+            result = self.runCycle(endstop=True)
+            position = result['position']
+            self.cpCoordinates = {'X': np.around(position['X'], 2), 'Y': np.around(position['Y'], 2), 'Z': np.around(position['Z'], 2)}
+            _logger.info('Endstop auto-calibrated in ' + str(result['moves']) + ' steps. (MPP=' + str(self.calibration.mpp) + ')')
+        else:
+            raise AlignmentError('Unknown CP mode: ' + str(cpMode))
+        _logger.info('CP: (' + str(self.cpCoordinates['X']) + ', ' + str(self.cpCoordinates['Y']) + ')')
+        if(self.calibrationKey is not None):
+            saveCalibration(self.calibrationKey, cpCoordinates=self.cpCoordinates)
+        return(np.around(self.clock() - startTime, 3))
+
+    # Tools
+    # Start position for a tool: the CP, shifted by the difference between its firmware offsets and the
+    # offsets it was last aligned with. Shifts the camera could not see are left to the firmware.
+    def predictPosition(self, toolIndex, currentOffsets):
+        try:
+            lastOffsets = self.lastOffsets[toolIndex]
+        except KeyError:
+            return(self.cpCoordinates)
+        position = expectedPosition(self.cpCoordinates, currentOffsets, lastOffsets)
+        shiftX = position['X'] - self.cpCoordinates['X']
+        shiftY = position['Y'] - self.cpCoordinates['Y']
+        if(shiftX == 0 and shiftY == 0):
+            return(self.cpCoordinates)
+        if(not withinView(shiftX, shiftY, self.calibration.mpp, self.camera.width, self.camera.height)):
+            _logger.info('T' + str(toolIndex) + ' firmware offsets differ from the last alignment by more than the camera view, starting at the CP.')
+            return(self.cpCoordinates)
+        _logger.debug('T' + str(toolIndex) + ' predicted position: ' + str(position))
+        return(position)
+
+    def alignTool(self, toolIndex):
+        toolTime = self.clock()
+        startMoves = self.moves
+        startDetections = self.detections
+        _logger.info('Calibrating T' + str(toolIndex) + '..')
+        self.printer.loadTool(toolIndex)
+        currentOffsets = self.printer.getToolOffset(toolIndex)
+        result = {'tool': toolIndex}
+        position = self.predictPosition(toolIndex, currentOffsets)
+        result['predicted'] = (position is not self.cpCoordinates)
+        self.moveAbsolute(position, moveSpeed=self.__toolChangeSpeed, protected=True)
+        aligned = self.runCycle()
+        finalOffsets = toolOffsets(self.cpCoordinates, currentOffsets, aligned['position'])
+        if(self.pendingOffsets is None):
+            self.printer.setToolOffsets(tool=toolIndex, X=finalOffsets['X'], Y=finalOffsets['Y'])
+        else:
+            # deferred: written once every tool is aligned
+            self.pendingOffsets[toolIndex] = finalOffsets
+        self.lastOffsets[toolIndex] = finalOffsets
+        if(self.calibrationKey is not None):
+            saveCalibration(self.calibrationKey, toolOffsets={toolIndex: finalOffsets})
+        result['offsets'] = finalOffsets
+        result['alignmentMoves'] = aligned['moves']
+        result['correction'] = float(np.around(aligned['correction'], 4))
+        result['moves'] = self.moves - startMoves
+        result['detections'] = self.detections - startDetections
+        result['time'] = float(np.around(self.clock() - toolTime, 3))
+        _logger.info('Tool ' + str(toolIndex) + ': (X' + str(finalOffsets['X']) + ', Y' + str(finalOffsets['Y']) + ', Z' + str(finalOffsets['Z']) + ') -- [' + str(np.around(result['time'], 1)) + 's].')
+        return(result)
+
+    # full unattended run; returns a JSON-serializable report
+    # deferOffsets: offsets are only written, in one batch with the save, once every tool is aligned;
+    # a failed run leaves the firmware offsets untouched
+    def run(self, tools, cpMode='endstop', cpCoordinates=None, saveOffsets=True, deferOffsets=False):
+        startTime = self.clock()
+        report = {'tools': [], 'cpMode': cpMode, 'offsetsApplied': False}
+        startRequestsSaved = sessionRequestsSaved(self.printer)
+        self.pendingOffsets = {} if deferOffsets else None
+        try:
+            self.checkPrinter()
+            report['cpTime'] = float(self.setupCP(cpMode=cpMode, cpCoordinates=cpCoordinates))
+            report['cp'] = {axis: (None if value is None else float(value)) for (axis, value) in self.cpCoordinates.items()}
+            for toolIndex in tools:
+                report['tools'].append(self.alignTool(int(toolIndex)))
+            if(deferOffsets):
+                applyToolOffsets(self.printer, self.pendingOffsets, save=saveOffsets)
+                _logger.info('Offsets applied' + (' and saved to firmware.' if saveOffsets else '.'))
+            elif(saveOffsets):
+                self.printer.saveOffsetsToFirmware()
+                _logger.info('Offsets saved to firmware.')
+            report['offsetsApplied'] = True
+        except Exception as e:
+            _logger.error(str(e))
+            report['error'] = str(e)
+        finally:
+            try:
+                self.printer.unloadTools()
+            except Exception as e:
+                _logger.warning('Could not unload tools: ' + str(e))
+        report['mpp'] = None if self.calibration.mpp is None else float(self.calibration.mpp)
+        if(self.calibration.transformResidual is not None):
+            report['residual'] = float(self.calibration.transformResidual)
+        if(self.cameraCalibration is not None):
+            report['cameraCalibration'] = self.cameraCalibration
+        report['transformSource'] = self.transformSource
+        report['moves'] = self.moves
+        report['detections'] = self.detections
+        if(startRequestsSaved is not None):
+            report['sessionRequestsSaved'] = sessionRequestsSaved(self.printer) - startRequestsSaved
+        report['time'] = float(np.around(self.clock() - startTime, 3))
+        return(report)
@@ -0,0 +1,180 @@
+import logging
+# invoke parent (TAMV) _logger
+_logger = logging.getLogger('TAMV.AsyncPrinter')
+
+import asyncio, functools, threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Asynchronous interface to a printer driver.
+# The drivers are blocking (HTTP requests and sleep loops), so their calls run on worker threads
+# driven by an asyncio event loop in its own thread:
+#   - commands (moves, tool changes, offsets) run one at a time, in the order they were sent
+#   - queries (status, coordinates) run on a separate worker, so they are answered while a
+#     command is still in progress
+# Drivers are not thread-safe (one HTTP session, cached session keys), so queries only run in
+# parallel with commands on their own driver instance (queryPrinter). Without one, queries are
+# queued with the commands.
+# Cancelling drops commands that have not started yet; a driver call that is already running
+# cannot be interrupted and finishes in the background.
+class AsyncPrinter:
+    # interval between status polls of a status watcher (in seconds)
+    statusInterval = 0.5
+
+    def __init__(self, printer, timeout=None, queryPrinter=None):
+        self.printer = printer
+        self.queryPrinter = queryPrinter
+        # default timeout for driver calls (in seconds, None waits forever)
+        self.timeout = timeout
+        self.__commands = ThreadPoolExecutor(max_workers=1, thread_name_prefix='printerCommand')
+        self.__queries = None
+        if(queryPrinter is not None):
+            self.__queries = ThreadPoolExecutor(max_workers=1, thread_name_prefix='printerQuery')
+        # submitted futures, and whether cancel() drops them
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.loop.run_forever, name='printerLoop', daemon=True)
+        self.__thread.start()
+
+    # Awaitable driver calls
+    async def call(self, method, *args, timeout=None, query=False, **kwargs):
+        if(query and self.queryPrinter is not None):
+            executor = self.__queries
+            printer = self.queryPrinter
+        else:
+            executor = self.__commands
+            printer = self.printer
+        if(timeout is None):
+            timeout = self.timeout
+        function = functools.partial(getattr(printer, method), *args, **kwargs)
+        future = self.loop.run_in_executor(executor, function)
+        return(await asyncio.wait_for(future, timeout))
+
+    async def moveRelative(self, timeout=None, **kwargs):
+        return(await self.call('moveRelative', timeout=timeout, **kwargs))
+
+    async def moveAbsolute(self, timeout=None, **kwargs):
+        return(await self.call('moveAbsolute', timeout=timeout, **kwargs))
+
+    async def loadTool(self, toolIndex, timeout=None):
+        return(await self.call('loadTool', toolIndex, timeout=timeout))
+
+    async def unloadTools(self, timeout=None):
+        return(await self.call('unloadTools', timeout=timeout))
+
+    async def setToolOffsets(self, timeout=None, **kwargs):
+        return(await self.call('setToolOffsets', timeout=timeout, **kwargs))
+
+    async def getToolOffset(self, toolIndex, timeout=None):
+        return(await self.call('getToolOffset', toolIndex, timeout=timeout, query=True))
+
+    async def getCoordinates(self, timeout=None):
+        return(await self.call('getCoordinates', timeout=timeout, query=True))
+
+    async def getStatus(self, timeout=None):
+        return(await self.call('getStatus', timeout=timeout, query=True))
+
+    # poll the printer status until cancelled or stop is set, callback(status) runs on every change
+    async def watchStatus(self, callback, interval=None, stop=None):
+        if(interval is None):
+            interval = self.statusInterval
+        lastStatus = None
+        while(stop is None or not stop.is_set()):
+            try:
+                status = await self.getStatus(timeout=max(interval*4, 2))
+            except asyncio.TimeoutError:
+                status = None
+            if(status is not None and status != lastStatus):
+                callback(status)
+                lastStatus = status
+            await asyncio.sleep(interval)
+
+    # run an awaitable while watching the printer status, the watcher stops with it
+    async def withStatus(self, awaitable, callback, interval=None):
+        # the stop flag ends the watcher even if wait_for swallowed its cancellation (Python < 3.12)
+        stop = asyncio.Event()
+        watcher = asyncio.ensure_future(self.watchStatus(callback, interval=interval, stop=stop))
+        try:
+            return(await awaitable)
+        finally:
+            stop.set()
+            watcher.cancel()
+            try:
+                await watcher
+            except asyncio.CancelledError:
+                pass
+
+    # Thread adapter
+    # schedule a coroutine from any thread, returns a concurrent.futures.Future
+    # callback(future) runs on the event loop thread when it is done
+    # cancellable=False keeps the coroutine running through cancel(), only close() drops it
+    def submit(self, coroutine, callback=None, cancellable=True):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        with self.__lock:
+            self.__pending[future] = cancellable
+        def done(future):
+            with self.__lock:
+                self.__pending.pop(future, None)
+            if(callback is not None):
+                callback(future)
+        future.add_done_callback(done)
+        return(future)
+
+    # run a coroutine and wait for its result
+    def run(self, coroutine, timeout=None):
+        return(self.submit(coroutine).result(timeout))
+
+    # distinct driver instances in use
+    @property
+    def drivers(self):
+        if(self.queryPrinter is None or self.queryPrinter is self.printer):
+            return([self.printer])
+        return([self.printer, self.queryPrinter])
+
+    @property
+    def busy(self):
+        with self.__lock:
+            return(len(self.__pending) > 0)
+
+    # cancel everything submitted that has not finished, with everything also the non-cancellable work
+    def cancel(self, everything=False):
+        with self.__lock:
+            pending = [future for (future, cancellable) in self.__pending.items() if(cancellable or everything)]
+        for future in pending:
+            future.cancel()
+        return(len(pending))
+
+    # stop the event loop; with wait, a driver call that is still running is allowed to finish
+    def close(self, wait=True):
+        self.cancel(everything=True)
+        self.__commands.shutdown(wait=wait)
+        if(self.__queries is not None):
+            self.__queries.shutdown(wait=wait)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.__thread.join(timeout=5)
+        if(not self.loop.is_running()):
+            self.loop.close()
+
+    # blocking view of the driver, see OrderedPrinter
+    def ordered(self):
+        return(OrderedPrinter(self))
+
+# Blocking view of a driver for synchronous callers: every command is queued behind the commands
+# submitted before it and waits for its result, so synchronous and asynchronous commands reach the
+# printer in the order they were made. Read-only calls are queries and do not wait behind a
+# command in progress. Attributes that are not methods are read directly.
+class OrderedPrinter:
+    # read-only driver methods
+    queryMethods = ('getCoordinates', 'getStatusAndCoordinates', 'getCurrentTool', 'getToolOffset', 'getStatus', 'isIdle', 'isHomed')
+
+    def __init__(self, asyncPrinter):
+        self.__asyncPrinter = asyncPrinter
+
+    def __getattr__(self, name):
+        attribute = getattr(self.__asyncPrinter.printer, name)
+        if(not callable(attribute)):
+            return(attribute)
+        query = name in self.queryMethods
+        def method(*args, **kwargs):
+            return(self.__asyncPrinter.run(self.__asyncPrinter.call(name, *args, query=query, **kwargs)))
+        return(method)
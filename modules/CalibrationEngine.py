@@ -0,0 +1,549 @@
+import logging
+# invoke parent (TAMV) _logger
+_logger = logging.getLogger('TAMV.CalibrationEngine')
+
+import numpy as np
+import json, os, time
+
+# Camera calibration and nozzle/endstop convergence as an explicit state machine.
+# The engine does no I/O and never reads the clock: the host feeds it measurements
+# (detected UV, machine coordinates and a timestamp) and executes the commands it returns.
+#
+# Commands are dictionaries:
+#   {'type': 'moveRelative', 'position': {'X', 'Y'}, 'moveSpeed'}
+#   {'type': 'moveAbsolute', 'position': {'X', 'Y'}, 'moveSpeed'}
+#   {'type': 'event', 'event': 'cameraCalibrated' | 'calibrationRejected' | 'pointsRecaptured' | 'transformValidated' |
+#       'transformRejected' | 'aligned' | 'failed', ...}
+# After executing the commands of an update, the host measures again and calls update().
+
+# cached camera calibrations, one entry per printer and camera pair
+cacheFile = './config/calibration.json'
+
+def cacheKey(printerName, videoSrc):
+    return(str(printerName) + '|' + str(videoSrc))
+
+# load a cached calibration; returns None when there is no entry. The transform is dropped
+# (transformMatrix None) when it was calibrated at another camera resolution.
+def loadCalibration(key, width=None, height=None, filename=None):
+    if(filename is None):
+        filename = cacheFile
+    try:
+        with open(filename, 'r') as inputfile:
+            entry = json.load(inputfile)[key]
+    except (FileNotFoundError, ValueError, KeyError):
+        return(None)
+    try:
+        if(entry['transformMatrix'] is not None):
+            entry['transformMatrix'] = np.array(entry['transformMatrix'], dtype=float)
+    except KeyError:
+        entry['transformMatrix'] = None
+    if(entry['transformMatrix'] is not None and width is not None and height is not None):
+        try:
+            resolution = entry['resolution']
+        except KeyError:
+            resolution = None
+        if(resolution != [int(width), int(height)]):
+            _logger.info('Cached camera calibration is for a different resolution, ignoring it.')
+            entry['transformMatrix'] = None
+    # tool offsets are stored by tool number
+    try:
+        entry['tools'] = {int(tool): offsets for (tool, offsets) in entry['tools'].items()}
+    except KeyError:
+        entry['tools'] = {}
+    return(entry)
+
+# save calibration results for a printer and camera pair; only the given fields are updated
+def saveCalibration(key, transformMatrix=None, mpp=None, residual=None, width=None, height=None, cpCoordinates=None, toolOffsets=None, filename=None):
+    if(filename is None):
+        filename = cacheFile
+    try:
+        with open(filename, 'r') as inputfile:
+            entries = json.load(inputfile)
+    except (FileNotFoundError, ValueError):
+        entries = {}
+    try:
+        entry = entries[key]
+    except KeyError:
+        entry = {}
+    if(transformMatrix is not None):
+        entry['transformMatrix'] = np.asarray(transformMatrix, dtype=float).tolist()
+        entry['mpp'] = None if mpp is None else float(mpp)
+        entry['residual'] = None if residual is None else float(residual)
+        entry['resolution'] = [int(width), int(height)]
+        entry['calibrated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    if(cpCoordinates is not None):
+        entry['cp'] = {axis: (None if value is None else float(value)) for (axis, value) in cpCoordinates.items()}
+    if(toolOffsets is not None):
+        # {tool: {'X', 'Y', 'Z'}}, merged with the offsets of tools not aligned this time
+        try:
+            tools = entry['tools']
+        except KeyError:
+            tools = {}
+        for (tool, offsets) in toolOffsets.items():
+            tools[str(tool)] = {axis: float(value) for (axis, value) in offsets.items()}
+        entry['tools'] = tools
+    entries[key] = entry
+    directory = os.path.dirname(filename)
+    if(directory != ''):
+        os.makedirs(directory, exist_ok=True)
+    with open(filename, 'w') as outputfile:
+        json.dump(entries, outputfile, indent=4)
+
+class CalibrationEngine:
+    # states
+    IDLE = 'idle'
+    CALIBRATING = 'calibrating'
+    VALIDATING = 'validating'
+    ALIGNING = 'aligning'
+    ALIGNED = 'aligned'
+    FAILED = 'failed'
+
+    # class attributes
+    defaultSpeed = 3000
+    alignmentSpeed = 1000
+    # Maximum number of failed detections in a row
+    maxRetries = 10
+    # Maximum runtime (in seconds) and moves for a convergence cycle
+    maxRuntime = 120
+    maxMoves = 30
+    # Convergence controller: each move applies the full correction solved from the camera model,
+    # scaled by a gain that is re-estimated from the response observed after every move.
+    initialGain = 1.0
+    minGain = 0.25
+    maxGain = 1.5
+    # detection uncertainty, in pixels: detections are rounded to whole pixels
+    detectionUncertainty = 0.5
+    # shortest move (pixels) used to re-estimate the gain
+    gainEstimateDistance = 10
+    # aligned when the remaining correction is below this (mm); None derives it from the
+    # detection uncertainty and mpp
+    convergenceTolerance = None
+    # offsets below this (|X|+|Y|, mm) count as aligned for the endstop
+    endstopTolerance = 0.02
+    # Camera calibration patterns: points (mm) relative to the starting position. The first point is
+    # 0.5mm away, which sets mpp. 'star' returns to the start after every point, 'chain' walks the same
+    # points without returning, 'minimal' walks 6 points: with the starting position this is one
+    # observation more than the 6-term quadratic fit needs, so the residual can still be checked.
+    calibrationPatterns = {
+        'star': {'returnToCenter': True, 'points': [
+            [0, -0.5],
+            [0.294, -0.405],
+            [0.476, -0.155],
+            [0.476, 0.155],
+            [0.294, 0.405],
+            [0, 0.5],
+            [-0.294, 0.405],
+            [-0.476, 0.155],
+            [-0.476, -0.155],
+            [-0.294, -0.405],
+        ]},
+        'chain': {'returnToCenter': False, 'points': [
+            [0, -0.5],
+            [0.294, -0.405],
+            [0.476, -0.155],
+            [0.476, 0.155],
+            [0.294, 0.405],
+            [0, 0.5],
+            [-0.294, 0.405],
+            [-0.476, 0.155],
+            [-0.476, -0.155],
+            [-0.294, -0.405],
+        ]},
+        'minimal': {'returnToCenter': False, 'points': [
+            [0, -0.5],
+            [0.433, -0.25],
+            [0.433, 0.25],
+            [0, 0.5],
+            [-0.433, 0.25],
+            [-0.433, -0.25],
+        ]},
+    }
+    defaultPattern = 'star'
+    # maximum RMS fit residual, in pixels; sparser patterns that fail it fall back to the star
+    maxResidual = 2.0
+    # Robust fit: Huber weighting beyond huberThreshold (pixels); calibration points whose residual
+    # exceeds outlierResidual (pixels) are measured again, up to maxRecaptures of them, and left out of
+    # the fit if they are still off and enough points remain
+    robustFit = True
+    huberThreshold = 1.0
+    outlierResidual = 2.5
+    maxRecaptures = 4
+    # validation moves for a cached transform, chained from the starting position (mm)
+    validationPoints = [[0, -0.5], [0.5, 0]]
+    # maximum difference between the predicted and the actual validation moves, in pixels
+    validationTolerance = 3.0
+
+    def __init__(self, width=640, height=480, transformMatrix=None, mpp=None, pattern=None, validate=False, tolerance=None):
+        self.width = width
+        self.height = height
+        if(tolerance is not None):
+            self.convergenceTolerance = float(tolerance)
+        if(pattern is None):
+            pattern = self.defaultPattern
+        elif(pattern not in self.calibrationPatterns):
+            _logger.warning('Unknown calibration pattern ' + str(pattern) + ', using ' + self.defaultPattern + '.')
+            pattern = self.defaultPattern
+        self.pattern = pattern
+        self.transformMatrix = transformMatrix
+        self.transformResidual = None
+        self.mpp = mpp
+        # check a transform loaded from the cache before trusting it
+        self.validate = validate
+        self.reset()
+
+    def reset(self):
+        self.state = self.IDLE
+        self.endstop = False
+        # calibration step: 0 at the starting position, 1..N at the calibration points, N+1 back at the start
+        self.step = 0
+        self.space_coordinates = []
+        self.camera_coordinates = []
+        self.calibrationPattern = self.pattern
+        self.patternMoves = 0
+        # calibration points waiting to be measured again
+        self.recapture = []
+        self.recaptured = []
+        self.pointResiduals = None
+        self.olduv = None
+        self.guessPosition = None
+        self.calibrationMoves = 0
+        self.retries = 0
+        self.startTime = None
+        self.alignmentStartTime = None
+        self.position = None
+        self.offsets = None
+        self.controlGain = self.initialGain
+        self.lastError = None
+        self.lastMove = None
+
+    # begin a cycle; camera calibration is skipped when a transform is already known
+    def start(self, endstop=False, timestamp=0):
+        self.reset()
+        self.endstop = endstop
+        self.startTime = timestamp
+        if(self.transformMatrix is None or self.mpp is None or len(self.transformMatrix) < 6):
+            self.transformMatrix = None
+            self.mpp = None
+            self.state = self.CALIBRATING
+        elif(self.validate):
+            self.state = self.VALIDATING
+        else:
+            self.state = self.ALIGNING
+            self.alignmentStartTime = timestamp
+        return([])
+
+    @property
+    def active(self):
+        return(self.state in (self.CALIBRATING, self.VALIDATING, self.ALIGNING))
+
+    # feed one measurement: uv is None when detection failed
+    def update(self, uv, coordinates, timestamp):
+        if(not self.active):
+            return([])
+        if(uv is None or uv[0] is None or uv[1] is None):
+            self.retries += 1
+            if(self.retries > self.maxRetries):
+                return(self.fail('Failed to detect ' + ('endstop.' if self.endstop else 'nozzle.')))
+            # measure again without moving
+            return([])
+        self.retries = 0
+        if(self.state == self.CALIBRATING):
+            return(self.calibrationStep(uv, coordinates, timestamp))
+        elif(self.state == self.VALIDATING):
+            return(self.validationStep(uv, coordinates, timestamp))
+        return(self.alignmentStep(uv, coordinates, timestamp))
+
+    def fail(self, message):
+        self.state = self.FAILED
+        _logger.warning(message)
+        return([{'type': 'event', 'event': 'failed', 'message': message}])
+
+    def calibrationStep(self, uv, coordinates, timestamp):
+        if(len(self.recapture) > 0):
+            return(self.recaptureStep(uv, coordinates, timestamp))
+        _logger.debug('*** Calibration step: ' + str(self.step) + ' Coords:' + str(coordinates) + ' UV: ' + str(uv) + ' old UV: ' + str(self.olduv))
+        pattern = self.calibrationPatterns[self.calibrationPattern]
+        points = pattern['points']
+        pointCount = len(points)
+        # save machine and camera coordinates for the detection
+        self.space_coordinates.append((coordinates['X'], coordinates['Y']))
+        self.camera_coordinates.append((uv[0], uv[1]))
+        commands = []
+        if(self.step == 0):
+            # move carriage to the first calibration point
+            commands.append(self.relativeMove(points[0]))
+        elif(self.step <= pointCount):
+            # Calculate mpp at first move
+            if(self.step == 1):
+                self.mpp = np.around(0.5/getDistance(self.olduv[0], self.olduv[1], uv[0], uv[1]), 3)
+            offsetX, offsetY = points[self.step - 1]
+            if(pattern['returnToCenter']):
+                # return carriage to relative center of movement, then on to the next point
+                commands.append(self.relativeMove([-offsetX, -offsetY]))
+                if(self.step < pointCount):
+                    commands.append(self.relativeMove(points[self.step]))
+            elif(self.step < pointCount):
+                # straight on to the next point
+                commands.append(self.relativeMove([points[self.step][0] - offsetX, points[self.step][1] - offsetY]))
+        self.patternMoves += len(commands)
+        self.olduv = uv
+        self.step += 1
+        if(self.step <= pointCount or (pattern['returnToCenter'] and self.step == pointCount + 1)):
+            return(commands)
+        # Camera calibration moves completed: calculate transformation matrix
+        commands.extend(self.fitCalibration(uv, coordinates, timestamp))
+        return(commands)
+
+    # replace the measurement of a calibration point that did not fit
+    def recaptureStep(self, uv, coordinates, timestamp):
+        index = self.recapture.pop(0)
+        _logger.debug('*** Calibration point ' + str(index) + ' measured again: UV ' + str(uv) + ', was ' + str(self.camera_coordinates[index]))
+        self.space_coordinates[index] = (coordinates['X'], coordinates['Y'])
+        self.camera_coordinates[index] = (uv[0], uv[1])
+        if(len(self.recapture) > 0):
+            return([self.absoluteMove(self.space_coordinates[self.recapture[0]])])
+        return(self.fitCalibration(uv, coordinates, timestamp))
+
+    def fitCalibration(self, uv, coordinates, timestamp):
+        commands = []
+        transform_input = [(self.space_coordinates[i], self.normalize_coords(camera)) for i, camera in enumerate(self.camera_coordinates)]
+        keep = list(range(len(transform_input)))
+        dropped = 0
+        if(self.robustFit):
+            # Screen the points with a robust affine fit: over the calibration area the quadratic terms are
+            # tiny, and unlike the full model an affine fit cannot absorb a bad detection at the center.
+            # mpp from the first move is at the mercy of a single bad detection, take it from the fit.
+            self.mpp = self.modelMpp(least_square_mapping(transform_input, affine=True)[0])
+            residuals = least_square_mapping(transform_input, huberThreshold=self.huberThreshold*self.mpp, affine=True)[2]
+            self.pointResiduals = [float(residual/self.mpp) for residual in residuals]
+            outliers = [index for (index, residual) in enumerate(self.pointResiduals) if residual > self.outlierResidual]
+            if(len(outliers) > 0 and len(self.recaptured) == 0 and len(outliers) <= self.maxRecaptures):
+                # measure the offending points again, then fit again
+                _logger.info('Calibration points ' + str(outliers) + ' do not fit the camera model (' + ', '.join([str(np.around(self.pointResiduals[index], 1)) + 'px' for index in outliers]) + '), measuring them again..')
+                self.recapture = list(outliers)
+                self.recaptured = list(outliers)
+                commands.append({'type': 'event', 'event': 'pointsRecaptured', 'points': list(outliers), 'residuals': [self.pointResiduals[index] for index in outliers]})
+                commands.append(self.absoluteMove(self.space_coordinates[outliers[0]]))
+                return(commands)
+            if(len(outliers) > 0 and len(outliers) <= self.maxRecaptures and len(transform_input) - len(outliers) >= 8):
+                # still off after measuring again: fit without them
+                _logger.info('Leaving calibration points ' + str(outliers) + ' out of the camera model.')
+                keep = [index for index in keep if index not in outliers]
+                dropped = len(outliers)
+        (self.transformMatrix, self.transformResidual, residuals) = least_square_mapping([transform_input[index] for index in keep])
+        if(self.robustFit):
+            self.mpp = self.modelMpp(self.transformMatrix)
+        else:
+            self.pointResiduals = [float(residual/self.mpp) for residual in residuals]
+        residualPixels = float(self.transformResidual/self.mpp)
+        if(residualPixels > self.maxResidual and self.calibrationPattern != 'star'):
+            # sparse pattern fit is not good enough: calibrate again around this position with the full star
+            _logger.warning('Calibration residual ' + str(np.around(residualPixels, 2)) + 'px with the ' + self.calibrationPattern + ' pattern, repeating with the star pattern.')
+            commands.append({'type': 'event', 'event': 'calibrationRejected', 'pattern': self.calibrationPattern, 'residual': self.transformResidual})
+            self.transformMatrix = None
+            self.calibrationPattern = 'star'
+            self.step = 0
+            self.space_coordinates = []
+            self.camera_coordinates = []
+            self.recaptured = []
+            commands.extend(self.calibrationStep(uv, coordinates, timestamp))
+            return(commands)
+        # define camera center in machine coordinate space
+        newCenter = self.transformMatrix.T @ np.array([0, 0, 0, 0, 0, 1])
+        self.guessPosition = {'X': np.around(newCenter[0], 3), 'Y': np.around(newCenter[1], 3)}
+        _logger.debug('Calibration positional guess: ' + str(self.guessPosition))
+        self.state = self.ALIGNING
+        self.alignmentStartTime = timestamp
+        self.calibrationMoves = 0
+        # moves and time saved against the star pattern, estimated from the time per move of this run
+        calibrationTime = timestamp - self.startTime
+        patternMoves = self.patternMoves + len(self.recaptured)
+        starMoves = 2*len(self.calibrationPatterns['star']['points'])
+        movesSaved = starMoves - patternMoves
+        timeSaved = movesSaved * calibrationTime/max(patternMoves, 1)
+        commands.append({'type': 'event', 'event': 'cameraCalibrated', 'mpp': self.mpp, 'residual': self.transformResidual,
+            'residualPixels': residualPixels, 'residualAccepted': bool(residualPixels <= self.maxResidual),
+            'transformMatrix': self.transformMatrix, 'guessPosition': self.guessPosition, 'time': calibrationTime,
+            'pattern': self.calibrationPattern, 'moves': patternMoves, 'measurements': len(self.camera_coordinates) + len(self.recaptured),
+            'movesSaved': movesSaved, 'timeSaved': timeSaved, 'pointResiduals': self.pointResiduals,
+            'recaptured': len(self.recaptured), 'dropped': dropped})
+        commands.append({'type': 'moveAbsolute', 'position': dict(self.guessPosition), 'moveSpeed': self.defaultSpeed})
+        return(commands)
+
+    # Check a cached transform with a few small moves: the machine displacement predicted from the
+    # detected UV has to match the actual displacement. On success, alignment continues from the
+    # last measurement; otherwise the camera is calibrated from scratch.
+    def validationStep(self, uv, coordinates, timestamp):
+        self.space_coordinates.append((coordinates['X'], coordinates['Y']))
+        self.camera_coordinates.append((uv[0], uv[1]))
+        if(self.step > 0):
+            predicted = self.mapPosition(self.camera_coordinates[-1]) - self.mapPosition(self.camera_coordinates[-2])
+            actual = np.array(self.space_coordinates[-1]) - np.array(self.space_coordinates[-2])
+            error = float(np.linalg.norm(predicted - actual))/self.mpp
+            _logger.debug('Transform validation move ' + str(self.step) + ': error ' + str(np.around(error, 2)) + 'px')
+            if(error > self.validationTolerance):
+                _logger.info('Cached camera calibration rejected (' + str(np.around(error, 2)) + 'px), calibrating camera..')
+                self.transformMatrix = None
+                self.mpp = None
+                self.validate = False
+                self.state = self.CALIBRATING
+                self.step = 0
+                self.space_coordinates = []
+                self.camera_coordinates = []
+                commands = [{'type': 'event', 'event': 'transformRejected', 'error': error}]
+                commands.extend(self.calibrationStep(uv, coordinates, timestamp))
+                return(commands)
+        if(self.step < len(self.validationPoints)):
+            if(self.step == 0):
+                offsets = self.validationPoints[0]
+            else:
+                offsets = np.array(self.validationPoints[self.step]) - np.array(self.validationPoints[self.step - 1])
+            self.step += 1
+            return([self.relativeMove(offsets)])
+        # transform confirmed
+        self.validate = False
+        self.state = self.ALIGNING
+        self.alignmentStartTime = timestamp
+        self.step = 0
+        self.space_coordinates = []
+        self.camera_coordinates = []
+        commands = [{'type': 'event', 'event': 'transformValidated', 'moves': len(self.validationPoints), 'time': timestamp - self.startTime}]
+        commands.extend(self.alignmentStep(uv, coordinates, timestamp))
+        return(commands)
+
+    # mm per pixel at the image center, from the linear terms of a (quadratic or affine) transform
+    def modelMpp(self, transformMatrix):
+        jacobian = np.array([transformMatrix[-3]/self.width, transformMatrix[-2]/self.height])
+        return(np.around(np.sqrt(abs(np.linalg.det(jacobian))), 3))
+
+    # machine position predicted by the transform for a UV coordinate
+    def mapPosition(self, uv):
+        cx, cy = self.normalize_coords(uv)
+        return(self.transformMatrix.T @ np.array([cx**2, cy**2, cx*cy, cx, cy, 1]))
+
+    # remaining correction (mm) below which the nozzle counts as aligned
+    def tolerance(self):
+        if(self.convergenceTolerance is not None):
+            return(self.convergenceTolerance)
+        return(max(self.detectionUncertainty * self.mpp, 0.001))
+
+    def alignmentStep(self, uv, coordinates, timestamp):
+        # increment moves counter
+        self.calibrationMoves += 1
+        # machine distance between the detected position and the camera center, from the quadratic model
+        cx, cy = self.normalize_coords(uv)
+        v = [cx**2, cy**2, cx*cy, cx, cy, 0]
+        error = self.transformMatrix.T @ v
+        errorNorm = float(np.linalg.norm(error))
+        if(self.lastMove is not None):
+            # the model should have seen the error change by exactly the last move: the ratio is the
+            # model's response to a 1mm move, and its inverse the gain that makes the next step land.
+            # Short moves are dominated by detection noise and leave the gain alone.
+            moveNorm = float(np.linalg.norm(self.lastMove))
+            if(moveNorm >= self.gainEstimateDistance * self.mpp):
+                response = float(np.dot(error - self.lastError, self.lastMove))/moveNorm**2
+                if(response > 0):
+                    self.controlGain = min(max(1/response, self.minGain), self.maxGain)
+                else:
+                    self.controlGain = self.minGain
+            elif(float(np.dot(error, self.lastError)) < 0):
+                # stepped across the center: damp the next step
+                self.controlGain = max(self.controlGain/2, self.minGain)
+            elif(self.controlGain < self.initialGain):
+                # fell short: recover from damping (or from a bad detection)
+                self.controlGain = min(self.controlGain*2, self.initialGain)
+        offsets = -1 * self.controlGain * error
+        offsets[0] = np.around(offsets[0], 3)
+        offsets[1] = np.around(offsets[1], 3)
+        if(self.endstop):
+            converged = (abs(error[0]) + abs(error[1]) <= self.endstopTolerance)
+        else:
+            converged = (errorNorm <= self.tolerance())
+        if(converged):
+            offsets[0] = 0.0
+            offsets[1] = 0.0
+        self.offsets = offsets
+        _logger.debug('*** Alignment step: ' + str(self.calibrationMoves) + ' Coords:' + str(coordinates) + ' UV: ' + str(uv) + ' Offsets: ' + str(offsets) + ' Gain: ' + str(np.around(self.controlGain, 3)))
+        self.olduv = uv
+        runtime = timestamp - self.alignmentStartTime
+        if(runtime > self.maxRuntime or self.calibrationMoves > self.maxMoves):
+            return(self.fail('Alignment did not converge (' + str(self.calibrationMoves) + ' moves, ' + str(np.around(runtime, 1)) + 's).'))
+        elif(offsets[0] != 0.0 or offsets[1] != 0.0):
+            self.lastError = error
+            self.lastMove = np.array([offsets[0], offsets[1]])
+            return([self.relativeMove(offsets, moveSpeed=self.alignmentSpeed)])
+        # aligned to the center
+        self.state = self.ALIGNED
+        self.position = coordinates
+        return([{'type': 'event', 'event': 'aligned', 'position': coordinates, 'moves': self.calibrationMoves,
+            'time': timestamp - self.startTime, 'correction': errorNorm, 'gain': self.controlGain}])
+
+    def absoluteMove(self, position, moveSpeed=None):
+        if(moveSpeed is None):
+            moveSpeed = self.defaultSpeed
+        return({'type': 'moveAbsolute', 'position': {'X': position[0], 'Y': position[1]}, 'moveSpeed': moveSpeed})
+
+    def relativeMove(self, offsets, moveSpeed=None):
+        if(moveSpeed is None):
+            moveSpeed = self.defaultSpeed
+        return({'type': 'moveRelative', 'position': {'X': offsets[0], 'Y': offsets[1]}, 'moveSpeed': moveSpeed})
+
+    def normalize_coords(self, coords):
+        return(coords[0] / self.width - 0.5, coords[1] / self.height - 0.5)
+
+# final tool offsets for a nozzle aligned at position
+def toolOffsets(cpCoordinates, currentOffsets, position):
+    finalOffsets = {}
+    finalOffsets['X'] = float(np.around(cpCoordinates['X'] + currentOffsets['X'] - position['X'], 3))
+    finalOffsets['Y'] = float(np.around(cpCoordinates['Y'] + currentOffsets['Y'] - position['Y'], 3))
+    finalOffsets['Z'] = float(np.around(currentOffsets['Z'], 3))
+    return(finalOffsets)
+
+# Predicted position for a tool: where its nozzle should be centered over the camera, given the
+# offsets it was last aligned with (the inverse of toolOffsets). Equals the CP while the firmware
+# still holds those offsets.
+def expectedPosition(cpCoordinates, currentOffsets, lastOffsets):
+    position = dict(cpCoordinates)
+    position['X'] = float(np.around(cpCoordinates['X'] + currentOffsets['X'] - lastOffsets['X'], 3))
+    position['Y'] = float(np.around(cpCoordinates['Y'] + currentOffsets['Y'] - lastOffsets['Y'], 3))
+    return(position)
+
+# True when a shift (mm) from the camera center stays well inside the camera view
+def withinView(shiftX, shiftY, mpp, width, height):
+    if(mpp is None):
+        return(False)
+    return(abs(shiftX) <= 0.4*mpp*width and abs(shiftY) <= 0.4*mpp*height)
+
+def getDistance(x1, y1, x0, y0):
+    x_dist = (float(x1) - float(x0)) ** 2
+    y_dist = (float(y1) - float(y0)) ** 2
+    return(np.around(np.sqrt(x_dist + y_dist), 3))
+
+# returns the transform, the RMS fit residual and the residual of every point, in machine units (mm).
+# With a huberThreshold (mm) the fit is iteratively reweighted (Huber IRLS): points beyond the
+# threshold lose influence in proportion to their residual, so a single bad detection cannot
+# pull the whole map. affine fits only the linear and constant terms.
+def least_square_mapping(calibration_points, huberThreshold=None, iterations=10, affine=False):
+    # Compute a 2x2 map from displacement vectors in screen space to real space.
+    n = len(calibration_points)
+    real_coords, pixel_coords = np.empty((n, 2)), np.empty((n, 2))
+    for i, (r, p) in enumerate(calibration_points):
+        real_coords[i] = r
+        pixel_coords[i] = p
+    x, y = pixel_coords[:, 0], pixel_coords[:, 1]
+    if(affine):
+        A = np.vstack([x, y, np.ones(n)]).T
+    else:
+        A = np.vstack([x**2, y**2, x * y, x, y, np.ones(n)]).T
+    weights = np.ones(n)
+    for iteration in range(iterations if huberThreshold is not None else 1):
+        scale = np.sqrt(weights)[:, np.newaxis]
+        transform = np.linalg.lstsq(A*scale, real_coords*scale, rcond=None)[0]
+        residuals = np.sqrt(np.sum((A @ transform - real_coords)**2, axis=1))
+        if(huberThreshold is None):
+            break
+        newWeights = np.minimum(1.0, huberThreshold/np.maximum(residuals, 1e-12))
+        if(np.allclose(newWeights, weights, atol=1e-3)):
+            break
+        weights = newWeights
+    return(transform, float(np.sqrt(np.mean(residuals**2))), residuals)
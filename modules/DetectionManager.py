@@ -5,10 +5,11 @@ _logger = logging.getLogger('TAMV.DetectionManager')
 
 import cv2
 import numpy as np
-from PyQt5.QtGui import QPixmap, QImage
-from PyQt5.QtCore import pyqtSlot, QObject, pyqtSignal
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import pyqtSlot, QObject, pyqtSignal, QTimer
 from time import sleep
-import copy, sys, multiprocessing
+import copy, sys, multiprocessing, time, queue, threading
+from modules.Detector import Detector
 
 class DetectionManager(QObject):
     # class attributes
@@ -22,7 +23,36 @@ class DetectionManager(QObject):
     __running = True
     __uv = None
     __counter = 0
-    __algorithm = None
+    # timestamp of the frame currently being analyzed
+    __frameTime = 0
+    # detection result (UV + quality metrics) sent to the main thread
+    __result = None
+    # shape metrics from the last detection
+    __metrics = None
+    # detection worker processes (0 = detect in the Detection Manager thread)
+    __workers = 1
+    # preview frame scale returned by the detection workers
+    __previewScale = 0.5
+    # grayscale (luma only) preview
+    __previewLuma = False
+    # minimum time between published preview frames (in seconds)
+    __previewInterval = 1/12
+    # last published preview time
+    __previewTime = 0
+    # latest preview frame, waiting for the main thread
+    __preview = None
+    # a preview notification is waiting for the main thread
+    __previewPending = False
+    # frame processing loop is scheduled
+    __videoLoopActive = False
+    # detection job counter
+    __jobId = 0
+    # maximum wait for detection worker results (in seconds)
+    __workerTimeout = 5
+    # measurement waiting for a detection from a frame captured after its move
+    __measurement = None
+    # maximum wait for a fresh detection before answering with the latest one (in seconds)
+    __measureTimeout = 2
     
     # Signals
     detectionManagerNewFrameSignal = pyqtSignal(object)
@@ -38,6 +68,7 @@ class DetectionManager(QObject):
     detectionManagerAutoEndStopSignal = pyqtSignal(object)
     detectionManagerArrayFrameSignal = pyqtSignal(object)
     detectionManagerUVCoordinatesSignal = pyqtSignal(object)
+    detectionManagerMeasurementSignal = pyqtSignal(object)
 
     ##### Setup functions
     # init function
@@ -57,8 +88,30 @@ class DetectionManager(QObject):
             self.__frameSize['height'] = kwargs['height']
         except KeyError:
             self.__frameSize['height'] = 480
+        try:
+            self.__detectorProfile = kwargs['detectorProfile']
+        except KeyError:
+            self.__detectorProfile = None
+        try:
+            self.__workers = max(int(kwargs['workers']), 0)
+        except KeyError:
+            self.__workers = 1
+        try:
+            self.__previewScale = min(max(float(kwargs['previewScale']), 0.1), 1.0)
+        except KeyError:
+            self.__previewScale = 0.5
+        try:
+            self.__previewLuma = bool(kwargs['previewLuma'])
+        except KeyError:
+            self.__previewLuma = False
+        try:
+            self.__previewInterval = 1/min(max(float(kwargs['previewFPS']), 1), 30)
+        except KeyError:
+            self.__previewInterval = 1/12
+        self.__previewLock = threading.Lock()
         self.startCamera()
-        self.createDetectors()
+        # computer vision core
+        self.__detector = Detector(profile=self.__detectorProfile)
         self.processFrame()
 
         self.uv = [None, None]
@@ -82,8 +135,19 @@ class DetectionManager(QObject):
         self.frameEvent = multiprocessing.Event()
         self.stopEvent = multiprocessing.Event()
         self.pipeDM, self.pipeQ = multiprocessing.Pipe()
+        # detection worker processes, fed directly by the camera process
+        self.jobQueue = None
+        self.resultQueue = None
+        self.workerProcs = []
+        if(self.__workers > 0):
+            self.jobQueue = multiprocessing.Queue()
+            self.resultQueue = multiprocessing.Queue()
+            for i in range(self.__workers):
+                workerProc = multiprocessing.Process(target=_detectionWorker, args=(self.jobQueue, self.resultQueue, self.stopEvent, self.__detectorProfile))
+                workerProc.daemon = True
+                self.workerProcs.append(workerProc)
         
-        self.proc = multiprocessing.Process(target=_reader, args=(self.pipeQ, self.frameEvent, self.stopEvent, self.__videoSource, self.__frameSize['height'], self.__frameSize['width'], self.backend))
+        self.proc = multiprocessing.Process(target=_reader, args=(self.pipeQ, self.frameEvent, self.stopEvent, self.__videoSource, self.__frameSize['height'], self.__frameSize['width'], self.backend, self.jobQueue))
         self.proc.daemon = True
         # send exiting to log
         _logger.debug('*** exiting DetectionManager.startCamera')
@@ -124,57 +188,6 @@ class DetectionManager(QObject):
         # send exiting to log
         _logger.debug('*** exiting DetectionManager.cameraReady')
 
-    def createDetectors(self):
-        # Standard Parameters
-        if(True):
-            self.standardParams = cv2.SimpleBlobDetector_Params()
-            # Thresholds
-            self.standardParams.minThreshold = 1
-            self.standardParams.maxThreshold = 50
-            self.standardParams.thresholdStep = 1
-            # Area
-            self.standardParams.filterByArea = True
-            self.standardParams.minArea = 400
-            self.standardParams.maxArea = 900
-            # Circularity
-            self.standardParams.filterByCircularity = True
-            self.standardParams.minCircularity = 0.8
-            self.standardParams.maxCircularity= 1
-            # Convexity
-            self.standardParams.filterByConvexity = True
-            self.standardParams.minConvexity = 0.3
-            self.standardParams.maxConvexity = 1
-            # Inertia
-            self.standardParams.filterByInertia = True
-            self.standardParams.minInertiaRatio = 0.3
-
-        # Relaxed Parameters
-        if(True):
-            self.relaxedParams = cv2.SimpleBlobDetector_Params()
-            # Thresholds
-            self.relaxedParams.minThreshold = 1
-            self.relaxedParams.maxThreshold = 50
-            self.relaxedParams.thresholdStep = 1
-            # Area
-            self.relaxedParams.filterByArea = True
-            self.relaxedParams.minArea = 600
-            self.relaxedParams.maxArea = 15000
-            # Circularity
-            self.relaxedParams.filterByCircularity = True
-            self.relaxedParams.minCircularity = 0.6
-            self.relaxedParams.maxCircularity= 1
-            # Convexity
-            self.relaxedParams.filterByConvexity = True
-            self.relaxedParams.minConvexity = 0.1
-            self.relaxedParams.maxConvexity = 1
-            # Inertia
-            self.relaxedParams.filterByInertia = True
-            self.relaxedParams.minInertiaRatio = 0.3
-        
-        # Create 2 detectors
-        self.detector = cv2.SimpleBlobDetector_create(self.standardParams)
-        self.relaxedDetector = cv2.SimpleBlobDetector_create(self.relaxedParams)
-
     def quit(self):
         # send calling to log
         _logger.debug('*** calling DetectionManager.quit')
@@ -183,6 +196,10 @@ class DetectionManager(QObject):
         self.__running = False
         self.stopEvent.set()
         self.proc.join()
+        if(len(self.workerProcs) > 0):
+            _logger.info('  .. stopping detection workers..')
+            for workerProc in self.workerProcs:
+                workerProc.join(timeout=2)
         _logger.info('Detection Manager shut down successfully.')
         # send exiting to log
         _logger.debug('*** exiting DetectionManager.quit')
@@ -193,6 +210,11 @@ class DetectionManager(QObject):
         if(not self.proc.is_alive() and not self.stopEvent.is_set()):
             # Start camera process
             self.proc.start()
+            # Start detection workers
+            for workerProc in self.workerProcs:
+                workerProc.start()
+            if(self.__workers > 0):
+                _logger.info('  .. using ' + str(self.__workers) + ' detection worker process(es)..')
             # Retrieve camera settings
             try:
                 cameraSettings = self.pipeDM.recv()
@@ -212,8 +234,23 @@ class DetectionManager(QObject):
             errorMsg = 'Critical error: check camera. Restart TAMV.'
             _logger.exception(errorMsg)
             self.errorSignal.emit(errorMsg)
+        elif(self.__workers > 0):
+            try:
+                self.workerDetection()
+                self.answerMeasurement()
+                if(self.frame is not None):
+                    self.receivedFrame(self.frame)
+                self.scheduleFrame()
+            except Exception as e:
+                _logger.critical('Detection workers failed to return data.')
+                _logger.critical(e)
+                _logger.critical('Critical camera error. Please restart TAMV.')
+                # let resumeVideo restart the loop
+                self.__videoLoopActive = False
+                self.errorSignal.emit('Critical camera error. Please restart TAMV.')
         else:
             try:
+                self.__frameTime = time.time()
                 self.frameEvent.set()
                 self.frame = self.pipeDM.recv()
                 self.frameEvent.clear()
@@ -237,43 +274,211 @@ class DetectionManager(QObject):
                             self.burstNozzleDetection()
                 else:
                     pass
+                self.answerMeasurement()
                 self.receivedFrame(self.frame)
+                self.scheduleFrame()
             except Exception as e:
                 _logger.critical('Camera failed to retrieve data.')
                 _logger.critical(e)
                 _logger.critical('Critical camera error. Please restart TAMV.')
+                # let resumeVideo restart the loop
+                self.__videoLoopActive = False
                 self.errorSignal.emit('Critical camera error. Please restart TAMV.')
 
-    # convert from cv2.mat to QPixmap and return results (frame+keypoint)
+    # Frame processing runs on its own clock, independent of the main thread's repaint rate
+    def scheduleFrame(self):
+        if(self.__running and not self.stopEvent.is_set()):
+            self.__videoLoopActive = True
+            QTimer.singleShot(0, self.processFrame)
+        else:
+            self.__videoLoopActive = False
+
+    # restart the frame processing loop if it stopped
+    @pyqtSlot()
+    def resumeVideo(self):
+        if(self.__videoLoopActive is False):
+            self.processFrame()
+
+    # wrap cv2.mat in a QImage without copying and publish it as the latest preview (frame+keypoint)
+    # previews are published at most every __previewInterval, and only the newest frame is kept
+    # when the main thread falls behind (drop-oldest); the QPixmap is created by the main thread
     def receivedFrame(self, frame):
         self.__counter += 1
         if(self.__running):
-            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            convert_to_Qt_format = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            qpixmap = QPixmap.fromImage(convert_to_Qt_format)
-            try:
-                retObject = []
-                retObject.append(qpixmap)
-                self.detectionManagerNewFrameSignal.emit(retObject)
-            except: 
-                raise SystemExit('Fatal error in Detection Manager.')
+            now = time.time()
+            if(now - self.__previewTime < self.__previewInterval):
+                return
+            if(self.__previewLuma is True and len(frame.shape) > 2):
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            (qimage, frame) = frameToImage(frame)
+            retObject = []
+            retObject.append(qimage)
+            # the QImage does not own its pixels, keep the frame buffer alive alongside it
+            retObject.append(frame)
+            self.__previewLock.acquire()
+            self.__preview = retObject
+            notify = not self.__previewPending
+            self.__previewPending = True
+            self.__previewLock.release()
+            self.__previewTime = now
+            if(notify):
+                try:
+                    self.detectionManagerNewFrameSignal.emit(retObject)
+                except: 
+                    raise SystemExit('Fatal error in Detection Manager.')
+
+    # called from the main thread: returns the newest preview frame
+    def latestPreview(self):
+        self.__previewLock.acquire()
+        retObject = self.__preview
+        self.__previewPending = False
+        self.__previewLock.release()
+        return(retObject)
 
     @pyqtSlot()
     def sendUVCoorindates(self):
-        self.detectionManagerUVCoordinatesSignal.emit(self.__uv)
+        self.detectionManagerUVCoordinatesSignal.emit(self.latestResult())
+
+    def latestResult(self):
+        result = self.__result
+        if(result is None):
+            result = self.detectionResult(uv=self.__uv)
+        else:
+            result = copy.copy(result)
+        # age of the analyzed frame at the time the result is handed over
+        result['frameAge'] = float(np.around(time.time() - result['frameTime'], 3))
+        return(result)
+
+    # measurement request (machine position from the Printer Manager): answered with the first
+    # detection from a frame captured after request['notBefore'], position and detection together
+    @pyqtSlot(object)
+    def measure(self, request):
+        request['times']['detection'] = time.time()
+        self.__measurement = request
+        self.answerMeasurement()
+
+    def answerMeasurement(self):
+        request = self.__measurement
+        if(request is None):
+            return
+        result = self.__result
+        fresh = result is not None and result['frameTime'] >= request['notBefore']
+        if(not fresh and time.time() - request['times']['detection'] < self.__measureTimeout):
+            return
+        self.__measurement = None
+        request['detection'] = self.latestResult()
+        request['times']['detected'] = time.time()
+        self.detectionManagerMeasurementSignal.emit(request)
+
+    # build detection result object (UV coordinates + detection quality metrics)
+    def detectionResult(self, uv=None, metrics=None, samples=None):
+        return(self.__detector.detectionResult(uv=uv, metrics=metrics, samples=samples, frameTime=self.__frameTime))
 
     @pyqtSlot(bool)
     def enableDetection(self, state=False):
         self.__enableDetection = state
 
 
+    ##### Worker process detection
+    # run the active detection mode on the detection workers
+    def workerDetection(self):
+        mode = None
+        autoDetection = False
+        if(self.__enableDetection is True):
+            if(self.__endstopDetectionActive is True):
+                mode = 'endstop'
+                autoDetection = self.__endstopAutomatedDetectionActive
+            elif(self.__nozzleDetectionActive is True):
+                mode = 'nozzle'
+                autoDetection = self.__nozzleAutoDetectionActive
+        if(mode == 'nozzle' and autoDetection is True):
+            self.burstWorkerDetection(mode, frameCount=3, maxRetries=5)
+        elif(mode is not None):
+            results = self.requestDetection(mode, autoDetection, frameCount=1)
+            if(len(results) == 0):
+                # workers answered late: report no detection for this frame
+                self.__uv = None
+                self.__result = self.detectionResult(uv=None, metrics=self.__metrics, samples=[])
+                return
+            result = results[0]
+            self.__frameTime = result['frameTime']
+            self.__metrics = result['metrics']
+            samples = []
+            if(result['center'][0] is not None and result['center'][1] is not None):
+                self.__uv = [float(result['center'][0]), float(result['center'][1])]
+                samples.append(self.__uv)
+            else:
+                self.__uv = None
+            self.__result = self.detectionResult(uv=self.__uv, metrics=self.__metrics, samples=samples)
+        else:
+            self.requestDetection(None, False, frameCount=1)
+
+    # detect on several consecutive frames in parallel and average the results
+    def burstWorkerDetection(self, mode, frameCount=3, maxRetries=5):
+        samples = []
+        frameTimes = []
+        retries = 0
+        while(len(samples) < frameCount and retries <= maxRetries):
+            results = self.requestDetection(mode, True, frameCount=frameCount-len(samples))
+            if(len(results) == 0):
+                retries += 1
+            for result in results:
+                if(result['center'][0] is not None and result['center'][1] is not None):
+                    samples.append(result['center'])
+                    frameTimes.append(result['frameTime'])
+                    self.__metrics = result['metrics']
+                else:
+                    retries += 1
+        if(len(samples) >= frameCount):
+            # oldest frame used for the average
+            self.__frameTime = min(frameTimes)
+            self.__uv = np.around(np.mean(np.array(samples, dtype=float), axis=0), 0)
+        else:
+            self.__uv = None
+        self.__result = self.detectionResult(uv=self.__uv, metrics=self.__metrics, samples=samples)
+
+    # send a detection job to the camera process and collect the results from the workers
+    def requestDetection(self, mode, autoDetection, frameCount=1):
+        self.__jobId += 1
+        job = {
+            'id': self.__jobId,
+            'mode': mode,
+            'autoDetection': autoDetection,
+            'algorithm': self.__detector.algorithm,
+            'frames': frameCount,
+            'previewScale': self.__previewScale,
+            'previewLuma': self.__previewLuma
+        }
+        self.pipeDM.send({'job': job})
+        results = []
+        while(len(results) < frameCount):
+            try:
+                result = self.resultQueue.get(timeout=self.__workerTimeout)
+            except queue.Empty:
+                # a slow burst must not stop the video loop: return what arrived, late results are dropped by id
+                _logger.warning('Detection workers did not answer within ' + str(self.__workerTimeout) + 's, skipping frame.')
+                break
+            # drop late results from earlier jobs
+            if(result['id'] != job['id']):
+                continue
+            results.append(result)
+        results.sort(key=lambda result: result['index'])
+        # remember the nozzle algorithm that worked, so the workers skip the cascade
+        if(mode == 'nozzle'):
+            for result in results:
+                if(result['algorithm'] is not None):
+                    self.__detector.algorithm = result['algorithm']
+                    break
+        if(len(results) > 0):
+            self.frame = results[-1]['preview']
+        return(results)
+
     ##### Endstop detection
     def analyzeEndstopFrame(self):
         detectionCount = 0
         self.uv = [None, None]
         average_location=[0,0]
+        samples = []
         retries = 0
         while(detectionCount < 5):
             (self.__uv, self.frame) = self.endstopContourDetection(self.frame)
@@ -281,6 +486,7 @@ class DetectionManager(QObject):
                 if(self.__uv[0] is not None and self.__uv[1] is not None):
                     average_location[0] += np.around(self.__uv[0],0)
                     average_location[1] += np.around(self.__uv[1],0)
+                    samples.append(self.__uv)
                     detectionCount += 1
                 else:
                     retries += 1
@@ -299,12 +505,14 @@ class DetectionManager(QObject):
             self.__uv = average_location
         else:
             self.__uv = [None,None]
+        self.__result = self.detectionResult(uv=self.__uv, metrics=self.__metrics, samples=samples)
 
     @pyqtSlot(int)
     def burstEndstopDetection(self):
         detectionCount = 0
         self.uv = [0, 0]
         average_location=[0,0]
+        samples = []
         retries = 0
         while(detectionCount < 5):
             # for j in range(10):
@@ -316,6 +524,7 @@ class DetectionManager(QObject):
                 if(self.__uv[0] is not None and self.__uv[1] is not None):
                     average_location[0] += self.__uv[0]
                     average_location[1] += self.__uv[1]
+                    samples.append(self.__uv)
                     detectionCount += 1
                 else:
                     retries += 1
@@ -334,62 +543,10 @@ class DetectionManager(QObject):
             self.__uv = average_location
         else:
             self.__uv = None
+        self.__result = self.detectionResult(uv=self.__uv, metrics=self.__metrics, samples=samples)
 
     def endstopContourDetection(self, detectFrame):
-        center = (None, None)
-        if(self.__endstopAutomatedDetectionActive is True):
-            # apply endstop detection algorithm
-            usedFrame = copy.deepcopy(detectFrame)
-            yuv = cv2.cvtColor(usedFrame, cv2.COLOR_BGR2YUV)
-            yuvPlanes = cv2.split(yuv)
-            still = yuvPlanes[0]
-            black = np.zeros((still.shape[0],still.shape[1]), np.uint8)
-            kernel = np.ones((5,5),np.uint8)
-            img_blur = cv2.GaussianBlur(still, (7, 7), 3)
-            img_canny = cv2.Canny(img_blur, 50, 190)
-            img_dilate = cv2.morphologyEx(img_canny, cv2.MORPH_DILATE, kernel, iterations=2)
-            cnt, hierarchy = cv2.findContours(img_dilate, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-            black = cv2.drawContours(black, cnt, -1, (255, 0, 255), -1)
-            black = cv2.morphologyEx(black, cv2.MORPH_DILATE, kernel, iterations=2)
-            cnt2, hierarchy2 = cv2.findContours(black, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-            black = cv2.cvtColor(black, cv2.COLOR_GRAY2BGR)
-            # detectFrame = black
-            if len(cnt2) > 0:
-                myContours = []
-                for k in range(len(cnt2)):
-                    if hierarchy2[0][k][3] > -1:
-                        myContours.append(cnt2[k])
-                if len(myContours) > 0:
-                    # return only the biggest detected contour
-                    blobContours = max(myContours, key=lambda el: cv2.contourArea(el))
-                    contourArea = cv2.contourArea(blobContours)
-                    if( len(blobContours) > 0 and contourArea >= 43000 and contourArea < 50000):
-                        M = cv2.moments(blobContours)
-                        center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-                        detectFrame = cv2.circle(detectFrame, center, 150, (255,0,0), 5,lineType=cv2.LINE_AA)
-                        detectFrame = cv2.circle(detectFrame, center, 5, (255,0,255), 2,lineType=cv2.LINE_AA)
-                        
-                        detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320,480), color=(0,0,0), horizontal=False, segmentWidth=4, lineWidth=2)
-                        detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(640,240), color=(0,0,0), horizontal=True, segmentWidth=4, lineWidth=2)
-                        detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320,480), horizontal=False, segmentWidth=4, lineWidth=1)
-                        detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(640,240), horizontal=True, segmentWidth=4, lineWidth=1)
-                        
-        else:
-            # draw crosshair
-            keypointRadius = 57
-            width = 4
-            detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320, 240-keypointRadius), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
-            detectFrame = self.dashedLine(image=detectFrame, start=(320,240+keypointRadius), end=(320,480), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
-            detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320, 240-keypointRadius), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
-            detectFrame = self.dashedLine(image=detectFrame, start=(320,240+keypointRadius), end=(320,480), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
-
-            detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(320-keypointRadius, 240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
-            detectFrame = self.dashedLine(image=detectFrame, start=(320+keypointRadius,240), end=(640,240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
-            detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(320-keypointRadius, 240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
-            detectFrame = self.dashedLine(image=detectFrame, start=(320+keypointRadius,240), end=(640,240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
-
-            detectFrame = cv2.circle(img=detectFrame, center=(320,240), radius=keypointRadius, color=(0,0,0), thickness=3,lineType=cv2.LINE_AA)
-            detectFrame = cv2.circle(img=detectFrame, center=(320,240), radius=keypointRadius+1, color=(0,0,255), thickness=1,lineType=cv2.LINE_AA)
+        (center, detectFrame, self.__metrics) = self.__detector.endstopContourDetection(detectFrame, autoDetection=self.__endstopAutomatedDetectionActive)
         return(center,detectFrame)
 
     @pyqtSlot(bool)
@@ -407,24 +564,7 @@ class DetectionManager(QObject):
         else:
             self.__endstopDetectionActive = False
             self.__endstopAutomatedDetectionActive = False
-            self.__algorithm = None
-
-
-    def dashedLine(self, image, start, end, color=(255,255,255), segmentWidth=10, horizontal=True, lineWidth=1):
-        if(horizontal):
-            segments = int((end[0] - start[0])/segmentWidth)
-        else:
-            segments = int((end[1] - start[1])/segmentWidth)
-        for i in range(segments):
-            if(horizontal):
-                segmentStart = (start[0] + segmentWidth*i, start[1])
-                segmentEnd = (segmentStart[0]+segmentWidth, segmentStart[1])
-            else:
-                segmentStart = (start[0], start[1] + segmentWidth*i)
-                segmentEnd = (segmentStart[0], segmentStart[1]+segmentWidth)
-            if(i%2 == 0):
-                image = cv2.line( image, segmentStart, segmentEnd, color, lineWidth)
-        return(image)
+            self.__detector.resetAlgorithm()
 
     ##### Nozzle detection
     def analyzeNozzleFrame(self):
@@ -434,33 +574,21 @@ class DetectionManager(QObject):
         retries = 0
         self.__uv = [None,None]
         self.__uv, self.frame = self.nozzleDetection()
+        self.__result = self.detectionResult(uv=self.__uv, metrics=self.__metrics)
         # draw crosshair
-        keypointRadius = 17
-        width = 4
-        self.frame = self.dashedLine(image=self.frame, start=(320,0), end=(320, 240-keypointRadius), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
-        self.frame = self.dashedLine(image=self.frame, start=(320,240+keypointRadius), end=(320,480), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
-        self.frame = self.dashedLine(image=self.frame, start=(320,0), end=(320, 240-keypointRadius), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
-        self.frame = self.dashedLine(image=self.frame, start=(320,240+keypointRadius), end=(320,480), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
-
-        self.frame = self.dashedLine(image=self.frame, start=(0,240), end=(320-keypointRadius, 240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
-        self.frame = self.dashedLine(image=self.frame, start=(320+keypointRadius,240), end=(640,240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
-        self.frame = self.dashedLine(image=self.frame, start=(0,240), end=(320-keypointRadius, 240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
-        self.frame = self.dashedLine(image=self.frame, start=(320+keypointRadius,240), end=(640,240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
-
-        self.frame = self.dashedLine(image=self.frame, start=(320-keypointRadius,240), end=(320+keypointRadius, 240), color=(0,0,0), horizontal=True, lineWidth=1, segmentWidth=1)
-        self.frame = self.dashedLine(image=self.frame, start=(320,240-keypointRadius), end=(320, 240+keypointRadius), color=(0,0,0), horizontal=False, lineWidth=1, segmentWidth=1)
-
-        self.frame = cv2.circle(img=self.frame, center=(320,240), radius=keypointRadius, color=(0,0,0), thickness=3,lineType=cv2.LINE_AA)
-        self.frame = cv2.circle(img=self.frame, center=(320,240), radius=keypointRadius+1, color=(0,0,255), thickness=1,lineType=cv2.LINE_AA)
+        self.frame = self.__detector.drawNozzleCrosshair(self.frame)
 
     def burstNozzleDetection(self):
         detectionCount = 0
         self.uv = [None, None]
         average_location=[0,0]
+        samples = []
+        frameTimes = []
         retries = 0
         while(detectionCount < 3):
             # skip a few frames
             for i in range(1):
+                self.__frameTime = time.time()
                 self.frameEvent.set()
                 self.frame = self.pipeDM.recv()
                 self.frameEvent.clear()
@@ -469,6 +597,8 @@ class DetectionManager(QObject):
                 if(self.__uv[0] is not None and self.__uv[1] is not None):
                     average_location[0] += self.__uv[0]
                     average_location[1] += self.__uv[1]
+                    samples.append(self.__uv)
+                    frameTimes.append(self.__frameTime)
                     detectionCount += 1
                 else:
                     retries += 1
@@ -485,88 +615,14 @@ class DetectionManager(QObject):
             # round to 0 decimal places
             average_location = np.around(average_location,0)
             self.__uv = average_location
+            # oldest frame used for the average
+            self.__frameTime = min(frameTimes)
         else:
             self.__uv = None
+        self.__result = self.detectionResult(uv=self.__uv, metrics=self.__metrics, samples=samples)
 
     def nozzleDetection(self):
-        # working frame object
-        nozzleDetectFrame = copy.deepcopy(self.frame)
-        # return value for keypoints
-        keypoints = None
-        center = (None, None)
-        # check which algorithm worked previously
-        if(self.__algorithm is None):
-            preprocessorImage0 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=0)
-            preprocessorImage1 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=1)
-
-            # apply combo 1 (standard detector, preprocessor 0)
-            keypoints = self.detector.detect(preprocessorImage0)
-            keypointColor = (0,0,255)
-            if(len(keypoints) != 1):
-                # apply combo 2 (standard detector, preprocessor 1)
-                keypoints = self.detector.detect(preprocessorImage1)
-                keypointColor = (0,255,0)
-                if(len(keypoints) != 1):
-                    # apply combo 3 (standard detector, preprocessor 0)
-                    keypoints = self.relaxedDetector.detect(preprocessorImage0)
-                    keypointColor = (255,0,0)
-                    if(len(keypoints) != 1):
-                        # apply combo 4 (standard detector, preprocessor 1)
-                        keypoints = self.relaxedDetector.detect(preprocessorImage1)
-                        keypointColor = (39,127,255)
-                        if(len(keypoints) != 1):
-                            # failed to detect a nozzle, correct return value object
-                            keypoints = None
-                        else:
-                            self.__algorithm = 4
-                    else:
-                        self.__algorithm = 3
-                else:
-                    self.__algorithm = 2
-            else:
-                self.__algorithm = 1
-        elif(self.__algorithm == 1):
-            preprocessorImage0 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=0)
-            keypoints = self.detector.detect(preprocessorImage0)
-            keypointColor = (0,0,255)
-        elif(self.__algorithm == 2):
-            preprocessorImage1 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=1)
-            keypoints = self.detector.detect(preprocessorImage1)
-            keypointColor = (0,255,0)
-        elif(self.__algorithm == 3):
-            preprocessorImage0 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=0)
-            keypoints = self.relaxedDetector.detect(preprocessorImage0)
-            keypointColor = (255,0,0)
-        else:
-            preprocessorImage1 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=1)
-            keypoints = self.relaxedDetector.detect(preprocessorImage1)
-            keypointColor = (39,127,255)
-        # process keypoint
-        if(keypoints is not None and len(keypoints) >= 1):
-            # create center object
-            (x,y) = np.around(keypoints[0].pt)
-            x,y = int(x), int(y)
-            center = (x,y)
-            # create radius object
-            keypointRadius = np.around(keypoints[0].size/2)
-            keypointRadius = int(keypointRadius)
-            circleFrame = cv2.circle(img=nozzleDetectFrame, center=center, radius=keypointRadius,color=keypointColor,thickness=-1,lineType=cv2.LINE_AA)
-            nozzleDetectFrame = cv2.addWeighted(circleFrame, 0.4, nozzleDetectFrame, 0.6, 0)
-            nozzleDetectFrame = cv2.circle(img=nozzleDetectFrame, center=center, radius=keypointRadius, color=(0,0,0), thickness=1,lineType=cv2.LINE_AA)
-            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (x-5,y), (x+5, y), (255,255,255), 2)
-            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (x,y-5), (x, y+5), (255,255,255), 2)
-        elif(self.__nozzleAutoDetectionActive is True):
-            # no keypoints, draw a 3 outline circle in the middle of the frame
-            keypointRadius = 17
-            nozzleDetectFrame = cv2.circle(img=nozzleDetectFrame, center=(320,240), radius=keypointRadius, color=(0,0,0), thickness=3,lineType=cv2.LINE_AA)
-            nozzleDetectFrame = cv2.circle(img=nozzleDetectFrame, center=(320,240), radius=keypointRadius+1, color=(0,0,255), thickness=1,lineType=cv2.LINE_AA)
-            center = (None, None)
-        if(self.__nozzleAutoDetectionActive is True):
-            # draw crosshair
-            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (320,0), (320,480), (0,0,0), 2)
-            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (0,240), (640,240), (0,0,0), 2)
-            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (320,0), (320,480), (255,255,255), 1)
-            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (0,240), (640,240), (255,255,255), 1)
+        (center, nozzleDetectFrame, self.__metrics) = self.__detector.nozzleDetection(self.frame, autoDetection=self.__nozzleAutoDetectionActive)
         return(center, nozzleDetectFrame)
 
     @pyqtSlot(bool)
@@ -581,40 +637,11 @@ class DetectionManager(QObject):
         if(nozzleDetectFlag is True):
             self.__nozzleDetectionActive = True
             self.__nozzleAutoDetectionActive = True
-            self.__algorithm = None
+            self.__detector.resetAlgorithm()
         else:
             self.__nozzleDetectionActive = False
             self.__nozzleAutoDetectionActive = False
     
-    ##### Utilities
-    # adjust image gamma
-    def adjust_gamma(self, image, gamma=1.2):
-        # build a lookup table mapping the pixel values [0, 255] to
-        # their adjusted gamma values
-        invGamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** invGamma) * 255
-            for i in np.arange(0, 256)]).astype( 'uint8' )
-        # apply gamma correction using the lookup table
-        return cv2.LUT(image, table)
-
-    # Image detection preprocessors
-    def preprocessImage(self, frameInput, algorithm=0):
-        try:
-            outputFrame = self.adjust_gamma(image=frameInput, gamma=1.2)
-        except: outputFrame = copy.deepcopy(frameInput)
-        if(algorithm == 0):
-            yuv = cv2.cvtColor(outputFrame, cv2.COLOR_BGR2YUV)
-            yuvPlanes = cv2.split(yuv)
-            yuvPlanes[0] = cv2.GaussianBlur(yuvPlanes[0],(7,7),6)
-            yuvPlanes[0] = cv2.adaptiveThreshold(yuvPlanes[0],255,cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,35,1)
-            outputFrame = cv2.cvtColor(yuvPlanes[0],cv2.COLOR_GRAY2BGR)
-        elif(algorithm == 1):
-            outputFrame = cv2.cvtColor(outputFrame, cv2.COLOR_BGR2GRAY )
-            thr_val, outputFrame = cv2.threshold(outputFrame, 127, 255, cv2.THRESH_BINARY|cv2.THRESH_TRIANGLE )
-            outputFrame = cv2.GaussianBlur( outputFrame, (7,7), 6 )
-            outputFrame = cv2.cvtColor( outputFrame, cv2.COLOR_GRAY2BGR )
-        return(outputFrame)
-
     ##### Image adjustment properties
     @pyqtSlot(object)
     def getImageProperties(self, imageSettings):
@@ -650,8 +677,25 @@ class DetectionManager(QObject):
         settings = {'brightness': self.__brightnessDefault, 'contrast': self.__contrastDefault, 'saturation': self.__saturationDefault, 'hue': self.__hueDefault}
         self.pipeDM.send(settings)
 
+# wrap cv2.mat (BGR or grayscale) in a QImage sharing the frame buffer
+# Returns: (QImage, frame), the frame must be kept alive as long as the QImage is used
+def frameToImage(frame):
+    frame = np.ascontiguousarray(frame)
+    if(len(frame.shape) == 2):
+        h, w = frame.shape
+        image = QImage(frame.data, w, h, frame.strides[0], QImage.Format_Grayscale8)
+    elif(hasattr(QImage, 'Format_BGR888')):
+        h, w, ch = frame.shape
+        image = QImage(frame.data, w, h, frame.strides[0], QImage.Format_BGR888)
+    else:
+        # Qt older than 5.14 has no BGR888 format, convert the frame
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = frame.shape
+        image = QImage(frame.data, w, h, frame.strides[0], QImage.Format_RGB888)
+    return(image, frame)
+
 # Independent process to run camera grab functions
-def _reader(q, frameEvent, stopEvent, videoSrc, height, width, backend):
+def _reader(q, frameEvent, stopEvent, videoSrc, height, width, backend, jobQueue=None):
         cap = cv2.VideoCapture(videoSrc, backend)
         cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
@@ -690,6 +734,15 @@ def _reader(q, frameEvent, stopEvent, videoSrc, height, width, backend):
             # check for inputs
             if(q.poll(FPS/2)):
                 settings = q.recv()
+                # detection job: hand consecutive frames straight to the detection workers
+                if('job' in settings):
+                    job = settings['job']
+                    for index in range(job['frames']):
+                        if(index > 0):
+                            cap.grab()
+                        ret, frame = cap.retrieve()
+                        jobQueue.put((job, index, time.time(), frame))
+                    continue
                 try:
                     brightness = float(settings['brightness'])
                 except KeyError: pass
@@ -712,4 +765,36 @@ def _reader(q, frameEvent, stopEvent, videoSrc, height, width, backend):
             sleep(FPS)
         cap.release()
         q.send(-1)
-        q.close()
\ No newline at end of file
+        q.close()
+
+# Independent process to run detection on frames sent by the camera process
+def _detectionWorker(jobQueue, resultQueue, stopEvent, profile=None):
+    detector = Detector(profile=profile)
+    while not stopEvent.is_set():
+        try:
+            (job, index, frameTime, frame) = jobQueue.get(timeout=0.25)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            break
+        result = {'id': job['id'], 'index': index, 'frameTime': frameTime, 'center': (None, None), 'metrics': None, 'algorithm': None}
+        try:
+            if(job['mode'] == 'endstop'):
+                (result['center'], frame, result['metrics']) = detector.endstopContourDetection(frame, autoDetection=job['autoDetection'])
+            elif(job['mode'] == 'nozzle'):
+                detector.algorithm = job['algorithm']
+                (result['center'], frame, result['metrics']) = detector.nozzleDetection(frame, autoDetection=job['autoDetection'])
+                if(job['autoDetection'] is False):
+                    frame = detector.drawNozzleCrosshair(frame)
+                if(result['center'][0] is not None):
+                    result['algorithm'] = detector.algorithm
+            # downscaled preview frame
+            if(job['previewScale'] < 1):
+                frame = cv2.resize(frame, None, fx=job['previewScale'], fy=job['previewScale'], interpolation=cv2.INTER_AREA)
+            # luma preview, a third of the data to send back
+            if(job['previewLuma'] is True):
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        except Exception as e:
+            _logger.error('Detection worker error: ' + str(e))
+        result['preview'] = frame
+        resultQueue.put(result)
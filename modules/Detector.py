@@ -0,0 +1,487 @@
+import logging
+# invoke parent (TAMV) _logger
+_logger = logging.getLogger('TAMV.Detector')
+
+import cv2
+import numpy as np
+import copy, json, os
+
+# Default detector profile: SimpleBlobDetector parameters for the standard and relaxed detectors, and image preprocessing settings
+defaultProfile = {
+    'standard': {
+        # Thresholds
+        'minThreshold': 1,
+        'maxThreshold': 50,
+        'thresholdStep': 1,
+        # Area
+        'filterByArea': True,
+        'minArea': 400,
+        'maxArea': 900,
+        # Circularity
+        'filterByCircularity': True,
+        'minCircularity': 0.8,
+        'maxCircularity': 1,
+        # Convexity
+        'filterByConvexity': True,
+        'minConvexity': 0.3,
+        'maxConvexity': 1,
+        # Inertia
+        'filterByInertia': True,
+        'minInertiaRatio': 0.3
+    },
+    'relaxed': {
+        # Thresholds
+        'minThreshold': 1,
+        'maxThreshold': 50,
+        'thresholdStep': 1,
+        # Area
+        'filterByArea': True,
+        'minArea': 600,
+        'maxArea': 15000,
+        # Circularity
+        'filterByCircularity': True,
+        'minCircularity': 0.6,
+        'maxCircularity': 1,
+        # Convexity
+        'filterByConvexity': True,
+        'minConvexity': 0.1,
+        'maxConvexity': 1,
+        # Inertia
+        'filterByInertia': True,
+        'minInertiaRatio': 0.3
+    },
+    'preprocessing': {
+        'gamma': 1.2,
+        # gaussian blur kernel size (odd) and sigma
+        'blurSize': 7,
+        'blurSigma': 6,
+        # adaptive threshold block size (odd) and constant, used by preprocessor 0
+        'adaptiveBlockSize': 35,
+        'adaptiveC': 1
+    }
+}
+
+# location of saved detector profiles
+profileFile = './config/detectors.json'
+
+# merge profile settings on top of the default profile
+def mergeProfile(profile=None):
+    mergedProfile = copy.deepcopy(defaultProfile)
+    if(profile is None):
+        return(mergedProfile)
+    for section in mergedProfile:
+        try:
+            mergedProfile[section].update(profile[section])
+        except KeyError: pass
+    return(mergedProfile)
+
+# load a named detector profile from the profiles file
+def loadProfile(name, filename=None):
+    if(filename is None):
+        filename = profileFile
+    with open(filename, 'r') as inputfile:
+        profiles = json.load(inputfile)
+    try:
+        return(mergeProfile(profiles[name]))
+    except KeyError:
+        raise KeyError('Detector profile "' + str(name) + '" not found in ' + str(filename))
+
+# save a named detector profile to the profiles file, keeping the other profiles
+def saveProfile(name, profile, filename=None):
+    if(filename is None):
+        filename = profileFile
+    try:
+        with open(filename, 'r') as inputfile:
+            profiles = json.load(inputfile)
+    except FileNotFoundError:
+        profiles = {}
+    profiles[name] = mergeProfile(profile)
+    directory = os.path.dirname(filename)
+    if(directory != ''):
+        os.makedirs(directory, exist_ok=True)
+    with open(filename, 'w') as outputfile:
+        json.dump(profiles, outputfile, indent=4)
+
+# Computer vision core used by the Detection Manager.
+# This class has no Qt dependencies, so it can be used from worker processes and command-line tools.
+class Detector:
+    # class attributes
+    # relative trust in each detection algorithm (0 = endstop contour, 1-4 = nozzle detector/preprocessor combos)
+    algorithmWeights = {0: 1.0, 1: 1.0, 2: 0.9, 3: 0.75, 4: 0.7}
+    # endstop contour area window (in pixels)
+    endstopMinArea = 43000
+    endstopMaxArea = 50000
+
+    ##### Setup functions
+    # init function
+    def __init__(self, *args, **kwargs):
+        # draw detection overlays (keypoints, crosshairs) on the output frame
+        try:
+            self.drawOverlay = kwargs['drawOverlay']
+        except KeyError:
+            self.drawOverlay = True
+        # detector profile (blob parameters + preprocessing settings)
+        try:
+            self.profile = mergeProfile(kwargs['profile'])
+        except KeyError:
+            self.profile = mergeProfile()
+        # last nozzle algorithm that returned a single keypoint
+        self.algorithm = None
+        self.createDetectors()
+
+    def createDetectors(self):
+        self.standardParams = self.blobParameters(self.profile['standard'])
+        self.relaxedParams = self.blobParameters(self.profile['relaxed'])
+        # preprocessing settings, kernel and block sizes must be odd
+        preprocessing = self.profile['preprocessing']
+        self.gamma = float(preprocessing['gamma'])
+        self.blurSize = int(preprocessing['blurSize']) | 1
+        self.blurSigma = float(preprocessing['blurSigma'])
+        self.adaptiveBlockSize = max(int(preprocessing['adaptiveBlockSize']) | 1, 3)
+        self.adaptiveC = float(preprocessing['adaptiveC'])
+        # gamma lookup table
+        self.gammaTable = self.gammaLookupTable(self.gamma)
+
+        # Create 2 detectors
+        self.detector = cv2.SimpleBlobDetector_create(self.standardParams)
+        self.relaxedDetector = cv2.SimpleBlobDetector_create(self.relaxedParams)
+
+    # build SimpleBlobDetector_Params from a profile section
+    def blobParameters(self, settings):
+        params = cv2.SimpleBlobDetector_Params()
+        for (key, value) in settings.items():
+            if(not hasattr(params, key)):
+                raise KeyError('Unknown blob detector parameter: ' + str(key))
+            if(isinstance(getattr(params, key), bool)):
+                setattr(params, key, bool(value))
+            elif(isinstance(getattr(params, key), int)):
+                setattr(params, key, int(value))
+            else:
+                setattr(params, key, float(value))
+        return(params)
+
+    # forget the last successful nozzle algorithm and cascade through all of them on the next frame
+    def resetAlgorithm(self):
+        self.algorithm = None
+
+    ##### Endstop detection
+    # Returns: (center, frame, metrics)
+    def endstopContourDetection(self, detectFrame, autoDetection=True):
+        center = (None, None)
+        metrics = {'algorithm': 0, 'candidates': 0}
+        if(autoDetection is True):
+            # apply endstop detection algorithm
+            usedFrame = copy.deepcopy(detectFrame)
+            yuv = cv2.cvtColor(usedFrame, cv2.COLOR_BGR2YUV)
+            yuvPlanes = cv2.split(yuv)
+            still = yuvPlanes[0]
+            black = np.zeros((still.shape[0],still.shape[1]), np.uint8)
+            kernel = np.ones((5,5),np.uint8)
+            img_blur = cv2.GaussianBlur(still, (7, 7), 3)
+            img_canny = cv2.Canny(img_blur, 50, 190)
+            img_dilate = cv2.morphologyEx(img_canny, cv2.MORPH_DILATE, kernel, iterations=2)
+            cnt, hierarchy = cv2.findContours(img_dilate, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
+            black = cv2.drawContours(black, cnt, -1, (255, 0, 255), -1)
+            black = cv2.morphologyEx(black, cv2.MORPH_DILATE, kernel, iterations=2)
+            cnt2, hierarchy2 = cv2.findContours(black, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
+            if len(cnt2) > 0:
+                myContours = []
+                for k in range(len(cnt2)):
+                    if hierarchy2[0][k][3] > -1:
+                        myContours.append(cnt2[k])
+                if len(myContours) > 0:
+                    # return only the biggest detected contour
+                    areas = [cv2.contourArea(el) for el in myContours]
+                    blobIndex = int(np.argmax(areas))
+                    blobContours = myContours[blobIndex]
+                    contourArea = areas[blobIndex]
+                    metrics['candidates'] = len([area for area in areas if area >= self.endstopMinArea and area < self.endstopMaxArea])
+                    if( len(blobContours) > 0 and contourArea >= self.endstopMinArea and contourArea < self.endstopMaxArea):
+                        M = cv2.moments(blobContours)
+                        center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+                        metrics['area'] = contourArea
+                        metrics['radius'] = float(np.around(np.sqrt(contourArea/np.pi), 1))
+                        metrics['circularity'] = self.contourCircularity(blobContours)
+                        if(self.drawOverlay):
+                            detectFrame = cv2.circle(detectFrame, center, 150, (255,0,0), 5,lineType=cv2.LINE_AA)
+                            detectFrame = cv2.circle(detectFrame, center, 5, (255,0,255), 2,lineType=cv2.LINE_AA)
+
+                            detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320,480), color=(0,0,0), horizontal=False, segmentWidth=4, lineWidth=2)
+                            detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(640,240), color=(0,0,0), horizontal=True, segmentWidth=4, lineWidth=2)
+                            detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320,480), horizontal=False, segmentWidth=4, lineWidth=1)
+                            detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(640,240), horizontal=True, segmentWidth=4, lineWidth=1)
+        elif(self.drawOverlay):
+            # draw crosshair
+            keypointRadius = 57
+            width = 4
+            detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320, 240-keypointRadius), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
+            detectFrame = self.dashedLine(image=detectFrame, start=(320,240+keypointRadius), end=(320,480), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
+            detectFrame = self.dashedLine(image=detectFrame, start=(320,0), end=(320, 240-keypointRadius), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
+            detectFrame = self.dashedLine(image=detectFrame, start=(320,240+keypointRadius), end=(320,480), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
+
+            detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(320-keypointRadius, 240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
+            detectFrame = self.dashedLine(image=detectFrame, start=(320+keypointRadius,240), end=(640,240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
+            detectFrame = self.dashedLine(image=detectFrame, start=(0,240), end=(320-keypointRadius, 240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
+            detectFrame = self.dashedLine(image=detectFrame, start=(320+keypointRadius,240), end=(640,240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
+
+            detectFrame = cv2.circle(img=detectFrame, center=(320,240), radius=keypointRadius, color=(0,0,0), thickness=3,lineType=cv2.LINE_AA)
+            detectFrame = cv2.circle(img=detectFrame, center=(320,240), radius=keypointRadius+1, color=(0,0,255), thickness=1,lineType=cv2.LINE_AA)
+        return(center, detectFrame, metrics)
+
+    ##### Nozzle detection
+    # Returns: (center, frame, metrics)
+    def nozzleDetection(self, frame, autoDetection=False):
+        # working frame object
+        nozzleDetectFrame = copy.deepcopy(frame)
+        # return value for keypoints
+        keypoints = None
+        center = (None, None)
+        # number of blobs found by the last detector pass
+        candidates = 0
+        # check which algorithm worked previously
+        if(self.algorithm is None):
+            preprocessorImage0 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=0)
+            preprocessorImage1 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=1)
+
+            # apply combo 1 (standard detector, preprocessor 0)
+            keypoints = self.detector.detect(preprocessorImage0)
+            keypointColor = (0,0,255)
+            detectionImage = preprocessorImage0
+            candidates = len(keypoints)
+            if(len(keypoints) != 1):
+                # apply combo 2 (standard detector, preprocessor 1)
+                keypoints = self.detector.detect(preprocessorImage1)
+                keypointColor = (0,255,0)
+                detectionImage = preprocessorImage1
+                candidates = len(keypoints)
+                if(len(keypoints) != 1):
+                    # apply combo 3 (standard detector, preprocessor 0)
+                    keypoints = self.relaxedDetector.detect(preprocessorImage0)
+                    keypointColor = (255,0,0)
+                    detectionImage = preprocessorImage0
+                    candidates = len(keypoints)
+                    if(len(keypoints) != 1):
+                        # apply combo 4 (standard detector, preprocessor 1)
+                        keypoints = self.relaxedDetector.detect(preprocessorImage1)
+                        keypointColor = (39,127,255)
+                        detectionImage = preprocessorImage1
+                        candidates = len(keypoints)
+                        if(len(keypoints) != 1):
+                            # failed to detect a nozzle, correct return value object
+                            keypoints = None
+                        else:
+                            self.algorithm = 4
+                    else:
+                        self.algorithm = 3
+                else:
+                    self.algorithm = 2
+            else:
+                self.algorithm = 1
+        elif(self.algorithm == 1):
+            preprocessorImage0 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=0)
+            keypoints = self.detector.detect(preprocessorImage0)
+            keypointColor = (0,0,255)
+            detectionImage = preprocessorImage0
+            candidates = len(keypoints)
+        elif(self.algorithm == 2):
+            preprocessorImage1 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=1)
+            keypoints = self.detector.detect(preprocessorImage1)
+            keypointColor = (0,255,0)
+            detectionImage = preprocessorImage1
+            candidates = len(keypoints)
+        elif(self.algorithm == 3):
+            preprocessorImage0 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=0)
+            keypoints = self.relaxedDetector.detect(preprocessorImage0)
+            keypointColor = (255,0,0)
+            detectionImage = preprocessorImage0
+            candidates = len(keypoints)
+        else:
+            preprocessorImage1 = self.preprocessImage(frameInput=nozzleDetectFrame, algorithm=1)
+            keypoints = self.relaxedDetector.detect(preprocessorImage1)
+            keypointColor = (39,127,255)
+            detectionImage = preprocessorImage1
+            candidates = len(keypoints)
+        metrics = {'algorithm': self.algorithm, 'candidates': candidates}
+        # process keypoint
+        if(keypoints is not None and len(keypoints) >= 1):
+            # create center object
+            (x,y) = np.around(keypoints[0].pt)
+            x,y = int(x), int(y)
+            center = (x,y)
+            # create radius object
+            keypointRadius = np.around(keypoints[0].size/2)
+            keypointRadius = int(keypointRadius)
+            # blob shape metrics
+            metrics['radius'] = float(np.around(keypoints[0].size/2, 1))
+            metrics['area'] = float(np.around(np.pi * (keypoints[0].size/2)**2, 1))
+            metrics['circularity'] = self.blobCircularity(detectionImage, keypoints[0])
+            if(self.drawOverlay):
+                circleFrame = cv2.circle(img=nozzleDetectFrame, center=center, radius=keypointRadius,color=keypointColor,thickness=-1,lineType=cv2.LINE_AA)
+                nozzleDetectFrame = cv2.addWeighted(circleFrame, 0.4, nozzleDetectFrame, 0.6, 0)
+                nozzleDetectFrame = cv2.circle(img=nozzleDetectFrame, center=center, radius=keypointRadius, color=(0,0,0), thickness=1,lineType=cv2.LINE_AA)
+                nozzleDetectFrame = cv2.line(nozzleDetectFrame, (x-5,y), (x+5, y), (255,255,255), 2)
+                nozzleDetectFrame = cv2.line(nozzleDetectFrame, (x,y-5), (x, y+5), (255,255,255), 2)
+        elif(autoDetection is True and self.drawOverlay):
+            # no keypoints, draw a 3 outline circle in the middle of the frame
+            keypointRadius = 17
+            nozzleDetectFrame = cv2.circle(img=nozzleDetectFrame, center=(320,240), radius=keypointRadius, color=(0,0,0), thickness=3,lineType=cv2.LINE_AA)
+            nozzleDetectFrame = cv2.circle(img=nozzleDetectFrame, center=(320,240), radius=keypointRadius+1, color=(0,0,255), thickness=1,lineType=cv2.LINE_AA)
+        if(autoDetection is True and self.drawOverlay):
+            # draw crosshair
+            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (320,0), (320,480), (0,0,0), 2)
+            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (0,240), (640,240), (0,0,0), 2)
+            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (320,0), (320,480), (255,255,255), 1)
+            nozzleDetectFrame = cv2.line(nozzleDetectFrame, (0,240), (640,240), (255,255,255), 1)
+        return(center, nozzleDetectFrame, metrics)
+
+    # manual nozzle alignment crosshair
+    def drawNozzleCrosshair(self, frame):
+        if(not self.drawOverlay):
+            return(frame)
+        keypointRadius = 17
+        width = 4
+        frame = self.dashedLine(image=frame, start=(320,0), end=(320, 240-keypointRadius), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
+        frame = self.dashedLine(image=frame, start=(320,240+keypointRadius), end=(320,480), color=(0,0,0), horizontal=False, lineWidth=2, segmentWidth=width)
+        frame = self.dashedLine(image=frame, start=(320,0), end=(320, 240-keypointRadius), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
+        frame = self.dashedLine(image=frame, start=(320,240+keypointRadius), end=(320,480), color=(255,255,255), horizontal=False, lineWidth=1, segmentWidth=width)
+
+        frame = self.dashedLine(image=frame, start=(0,240), end=(320-keypointRadius, 240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
+        frame = self.dashedLine(image=frame, start=(320+keypointRadius,240), end=(640,240), color=(0,0,0), horizontal=True, lineWidth=2, segmentWidth=width)
+        frame = self.dashedLine(image=frame, start=(0,240), end=(320-keypointRadius, 240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
+        frame = self.dashedLine(image=frame, start=(320+keypointRadius,240), end=(640,240), color=(255,255,255), horizontal=True, lineWidth=1, segmentWidth=width)
+
+        frame = self.dashedLine(image=frame, start=(320-keypointRadius,240), end=(320+keypointRadius, 240), color=(0,0,0), horizontal=True, lineWidth=1, segmentWidth=1)
+        frame = self.dashedLine(image=frame, start=(320,240-keypointRadius), end=(320, 240+keypointRadius), color=(0,0,0), horizontal=False, lineWidth=1, segmentWidth=1)
+
+        frame = cv2.circle(img=frame, center=(320,240), radius=keypointRadius, color=(0,0,0), thickness=3,lineType=cv2.LINE_AA)
+        frame = cv2.circle(img=frame, center=(320,240), radius=keypointRadius+1, color=(0,0,255), thickness=1,lineType=cv2.LINE_AA)
+        return(frame)
+
+    ##### Detection results
+    # build detection result object (UV coordinates + detection quality metrics)
+    def detectionResult(self, uv=None, metrics=None, samples=None, frameTime=0):
+        if(metrics is None):
+            metrics = {}
+        if(uv is not None and (uv[0] is None or uv[1] is None)):
+            uv = None
+        result = {
+            'uv': None,
+            'confidence': 0.0,
+            'radius': metrics.get('radius'),
+            'area': metrics.get('area'),
+            'circularity': metrics.get('circularity'),
+            'candidates': metrics.get('candidates', 0),
+            'algorithm': metrics.get('algorithm'),
+            'spread': None,
+            'samples': 0,
+            'frameTime': frameTime,
+            'frameAge': 0.0
+        }
+        if(uv is None):
+            return(result)
+        result['uv'] = [float(uv[0]), float(uv[1])]
+        result['samples'] = 1
+        # candidate uniqueness: a single blob is an unambiguous detection
+        if(result['candidates'] > 1):
+            uniqueness = 1.0/result['candidates']
+        else:
+            uniqueness = 1.0
+        # shape quality: how close the detected blob is to a circle
+        if(result['circularity'] is not None):
+            shape = min(max(float(result['circularity']), 0.0), 1.0)
+        else:
+            shape = 0.8
+        # detector weight: standard detectors are trusted more than relaxed ones
+        try:
+            algorithmWeight = self.algorithmWeights[result['algorithm']]
+        except KeyError: algorithmWeight = 0.7
+        # burst consistency: penalize detections that move around between frames
+        consistency = 1.0
+        if(samples is not None and len(samples) > 0):
+            samplesArray = np.array(samples, dtype=float)
+            spread = float(np.max(np.linalg.norm(samplesArray - samplesArray.mean(axis=0), axis=1)))
+            result['spread'] = float(np.around(spread, 2))
+            result['samples'] = len(samples)
+            consistency = 1.0/(1.0 + spread/2.0)
+        result['confidence'] = float(np.around(uniqueness * shape * algorithmWeight * consistency, 3))
+        return(result)
+
+    ##### Utilities
+    # circularity (4*pi*area/perimeter^2) of a contour, 1.0 for a perfect circle
+    def contourCircularity(self, contour):
+        perimeter = cv2.arcLength(contour, True)
+        if(perimeter <= 0):
+            return(None)
+        circularity = 4 * np.pi * cv2.contourArea(contour) / (perimeter**2)
+        return(float(np.around(min(circularity, 1.0), 3)))
+
+    # circularity of the blob found by SimpleBlobDetector, measured on the preprocessed image it was found in
+    def blobCircularity(self, image, keypoint):
+        try:
+            (x,y) = keypoint.pt
+            r = int(np.ceil(keypoint.size))
+            x0, y0 = max(int(x) - r, 0), max(int(y) - r, 0)
+            roi = image[y0:int(y) + r + 1, x0:int(x) + r + 1]
+            if(len(roi.shape) > 2):
+                roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+            # blobs are dark on a light background
+            thr_val, mask = cv2.threshold(roi, 127, 255, cv2.THRESH_BINARY_INV)
+            contours, hierarchy = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+            for contour in contours:
+                if(cv2.pointPolygonTest(contour, (float(x - x0), float(y - y0)), False) >= 0):
+                    return(self.contourCircularity(contour))
+        except Exception:
+            _logger.debug('Could not measure blob circularity.')
+        return(None)
+
+    def dashedLine(self, image, start, end, color=(255,255,255), segmentWidth=10, horizontal=True, lineWidth=1):
+        if(horizontal):
+            segments = int((end[0] - start[0])/segmentWidth)
+        else:
+            segments = int((end[1] - start[1])/segmentWidth)
+        for i in range(segments):
+            if(horizontal):
+                segmentStart = (start[0] + segmentWidth*i, start[1])
+                segmentEnd = (segmentStart[0]+segmentWidth, segmentStart[1])
+            else:
+                segmentStart = (start[0], start[1] + segmentWidth*i)
+                segmentEnd = (segmentStart[0], segmentStart[1]+segmentWidth)
+            if(i%2 == 0):
+                image = cv2.line( image, segmentStart, segmentEnd, color, lineWidth)
+        return(image)
+
+    # build a lookup table mapping the pixel values [0, 255] to
+    # their adjusted gamma values
+    def gammaLookupTable(self, gamma=1.2):
+        invGamma = 1.0 / gamma
+        table = np.array([((i / 255.0) ** invGamma) * 255
+            for i in np.arange(0, 256)]).astype( 'uint8' )
+        return(table)
+
+    # adjust image gamma
+    def adjust_gamma(self, image, gamma=None):
+        if(gamma is None or gamma == self.gamma):
+            table = self.gammaTable
+        else:
+            table = self.gammaLookupTable(gamma)
+        # apply gamma correction using the lookup table
+        return cv2.LUT(image, table)
+
+    # Image detection preprocessors
+    def preprocessImage(self, frameInput, algorithm=0):
+        try:
+            outputFrame = self.adjust_gamma(image=frameInput)
+        except: outputFrame = copy.deepcopy(frameInput)
+        if(algorithm == 0):
+            yuv = cv2.cvtColor(outputFrame, cv2.COLOR_BGR2YUV)
+            # newer OpenCV releases return a tuple of planes
+            yuvPlanes = list(cv2.split(yuv))
+            yuvPlanes[0] = cv2.GaussianBlur(yuvPlanes[0],(self.blurSize,self.blurSize),self.blurSigma)
+            yuvPlanes[0] = cv2.adaptiveThreshold(yuvPlanes[0],255,cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,self.adaptiveBlockSize,self.adaptiveC)
+            outputFrame = cv2.cvtColor(yuvPlanes[0],cv2.COLOR_GRAY2BGR)
+        elif(algorithm == 1):
+            outputFrame = cv2.cvtColor(outputFrame, cv2.COLOR_BGR2GRAY )
+            thr_val, outputFrame = cv2.threshold(outputFrame, 127, 255, cv2.THRESH_BINARY|cv2.THRESH_TRIANGLE )
+            outputFrame = cv2.GaussianBlur( outputFrame, (self.blurSize,self.blurSize), self.blurSigma )
+            outputFrame = cv2.cvtColor( outputFrame, cv2.COLOR_GRAY2BGR )
+        return(outputFrame)
@@ -0,0 +1,31 @@
+import logging
+# invoke parent (TAMV) _logger
+_logger = logging.getLogger('TAMV.PrinterDriver')
+
+# Helpers shared by every caller of a printer driver (GUI printer thread and headless engine).
+# They only use the driver interface, so they stay free of Qt and camera dependencies.
+
+# Write the offsets of several tools ({tool: {'X', 'Y', 'Z'}}) and optionally save them to firmware.
+# Drivers with setToolOffsetsBatch do this in a single request, others tool by tool.
+def applyToolOffsets(printer, offsets, save=True):
+    if(len(offsets) == 0):
+        if(save):
+            printer.saveOffsetsToFirmware()
+        return
+    if(hasattr(printer, 'setToolOffsetsBatch')):
+        printer.setToolOffsetsBatch(toolOffsets=offsets, save=save)
+        return
+    for (tool, toolOffset) in offsets.items():
+        printer.setToolOffsets(tool=tool, X=toolOffset['X'], Y=toolOffset['Y'])
+    if(save):
+        printer.saveOffsetsToFirmware()
+
+# Connect handshakes the drivers saved so far by reusing their controller sessions,
+# None for drivers that do not keep a session
+def sessionRequestsSaved(*printers):
+    requestsSaved = None
+    for printer in printers:
+        if(not hasattr(printer, 'getSessionStats')):
+            continue
+        requestsSaved = (requestsSaved or 0) + printer.getSessionStats()['requestsSaved']
+    return(requestsSaved)
@@ -3,9 +3,12 @@ import logging
 _logger = logging.getLogger('TAMV.PrinterManager')
 
 from PyQt5.QtCore import pyqtSlot, pyqtSignal, QObject, QTimer
-import sys, time
+import sys, time, asyncio
 import importlib, importlib.util
+from concurrent.futures import CancelledError
 import numpy as np
+from modules.PrinterDriver import applyToolOffsets, sessionRequestsSaved
+from modules.AsyncPrinter import AsyncPrinter
 
 #import debugpy
 #debugpy.debug_this_thread()
@@ -14,10 +17,22 @@ class PrinterManager(QObject):
     # class attributes
     __printerJSON = None
     __activePrinter = None
+    # asynchronous interface to the driver, __activePrinter is its ordered blocking view
+    __asyncPrinter = None
+    # maximum time for a tool change (in seconds)
+    __toolChangeTimeout = 120
     __status = None
     __homed = False
     __defaultSpeed = 3000
     __firmwareList = []
+    # offsets read from firmware when a tool was loaded
+    __loadedOffsets = {}
+    # offsets held back until the end of a run
+    __offsetsTransaction = None
+    # position dead-reckoned from the moves sent to the printer, None while unknown
+    __position = None
+    # largest difference between the tracked and the reported position before warning (mm)
+    __positionTolerance = 0.01
 
     # signals
     updateStatusbarSignal = pyqtSignal(object)
@@ -25,13 +40,16 @@ class PrinterManager(QObject):
     printerIdleSignal = pyqtSignal()
     printerHomedSignal = pyqtSignal()
     moveCompleteSignal = pyqtSignal()
-    toolLoadedSignal = pyqtSignal()
+    toolLoadedSignal = pyqtSignal(object)
     toolIndexSignal = pyqtSignal(int)
     activePrinterSignal = pyqtSignal(object)
     coordinatesSignal = pyqtSignal(object)
     offsetsSetSignal = pyqtSignal(object)
+    measureRequestSignal = pyqtSignal(object)
     firmwareSavedSignal = pyqtSignal()
     errorSignal = pyqtSignal(object)
+    # completed driver coroutines, handled on the Printer Manager thread
+    asyncResultSignal = pyqtSignal(object)
 
 
     # init function
@@ -64,6 +82,10 @@ class PrinterManager(QObject):
         try:
             self.__announce = kwargs['announcemode']
         except KeyError: self.__announce = True
+        self.asyncResultSignal.connect(self.asyncResult)
+        # jog clicks waiting to be sent, and whether they are scheduled to be processed
+        self.__jogQueue = []
+        self.__jogScheduled = False
 
         # send exiting to log
         _logger.debug('*** exiting PrinterManager.__init__')
@@ -95,6 +117,7 @@ class PrinterManager(QObject):
             self.disconnectPrinter()
         # parse input JSON
         self.__printerJSON = printer
+        self.__position = None
 
         # start connect process
         self.updateStatusbarSignal.emit('Attempting to connect to: ' + self.__printerJSON['nickname'] + ' (' + self.__printerJSON['controller']+ ')')
@@ -126,15 +149,21 @@ class PrinterManager(QObject):
             sys.modules[driverSelect[:-3]] = driverModule
             spec.loader.exec_module(driverModule)
             try:
-                self.__activePrinter = driverModule.printerAPI(baseURL=self.__printerJSON['address'],password=self.__printerJSON["password"])
+                driver = driverModule.printerAPI(baseURL=self.__printerJSON['address'],password=self.__printerJSON["password"])
+                # second driver instance for status and coordinate queries during commands, drivers are not thread-safe
+                queryDriver = driverModule.printerAPI(baseURL=self.__printerJSON['address'],password=self.__printerJSON["password"])
+                self.__asyncPrinter = AsyncPrinter(driver, queryPrinter=queryDriver)
+                self.__activePrinter = self.__asyncPrinter.ordered()
                 if(not self.__activePrinter.isHomed()):
                     # Machine has not been homed yet
                     errorMsg = 'Printer axis not homed. Rectify and reconnect.'
+                    self.closeAsyncPrinter()
                     self.errorSignal.emit(errorMsg)
                     return
                 if(not self.__activePrinter.isIdle()):
                     # connection failed for some reason
                     errorMsg = 'Device either did not respond or is not a supported controller type.'
+                    self.closeAsyncPrinter()
                     self.errorSignal.emit(errorMsg)
                     return
                 else:
@@ -154,6 +183,7 @@ class PrinterManager(QObject):
             except Exception as e:
                 # errorMsg = self.__printerJSON['nickname'] + ' (' + self.__printerJSON['controller']+ ')' + ' is offline.'
                 errorMsg = str(e)
+                self.closeAsyncPrinter()
                 self.errorSignal.emit(errorMsg)
                 return
         except Exception as e:
@@ -176,6 +206,10 @@ class PrinterManager(QObject):
         except KeyError: noUpdate = False
         # send calling to log
         _logger.debug('*** calling PrinterManager.disconnectPrinter')
+        self.__position = None
+        if(self.__asyncPrinter is not None):
+            # drop tool changes that have not started yet
+            self.__asyncPrinter.cancel()
         if(self.__activePrinter is not None):
             try:
                 try:
@@ -204,10 +238,19 @@ class PrinterManager(QObject):
                 _logger.exception(e)
                 self.errorSignal.emit(str(e))
                 return
+            finally:
+                self.closeAsyncPrinter()
 
         # send exiting to log
         _logger.debug('*** exiting PrinterManager.disconnectPrinter')
 
+    # stop the driver's event loop and workers, and drop the printer
+    def closeAsyncPrinter(self):
+        if(self.__asyncPrinter is not None):
+            self.__asyncPrinter.close()
+        self.__asyncPrinter = None
+        self.__activePrinter = None
+
     @pyqtSlot(bool)
     def setAnnounceMode(self, announceFlag=True):
         self.__announce = announceFlag
@@ -216,80 +259,55 @@ class PrinterManager(QObject):
     def complexMoveAbsolute(self, position=None, moveSpeed=None):
         # send calling to log
         _logger.debug('*** calling PrinterManager.complexMoveAbsolute')
-        if(position is None):
-            return
-        if(moveSpeed is None):
-            moveSpeed = self.__defaultSpeed
-        # form coorindates from parameter
-        try:
-            xPos = position['X']
-        except KeyError: xPos = None
-        try:
-            yPos = position['Y']
-        except KeyError: yPos = None
-        try:
-            zPos = position['Z']
-        except KeyError: zPos = None
-        try:
-            rotated = self.__printerJSON['rotated']
-        except KeyError: rotated=0
-        try:
-            if( rotated == 1):
-                # move Y -> X -> Z
-                if(yPos is not None): self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, Y=yPos)
-                if(xPos is not None): self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, X=xPos)
-                if(zPos is not None): self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, Z=zPos)
-            else:
-                # move X -> Y -> Z
-                if(xPos is not None): self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, X=xPos)
-                if(yPos is not None): self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, Y=yPos)
-                if(zPos is not None): self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, Z=zPos)
-        except:
-            errorMsg = 'Error performing printer moves.'
-            _logger.exception(errorMsg)
-            self.errorSignal.emit(errorMsg)
-            raise Exception(errorMsg)
+        self.complexMove(position=position, moveSpeed=moveSpeed, relative=False)
         # send exiting to log
         _logger.debug('*** exiting PrinterManager.complexMoveAbsolute')
 
     def complexMoveRelative(self, position=None, moveSpeed=None):
         # send calling to log
         _logger.debug('*** calling PrinterManager.complexMoveRelative')
+        self.complexMove(position=position, moveSpeed=moveSpeed, relative=True)
+        # send exiting to log
+        _logger.debug('*** exiting PrinterManager.complexMoveRelative')
+
+    # move one axis at a time: Y -> X -> Z on rotated machines, X -> Y -> Z otherwise
+    # drivers with moveSequence run the whole sequence in one request with a single wait
+    def complexMove(self, position=None, moveSpeed=None, relative=False):
         if(position is None):
             return
         if(moveSpeed is None):
             moveSpeed = self.__defaultSpeed
-        # form coorindates from parameter
-        try:
-            xPos = position['X']
-        except KeyError: xPos = None
-        try:
-            yPos = position['Y']
-        except KeyError: yPos = None
-        try:
-            zPos = position['Z']
-        except KeyError: zPos = None
         try:
             rotated = self.__printerJSON['rotated']
         except KeyError: rotated=0
+        if( rotated == 1):
+            axisOrder = ['Y', 'X', 'Z']
+        else:
+            axisOrder = ['X', 'Y', 'Z']
+        # form coorindates from parameter
+        moves = []
+        for axis in axisOrder:
+            try:
+                if(position[axis] is None or (relative and float(position[axis]) == 0)):
+                    continue
+                moves.append((axis, position[axis]))
+            except KeyError: pass
+        if(len(moves) == 0):
+            return
         try:
-            if( rotated == 1):
-                # move Y -> X -> Z
-                if(yPos is not None): self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, Y=yPos)
-                if(xPos is not None): self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, X=xPos)
-                if(zPos is not None): self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, Z=zPos)
+            if(hasattr(self.__activePrinter, 'moveSequence')):
+                self.__activePrinter.moveSequence(moves=moves, moveSpeed=moveSpeed, relative=relative)
             else:
-                # move X -> Y -> Z
-                if(xPos is not None): self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, X=xPos)
-                if(yPos is not None): self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, Y=yPos)
-                if(zPos is not None): self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, Z=zPos)
+                for (axis, axisPosition) in moves:
+                    if(relative):
+                        self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, **{axis: axisPosition})
+                    else:
+                        self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, **{axis: axisPosition})
         except:
             errorMsg = 'Error performing printer moves.'
             _logger.exception(errorMsg)
             self.errorSignal.emit(errorMsg)
             raise Exception(errorMsg)
-        # send exiting to log
-        _logger.debug('*** exiting PrinterManager.complexMoveRelative')
 
     @pyqtSlot(object)
     def moveRelative(self, params=None):
@@ -305,6 +323,11 @@ class PrinterManager(QObject):
         try:
             protected = params['protected']
         except KeyError: protected = False
+        # measure right after the move, without a round trip through the main thread
+        try:
+            measure = params['measure']
+            measure['times']['printer'] = time.time()
+        except KeyError: measure = None
 
         if(position is None):
             errorMsg = 'Move rel: Invalid position.'
@@ -326,8 +349,15 @@ class PrinterManager(QObject):
                 self.complexMoveRelative(moveSpeed=moveSpeed, position={'X':xPos, 'Y': yPos, 'Z': zPos})
             else:
                 self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, X=xPos, Y=yPos, Z=zPos)
-            self.moveCompleteSignal.emit()
+            self.trackMove(relative=True, X=xPos, Y=yPos, Z=zPos)
+            if(measure is not None):
+                measure['times']['moved'] = time.time()
+                measure['notBefore'] = measure['times']['moved']
+                self.measure(measure)
+            else:
+                self.moveCompleteSignal.emit()
         except:
+            self.__position = None
             errorMsg = 'Error: moveRelative cannot run.'
             _logger.exception(errorMsg)
             self.errorSignal.emit(errorMsg)
@@ -349,6 +379,11 @@ class PrinterManager(QObject):
         try:
             protected = params['protected']
         except KeyError: protected = False
+        # measure right after the move, without a round trip through the main thread
+        try:
+            measure = params['measure']
+            measure['times']['printer'] = time.time()
+        except KeyError: measure = None
 
         if(position is None):
             errorMsg = 'Move rel: Invalid position.'
@@ -372,8 +407,15 @@ class PrinterManager(QObject):
                 self.complexMoveAbsolute(moveSpeed=moveSpeed, position={'X':xPos, 'Y': yPos, 'Z': zPos})
             else:
                 self.__activePrinter.moveAbsolute(rapidMove=False, moveSpeed=moveSpeed, X=xPos, Y=yPos, Z=zPos)
-            self.moveCompleteSignal.emit()
+            self.trackMove(relative=False, X=xPos, Y=yPos, Z=zPos)
+            if(measure is not None):
+                measure['times']['moved'] = time.time()
+                measure['notBefore'] = measure['times']['moved']
+                self.measure(measure)
+            else:
+                self.moveCompleteSignal.emit()
         except:
+            self.__position = None
             errorMsg = 'Error: moveAbsolute cannot run.'
             _logger.exception(errorMsg)
             self.errorSignal.emit(errorMsg)
@@ -381,37 +423,270 @@ class PrinterManager(QObject):
         # send exiting to log
         _logger.debug('*** exiting PrinterManager.moveAbsolute')
 
+    # Position tracking
+    # moves only return once the printer is idle, so the commanded target is where the machine is
+    def trackMove(self, relative=False, X=None, Y=None, Z=None):
+        axes = {'X': X, 'Y': Y, 'Z': Z}
+        if(self.__position is None):
+            if(relative or None in axes.values()):
+                return
+            position = {}
+        else:
+            position = dict(self.__position)
+        for axis in axes:
+            if(axes[axis] is None):
+                continue
+            if(relative):
+                position[axis] = round(position[axis] + float(axes[axis]), 3)
+            else:
+                position[axis] = round(float(axes[axis]), 3)
+        self.__position = position
+
+    # read the position from the controller and compare it with the expected position
+    def checkpointPosition(self, expected=None):
+        return(self.compareCheckpoint(self.__activePrinter.getCoordinates(), expected=expected))
+
+    # same as checkpointPosition without blocking this thread: the read is queued behind the
+    # commands in progress (a tool change), and handler(position) runs on this thread once it is done
+    def requestCheckpoint(self, handler, expected=None):
+        if(expected is None):
+            expected = self.__position
+        def done(future):
+            try:
+                printerCoordinates = future.result()
+            except CancelledError:
+                return
+            except Exception as e:
+                errorMsg = 'Unable to read printer coordinates: ' + str(e)
+                _logger.error(errorMsg)
+                self.errorSignal.emit(errorMsg)
+                return
+            handler(self.compareCheckpoint(printerCoordinates, expected=expected))
+        self.dispatch(self.__asyncPrinter.call('getCoordinates'), done, cancellable=False)
+
+    def compareCheckpoint(self, printerCoordinates, expected=None):
+        if(expected is None):
+            expected = self.__position
+        if(expected is not None):
+            for axis in ['X', 'Y', 'Z']:
+                try:
+                    deviation = abs(float(printerCoordinates[axis]) - float(expected[axis]))
+                except (KeyError, TypeError):
+                    continue
+                if(deviation > self.__positionTolerance):
+                    _logger.warning('Tracked ' + axis + ' position is off by ' + str(np.around(deviation, 3)) + 'mm, using printer coordinates.')
+        self.__position = dict(printerCoordinates)
+        return(dict(printerCoordinates))
+
+    # Jogging
+    # Clicks that arrive while a move is in progress wait in the queue; consecutive clicks on the
+    # same axis are merged into one move when the queue is processed.
+    @pyqtSlot(object)
+    def jog(self, params=None):
+        self.__jogQueue.append(params)
+        if(not self.__jogScheduled):
+            self.__jogScheduled = True
+            QTimer.singleShot(0, self.processJogs)
+
+    def processJogs(self):
+        self.__jogScheduled = False
+        jogs = self.__jogQueue
+        self.__jogQueue = []
+        moveSpeed = self.__defaultSpeed
+        # [axis, distance, clicks]
+        runs = []
+        for params in jogs:
+            try:
+                moveSpeed = params['moveSpeed']
+            except KeyError: pass
+            try:
+                position = params['position']
+            except KeyError: continue
+            for axis in position:
+                if(len(runs) > 0 and runs[-1][0] == axis):
+                    runs[-1][1] += float(position[axis])
+                    runs[-1][2] += 1
+                else:
+                    runs.append([axis, float(position[axis]), 1])
+        moves = []
+        for (axis, distance, clicks) in runs:
+            if(round(distance, 3) != 0):
+                moves.append((axis, round(distance, 3)))
+        try:
+            if(len(moves) > 0):
+                if(hasattr(self.__activePrinter, 'moveSequence')):
+                    self.__activePrinter.moveSequence(moves=moves, moveSpeed=moveSpeed, relative=True)
+                else:
+                    for (axis, distance) in moves:
+                        self.__activePrinter.moveRelative(rapidMove=False, moveSpeed=moveSpeed, **{axis: distance})
+                for (axis, distance) in moves:
+                    self.trackMove(relative=True, **{axis: distance})
+            self.moveCompleteSignal.emit()
+            # reported after the move so the GUI's "Ready." status does not hide it
+            if(len(jogs) > 1):
+                jogMsg = 'Merged ' + str(len(jogs)) + ' jog clicks into ' + str(len(moves)) + ' move(s).'
+                _logger.debug(jogMsg)
+                self.updateStatusbarSignal.emit(jogMsg)
+        except:
+            self.__position = None
+            errorMsg = 'Error: jog cannot run.'
+            _logger.exception(errorMsg)
+            self.errorSignal.emit(errorMsg)
+
     @pyqtSlot()
     def getCoordinates(self):
-        printerCoordinates = self.__activePrinter.getCoordinates()
-        self.coordinatesSignal.emit(printerCoordinates)
+        if(self.__position is None):
+            self.requestCheckpoint(self.coordinatesSignal.emit)
+        else:
+            self.coordinatesSignal.emit(dict(self.__position))
+
+    # Measurement transaction: the position is added to the request, which then goes straight
+    # to the Detection Manager to be completed with a detection from a frame captured after it
+    @pyqtSlot(object)
+    def measure(self, request=None):
+        try:
+            request['times'].setdefault('printer', time.time())
+            request.setdefault('notBefore', request['times']['requested'])
+        except Exception as e:
+            _logger.error('Measurement failed: ' + str(e))
+            self.errorSignal.emit(str(e))
+            return
+        if(self.__position is None):
+            self.requestCheckpoint(lambda position: self.sendMeasurement(request, position))
+        else:
+            self.sendMeasurement(request, dict(self.__position))
+
+    def sendMeasurement(self, request, position):
+        request['position'] = position
+        request['times']['position'] = time.time()
+        self.measureRequestSignal.emit(request)
+
+    @pyqtSlot()
+    def verifyCoordinates(self):
+        self.requestCheckpoint(self.coordinatesSignal.emit)
 
     @pyqtSlot()
     def saveOffsets(self):
-        self.__activePrinter.saveOffsetsToFirmware()
+        transaction = self.__offsetsTransaction
+        self.__offsetsTransaction = None
+        try:
+            if(transaction is not None and transaction['deferred']):
+                # single batched write and save for the whole toolset
+                _logger.debug('saveOffsets: applying offsets for ' + str(len(transaction['offsets'])) + ' tools')
+                applyToolOffsets(self.__activePrinter, transaction['offsets'], save=True)
+            else:
+                self.__activePrinter.saveOffsetsToFirmware()
+            if(transaction is not None and transaction['requestsSaved'] is not None):
+                requestsSaved = sessionRequestsSaved(*self.__asyncPrinter.drivers) - transaction['requestsSaved']
+                _logger.info('Session reuse saved ' + str(requestsSaved) + ' connect requests this run.')
+        except Exception as e:
+            self.errorSignal.emit(str(e))
+            _logger.error('Unable to save offsets to firmware')
+            _logger.exception(e)
+
+    @pyqtSlot(object)
+    def beginOffsetsTransaction(self, params=None):
+        try:
+            deferred = bool(params['deferred'])
+        except (KeyError, TypeError):
+            deferred = False
+        self.__offsetsTransaction = {'deferred': deferred, 'offsets': {}, 'requestsSaved': sessionRequestsSaved(*self.__asyncPrinter.drivers)}
+
+    @pyqtSlot()
+    def abortOffsetsTransaction(self):
+        if(self.__offsetsTransaction is not None and len(self.__offsetsTransaction['offsets']) > 0):
+            _logger.info('Discarding offsets for ' + str(len(self.__offsetsTransaction['offsets'])) + ' tools.')
+        self.__offsetsTransaction = None
         
     # Tools
     @pyqtSlot()
     def currentTool(self):
-        loadedToolIndex = self.__activePrinter.getCurrentTool()
-        self.toolIndexSignal.emit(int(loadedToolIndex))
+        # queued behind a tool change in progress, without blocking this thread
+        def done(future):
+            try:
+                loadedToolIndex = future.result()
+            except CancelledError:
+                return
+            except Exception as e:
+                _logger.error('Unable to read current tool: ' + str(e))
+                self.errorSignal.emit(str(e))
+                return
+            self.toolIndexSignal.emit(int(loadedToolIndex))
+        self.dispatch(self.__asyncPrinter.call('getCurrentTool'), done, cancellable=False)
     
+    # Tool changes run asynchronously: this thread keeps answering coordinate queries and halt
+    # requests, and printer status changes are reported while the tool change is in progress.
     @pyqtSlot(int)
-    def callTool(self, toolNumber=-1):
+    # after: future of a command that has to succeed before the tool changes
+    def callTool(self, toolNumber=-1, after=None):
         toolNumber = int(toolNumber)
-        try:
-            if(toolNumber > -1):
-                self.__activePrinter.loadTool(toolNumber)
-            else:
-                self.__activePrinter.unloadTools()
-        except:
-            raise Exception('PrinterManager: Unable to load tool: ' + str(toolNumber))
-        self.toolLoadedSignal.emit()
+        # tool change macros move the machine
+        self.__position = None
+        self.__loadedOffsets = {}
+        self.dispatch(self.changeTool(toolNumber, after=after), self.toolChanged)
 
     @pyqtSlot()
     def unloadTools(self):
-        self.__activePrinter.unloadTools()
-        self.toolLoadedSignal.emit()
+        # halt: tool changes that have not completed are dropped, the unload follows them
+        if(self.__asyncPrinter.cancel() > 0):
+            _logger.debug('Cancelled pending tool change.')
+        self.callTool(-1)
+
+    async def changeTool(self, toolNumber, after=None):
+        printer = self.__asyncPrinter
+        if(after is not None):
+            try:
+                await asyncio.wrap_future(after)
+            except Exception:
+                # the failure is reported by the handler of that command
+                raise asyncio.CancelledError()
+        if(toolNumber > -1):
+            message = 'Loading T' + str(toolNumber)
+            toolChange = printer.loadTool(toolNumber, timeout=self.__toolChangeTimeout)
+        else:
+            message = 'Unloading tools'
+            toolChange = printer.unloadTools(timeout=self.__toolChangeTimeout)
+        def status(printerStatus):
+            self.updateStatusbarSignal.emit(message + ' (' + str(printerStatus) + ')..')
+        await printer.withStatus(toolChange, status)
+        # current firmware offsets, used to predict where the nozzle will be
+        params = {'tool': toolNumber, 'offsets': None}
+        if(toolNumber > -1):
+            try:
+                params['offsets'] = await printer.getToolOffset(toolNumber)
+            except Exception as e:
+                _logger.warning('Unable to read offsets for T' + str(toolNumber) + ': ' + str(e))
+        return(params)
+
+    def toolChanged(self, future):
+        try:
+            params = future.result()
+        except CancelledError:
+            return
+        except asyncio.TimeoutError:
+            errorMsg = 'Tool change timed out.'
+            _logger.error(errorMsg)
+            self.errorSignal.emit(errorMsg)
+            return
+        except Exception as e:
+            errorMsg = 'PrinterManager: Unable to change tool: ' + str(e)
+            _logger.error(errorMsg)
+            self.errorSignal.emit(errorMsg)
+            return
+        if(params['offsets'] is not None):
+            self.__loadedOffsets = {params['tool']: params['offsets']}
+        self.toolLoadedSignal.emit(params)
+
+    # run a driver coroutine, handler(future) is called on this thread once it is done
+    # cancellable=False: a halt does not drop it (reads that a caller is waiting for)
+    def dispatch(self, coroutine, handler, cancellable=True):
+        def done(future):
+            self.asyncResultSignal.emit({'handler': handler, 'future': future})
+        return(self.__asyncPrinter.submit(coroutine, callback=done, cancellable=cancellable))
+
+    @pyqtSlot(object)
+    def asyncResult(self, result):
+        result['handler'](result['future'])
 
     @pyqtSlot(object)
     def calibrationSetOffset(self, params=None):
@@ -438,6 +713,10 @@ class PrinterManager(QObject):
         try:
             __continue = params['continue']
         except: __continue = True
+        # next tool of the run, loaded as soon as these offsets are written
+        try:
+            nextTool = params['nextTool']
+        except KeyError: nextTool = None
 
         if(toolIndex < 0 or toolIndex is None):
             errorMsg = 'Invalid tool selected for offsets.'
@@ -461,13 +740,18 @@ class PrinterManager(QObject):
             self.offsetsSetSignal.emit(params)
             return
         try:
-            toolOffsets = self.__activePrinter.getToolOffset(toolIndex)
+            # checkpoint: offsets are computed from the position reported by the controller
+            position = self.checkpointPosition(expected=position)
+            # reuse the offsets read when the tool was loaded, they have not changed since
+            try:
+                toolOffsets = self.__loadedOffsets[toolIndex]
+            except KeyError:
+                toolOffsets = self.__activePrinter.getToolOffset(toolIndex)
             _logger.debug('calibrationSetOffset: Setting offsets for tool: ' + str(toolIndex))
             finalOffsets = {}
             finalOffsets['X'] = np.around(cpCoordinates['X'] + toolOffsets['X'] - position['X'],3)
             finalOffsets['Y'] = np.around(cpCoordinates['Y'] + toolOffsets['Y'] - position['Y'],3)
             finalOffsets['Z'] = np.around(toolOffsets['Z'],3)
-            self.__activePrinter.setToolOffsets(tool=toolIndex, X=finalOffsets['X'], Y=finalOffsets['Y'])
             _logger.debug('X: ' + str(finalOffsets['X']) + ' Y:' + str(finalOffsets['Y']) + ' Z:' + str(finalOffsets['X']))
         except Exception as e:
             self.errorSignal.emit(str(e))
@@ -477,4 +761,29 @@ class PrinterManager(QObject):
             self.offsetsSetSignal.emit(params)
             return
         params = {'offsets': finalOffsets, 'continue': __continue}
-        self.offsetsSetSignal.emit(params)
\ No newline at end of file
+        offsetsWrite = None
+        if(self.__offsetsTransaction is not None and self.__offsetsTransaction['deferred']):
+            self.__offsetsTransaction['offsets'][toolIndex] = finalOffsets
+            self.offsetsSetSignal.emit(params)
+        else:
+            # G10 P<n> names its tool, so it only has to reach the command queue before the next tool change
+            self.__loadedOffsets = {}
+            def offsetsWritten(future):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.errorSignal.emit(str(e))
+                    _logger.error('Unable to write offsets for T' + str(toolIndex) + ': ' + str(e))
+                    self.offsetsSetSignal.emit({'offsets': None})
+                    return
+                self.offsetsSetSignal.emit(params)
+            offsetsWrite = self.dispatch(self.__asyncPrinter.call('setToolOffsets', tool=toolIndex, X=finalOffsets['X'], Y=finalOffsets['Y']), offsetsWritten, cancellable=False)
+        if(nextTool is not None):
+            self.queueToolChange(nextTool, after=offsetsWrite)
+
+    # Tool changes scheduled behind an offsets write: queued on the ordered command queue right
+    # behind the G10, so the park/pick motion starts while the main thread handles the offsets.
+    # The tool is not changed if the G10 fails. A halt in the meantime is handled by the unload that follows.
+    def queueToolChange(self, toolNumber, after=None):
+        _logger.debug('Starting queued tool change to T' + str(toolNumber))
+        self.callTool(toolNumber, after=after)
\ No newline at end of file
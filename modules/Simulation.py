@@ -0,0 +1,308 @@
+import logging
+# invoke parent (TAMV) _logger
+_logger = logging.getLogger('TAMV.Simulation')
+
+import cv2
+import numpy as np
+
+# Synthetic camera frames with known ground truth, used by the benchmark and headless tools.
+# Frames are BGR uint8 arrays, like the frames delivered by the camera process.
+
+# render a nozzle seen from below: dark disc on a lighter, optionally noisy background
+def renderNozzleFrame(u=320, v=240, radius=14, width=640, height=480, background=200, foreground=20, noise=0, blur=0, gradient=0, seed=0):
+    generator = np.random.default_rng(seed)
+    frame = np.full((height, width), background, np.float32)
+    # horizontal illumination gradient
+    if(gradient != 0):
+        frame += np.linspace(-gradient/2, gradient/2, width, dtype=np.float32)[np.newaxis, :]
+    # draw the nozzle with sub-pixel accuracy
+    shift = 4
+    center = (int(round(u*(1 << shift))), int(round(v*(1 << shift))))
+    cv2.circle(frame, center, int(round(radius*(1 << shift))), float(foreground), -1, lineType=cv2.LINE_AA, shift=shift)
+    if(blur > 0):
+        kernel = int(blur)*2 + 1
+        frame = cv2.GaussianBlur(frame, (kernel, kernel), blur)
+    if(noise > 0):
+        frame += generator.normal(0, noise, frame.shape).astype(np.float32)
+    frame = np.clip(frame, 0, 255).astype(np.uint8)
+    return(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+
+# render an endstop seen from above: thin dark ring on a lighter background
+def renderEndstopFrame(u=320, v=240, radius=137, width=640, height=480, background=170, foreground=40, thickness=8, noise=0, seed=0):
+    generator = np.random.default_rng(seed)
+    frame = np.full((height, width), background, np.float32)
+    shift = 4
+    center = (int(round(u*(1 << shift))), int(round(v*(1 << shift))))
+    cv2.circle(frame, center, int(round(radius*(1 << shift))), float(foreground), thickness, lineType=cv2.LINE_AA, shift=shift)
+    if(noise > 0):
+        frame += generator.normal(0, noise, frame.shape).astype(np.float32)
+    frame = np.clip(frame, 0, 255).astype(np.uint8)
+    return(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+
+# Golden dataset: labelled synthetic frames covering every nozzle detector/preprocessor combination,
+# low-light frames (gamma correction) and endstop contour detection.
+# Returns a list of {'name', 'type', 'frame', 'uv', 'algorithm'} dictionaries, where 'algorithm' is the
+# detection path expected to find the target. Rendering is deterministic.
+def goldenDataset():
+    cases = []
+    # nozzle: (name, render settings, expected algorithm, positions)
+    nozzleSets = [
+        # standard detector, preprocessor 0
+        ('nozzle-standard', {'radius': 14, 'noise': 4}, 1, [(320, 240), (301.5, 262.25), (355.75, 214.5), (270, 290)]),
+        # standard detector, preprocessor 1
+        ('nozzle-triangle', {'radius': 16, 'noise': 4}, 2, [(320, 240), (296.5, 233.25), (341.75, 251.5)]),
+        # relaxed detector, preprocessor 0
+        ('nozzle-relaxed', {'radius': 18, 'blur': 4}, 3, [(320, 240), (308.25, 226.5), (334.5, 255.75)]),
+        # relaxed detector, preprocessor 1
+        ('nozzle-large', {'radius': 28}, 4, [(320, 240), (288.5, 251.5), (340.25, 228.75)]),
+        # soft focus and uneven illumination
+        ('nozzle-blur', {'radius': 14, 'noise': 6, 'blur': 2, 'gradient': 60}, 1, [(318.5, 244.5), (330, 236)]),
+        # low light, relies on gamma correction
+        ('nozzle-dark', {'radius': 14, 'noise': 3, 'background': 90, 'foreground': 10}, 1, [(322, 238), (312.25, 247.75)])
+    ]
+    seed = 0
+    for (name, settings, algorithm, positions) in nozzleSets:
+        for (index, (u, v)) in enumerate(positions):
+            seed += 1
+            cases.append({'name': name + '-' + str(index), 'type': 'nozzle', 'uv': (u, v), 'algorithm': algorithm,
+                'frame': renderNozzleFrame(u=u, v=v, seed=seed, **settings)})
+    # endstop frames
+    for (index, (u, v)) in enumerate([(320, 240), (330.5, 231.5), (305.25, 252.75)]):
+        seed += 1
+        cases.append({'name': 'endstop-' + str(index), 'type': 'endstop', 'uv': (u, v), 'algorithm': 0,
+            'frame': renderEndstopFrame(u=u, v=v, radius=137, noise=3, seed=seed)})
+    return(cases)
+
+# Simulated printer: implements the printer driver calls used for tool alignment, with a simulated clock.
+# Each tool carries a true nozzle displacement (mm) that the alignment has to find; tool -1 is the bare
+# carriage, whose endstop sits at endstopOffset.
+class SimulatedPrinter:
+    # class attributes
+    # time spent on a move request and on a tool change, in seconds
+    moveOverhead = 0.05
+    toolChangeTime = 5.0
+    acceleration = 1000
+
+    def __init__(self, position=None, nozzleOffsets=None, toolOffsets=None, endstopOffset=(0, 0)):
+        if(position is None):
+            position = {'X': 150.0, 'Y': 100.0, 'Z': 0.0}
+        self.position = dict(position)
+        if(nozzleOffsets is None):
+            nozzleOffsets = {0: (0, 0)}
+        self.nozzleOffsets = nozzleOffsets
+        self.toolOffsets = {}
+        for toolIndex in nozzleOffsets:
+            try:
+                self.toolOffsets[toolIndex] = dict(toolOffsets[toolIndex])
+            except (KeyError, TypeError):
+                self.toolOffsets[toolIndex] = {'X': 0.0, 'Y': 0.0, 'Z': 0.0}
+        self.endstopOffset = endstopOffset
+        self.currentTool = -1
+        self.time = 0.0
+        self.moves = 0
+        self.requests = 0
+        self.saved = 0
+
+    def clock(self):
+        return(self.time)
+
+    # position of the target seen by the camera: the loaded nozzle, or the endstop
+    def targetPosition(self):
+        if(self.currentTool > -1):
+            (dx, dy) = self.nozzleOffsets[self.currentTool]
+        else:
+            (dx, dy) = self.endstopOffset
+        return(self.position['X'] + dx, self.position['Y'] + dy)
+
+    # trapezoidal move time estimate
+    def travel(self, distance, moveSpeed, overhead=True):
+        speed = max(moveSpeed, 1)/60
+        rampDistance = speed**2/self.acceleration
+        if(distance < rampDistance):
+            moveTime = 2*np.sqrt(distance/self.acceleration)
+        else:
+            moveTime = distance/speed + speed/self.acceleration
+        self.time += moveTime
+        if(overhead):
+            self.time += self.moveOverhead
+        self.moves += 1
+
+    def isHomed(self):
+        return(True)
+
+    def isIdle(self):
+        return(True)
+
+    def getCoordinates(self):
+        self.requests += 1
+        return(dict(self.position))
+
+    def getCurrentTool(self):
+        return(self.currentTool)
+
+    def moveRelative(self, rapidMove=False, moveSpeed=1000, X=None, Y=None, Z=None):
+        self.requests += 1
+        distance = 0
+        for (axis, value) in (('X', X), ('Y', Y), ('Z', Z)):
+            if(value is not None):
+                self.position[axis] += float(value)
+                distance += float(value)**2
+        self.travel(np.sqrt(distance), moveSpeed)
+
+    def moveAbsolute(self, rapidMove=False, moveSpeed=1000, X=None, Y=None, Z=None):
+        self.requests += 1
+        distance = 0
+        for (axis, value) in (('X', X), ('Y', Y), ('Z', Z)):
+            if(value is not None):
+                distance += (float(value) - self.position[axis])**2
+                self.position[axis] = float(value)
+        self.travel(np.sqrt(distance), moveSpeed)
+
+    # one request and one idle wait for the whole sequence, the axes move one after the other
+    def moveSequence(self, moves=None, moveSpeed=1000, relative=False, rapidMove=False):
+        self.requests += 1
+        for (index, (axis, value)) in enumerate(moves):
+            if(relative):
+                distance = abs(float(value))
+                self.position[axis] += float(value)
+            else:
+                distance = abs(float(value) - self.position[axis])
+                self.position[axis] = float(value)
+            self.travel(distance, moveSpeed, overhead=(index == 0))
+
+    def loadTool(self, toolIndex=0):
+        self.requests += 1
+        if(self.currentTool != toolIndex):
+            self.currentTool = toolIndex
+            self.time += self.toolChangeTime
+
+    def unloadTools(self):
+        self.requests += 1
+        if(self.currentTool != -1):
+            self.currentTool = -1
+            self.time += self.toolChangeTime
+
+    def getToolOffset(self, toolIndex=0):
+        self.requests += 1
+        return(dict(self.toolOffsets[toolIndex]))
+
+    def setToolOffsets(self, tool=None, X=None, Y=None, Z=None):
+        self.requests += 1
+        if(X is not None): self.toolOffsets[tool]['X'] = float(X)
+        if(Y is not None): self.toolOffsets[tool]['Y'] = float(Y)
+        if(Z is not None): self.toolOffsets[tool]['Z'] = float(Z)
+
+    # all offsets, and the save, in one request
+    def setToolOffsetsBatch(self, toolOffsets=None, save=False):
+        self.requests += 1
+        for (tool, offsets) in toolOffsets.items():
+            for (axis, value) in offsets.items():
+                if(value is not None): self.toolOffsets[tool][axis] = float(value)
+        if(save):
+            self.saved += 1
+
+    def saveOffsetsToFirmware(self):
+        self.requests += 1
+        self.saved += 1
+
+    def flushMovementBuffer(self):
+        return
+
+# Simulated camera looking up at the printer: maps the printer target position to pixels through a
+# rotated, scaled and slightly distorted projection, with optional detection noise.
+# project()/measure() are the fast path (no rendering); read() renders a frame for the real detectors.
+class SimulatedCamera:
+    # time to deliver one frame, in seconds
+    framePeriod = 1/30
+
+    # distance (pixels) of spurious detections from the target
+    outlierDistance = (8, 30)
+
+    def __init__(self, printer, width=640, height=480, mpp=0.01, rotation=0, center=(150.0, 100.0), distortion=0, noise=0, outliers=0, seed=0):
+        self.printer = printer
+        self.width = width
+        self.height = height
+        self.mpp = mpp
+        theta = np.radians(rotation)
+        self.rotation = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+        self.center = np.array(center, dtype=float)
+        self.distortion = distortion
+        self.noise = noise
+        # probability of a spurious detection (reflection, partly visible nozzle)
+        self.outliers = outliers
+        self.generator = np.random.default_rng(seed)
+
+    # pixel coordinates of the current target
+    def project(self):
+        offset = self.rotation @ (np.array(self.printer.targetPosition()) - self.center) / self.mpp
+        # radial lens distortion, relative to the image half-width
+        radius = np.linalg.norm(offset)/(self.width/2)
+        offset = offset*(1 + self.distortion*radius**2)
+        return(self.width/2 + offset[0], self.height/2 + offset[1])
+
+    # error (mm) between the target and the camera center
+    def centerError(self):
+        return(float(np.linalg.norm(np.array(self.printer.targetPosition()) - self.center)))
+
+    # detected UV without rendering, None when the target is out of view
+    def measure(self):
+        self.printer.time += self.framePeriod
+        (u, v) = self.project()
+        if(u < 0 or v < 0 or u >= self.width or v >= self.height):
+            return(None)
+        if(self.noise > 0):
+            u += self.generator.normal(0, self.noise)
+            v += self.generator.normal(0, self.noise)
+        if(self.outliers > 0 and self.generator.random() < self.outliers):
+            angle = self.generator.uniform(0, 2*np.pi)
+            distance = self.generator.uniform(*self.outlierDistance)
+            u += distance*np.cos(angle)
+            v += distance*np.sin(angle)
+        # burst detections are rounded to whole pixels
+        return([float(np.around(u)), float(np.around(v))])
+
+    def read(self, flush=False):
+        self.printer.time += self.framePeriod
+        (u, v) = self.project()
+        seed = int(self.generator.integers(1 << 30))
+        if(self.printer.currentTool > -1):
+            return(renderNozzleFrame(u=u, v=v, width=self.width, height=self.height, noise=2, seed=seed))
+        return(renderEndstopFrame(u=u, v=v, width=self.width, height=self.height, noise=2, seed=seed))
+
+    def release(self):
+        return
+
+# Drive a calibration engine against a simulated printer and camera on the fast (non-rendering) path.
+# Returns the final event with the simulated time, move count, the residual centre error in mm and the
+# camera calibration event, if the cycle calibrated the camera.
+def runSimulatedCycle(engine, printer, camera, endstop=False):
+    startTime = printer.time
+    startMoves = printer.moves
+    commands = engine.start(endstop=endstop, timestamp=printer.time)
+    result = None
+    calibration = None
+    rejected = 0
+    measurements = 0
+    while(True):
+        for command in commands:
+            if(command['type'] == 'moveRelative'):
+                printer.moveRelative(moveSpeed=command['moveSpeed'], **command['position'])
+            elif(command['type'] == 'moveAbsolute'):
+                printer.moveAbsolute(moveSpeed=command['moveSpeed'], **command['position'])
+            elif(command['event'] == 'cameraCalibrated'):
+                calibration = command
+            elif(command['event'] == 'calibrationRejected'):
+                rejected += 1
+            elif(command['event'] in ('aligned', 'failed')):
+                result = dict(command)
+        if(not engine.active):
+            break
+        measurements += 1
+        commands = engine.update(camera.measure(), printer.getCoordinates(), printer.time)
+    result['simulatedTime'] = printer.time - startTime
+    result['printerMoves'] = printer.moves - startMoves
+    result['measurements'] = measurements
+    result['error'] = camera.centerError()
+    result['calibration'] = calibration
+    result['calibrationRejected'] = rejected
+    return(result)